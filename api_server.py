@@ -0,0 +1,564 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import backend
+
+# HTTP/JSON API over backend.py for other systems (ERP, barcode scanners).
+# asyncio owns the sockets; every backend call runs on a bounded thread pool,
+# and read endpoints run inside backend.read_only() so they use read-only
+# connections. HTTP/1.1 with keep-alive, JSON bodies, no authentication:
+# bind it to localhost or a trusted network.
+#
+#   python api_server.py serve --port 8765 --workers 8 --write-queue
+#   python api_server.py load --spawn --concurrency 32 --duration 10
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 8
+QUEUED_PER_WORKER = 4       # requests handed to the pool per worker; the rest wait in the event loop
+MAX_HEADER = 64 * 1024
+MAX_BODY = 16 * 1024 * 1024
+ALLOCATION_METHODS = ('auto', 'milp', 'greedy')
+MAX_TIME_LIMIT = 60         # seconds a /allocation request may keep a worker busy
+
+STATUS_TEXT = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               409: 'Conflict', 413: 'Payload Too Large', 431: 'Request Header Fields Too Large',
+               500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Routes: (method, path regex, handler, read, status). Path parameters are
+# integers passed to the handler by name; handlers take (query, body).
+ROUTES = []
+
+
+def route(method, path, read=None, status=200):
+    # `read` defaults to True for GET: those handlers run on read-only connections
+    pattern = re.compile('^' + re.sub(r'\{(\w+)\}', r'(?P<\1>\\d+)', path) + '$')
+
+    def register(handler):
+        ROUTES.append((method, pattern, handler, method == 'GET' if read is None else read, status))
+        return handler
+    return register
+
+
+def _query_int(query, name, default=None):
+    value = query.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer")
+
+
+def _field(body, name, kind=int, default=...):
+    value = body.get(name, default)
+    if value is ...:
+        raise ValueError(f"'{name}' is required")
+    if kind is int and (isinstance(value, bool) or not isinstance(value, int)):
+        raise ValueError(f"'{name}' must be an integer")
+    if kind is float and (isinstance(value, bool) or not isinstance(value, (int, float))):
+        raise ValueError(f"'{name}' must be a number")
+    if kind is list and not isinstance(value, list):
+        raise ValueError(f"'{name}' must be a list")
+    if kind is str and not isinstance(value, str):
+        raise ValueError(f"'{name}' must be a string")
+    return value
+
+
+def _items(body, name, *fields, default=...):
+    # List of objects -> list of tuples of their integer `fields`
+    items = _field(body, name, list, default)
+    rows = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError(f"'{name}' must be a list of objects")
+        rows.append(tuple(_field(item, field) for field in fields))
+    return rows
+
+
+def _records(rows, *columns):
+    return [dict(zip(columns, row)) for row in rows]
+
+
+@route('GET', '/health')
+def health(query, body):
+    return {'status': 'ok', 'schema_version': backend.schema_version(),
+            'write_queue': backend.write_queue_enabled(), 'data_version': backend.data_version()}
+
+
+# Materials
+@route('GET', '/inventory')
+def inventory(query, body):
+    # ?format=columns returns {column: [values]} instead of one object per material
+    if query.get('format') == 'columns':
+        return backend.get_inventory(result='columns')
+    return _records(backend.get_inventory(), 'id', 'name', 'quantity')
+
+
+@route('GET', '/inventory/at')
+def inventory_at(query, body):
+    if not query.get('at'):
+        raise ValueError("'at' is required")
+    return _records(backend.get_inventory_at(query['at']), 'id', 'name', 'quantity')
+
+
+@route('GET', '/materials/search')
+def search_materials(query, body):
+    return _records(backend.search_materials(query.get('q', ''), _query_int(query, 'limit', backend.SEARCH_LIMIT)),
+                    'id', 'name', 'quantity')
+
+
+@route('GET', '/materials/{material_id}/stock')
+def material_stock(query, body, material_id):
+    # Current stock unless ?at is given
+    at = query.get('at') or None
+    return {'material_id': material_id, 'at': at, 'quantity': backend.get_stock_at(material_id, at)}
+
+
+@route('POST', '/materials', status=201)
+def add_material(query, body):
+    backend.add_material(_field(body, 'name', str), _field(body, 'quantity'))
+    return {'created': True}
+
+
+@route('POST', '/materials/{material_id}/adjust')
+def adjust_material(query, body, material_id):
+    # Adds `quantity` (negative to remove) to the stock
+    filled = backend.update_material(material_id, _field(body, 'quantity'))
+    return {'filled_backorders': _records(filled.items(), 'backorder_id', 'order_id')}
+
+
+@route('POST', '/materials/receipts')
+def receive_stock(query, body):
+    # Bulk: {"receipts": [{"material_id", "quantity"}]}, all or nothing
+    filled = backend.receive_stock(_items(body, 'receipts', 'material_id', 'quantity'))
+    return {'filled_backorders': _records(filled.items(), 'backorder_id', 'order_id')}
+
+
+@route('DELETE', '/materials/{material_id}')
+def delete_material(query, body, material_id):
+    backend.delete_material(material_id)
+    return {'deleted': True}
+
+
+# Products and BOMs
+@route('GET', '/products')
+def products(query, body):
+    return _records(backend.get_products(_query_int(query, 'limit'), _query_int(query, 'after')), 'id', 'name')
+
+
+@route('GET', '/products/search')
+def search_products(query, body):
+    return _records(backend.search_products(query.get('q', ''), _query_int(query, 'limit', backend.SEARCH_LIMIT)),
+                    'id', 'name')
+
+
+@route('GET', '/products/buildable')
+def buildable(query, body):
+    return _records(backend.get_buildable_quantities().items(), 'product_id', 'units')
+
+
+@route('GET', '/products/{product_id}/bom')
+def bom(query, body, product_id):
+    # Exploded raw material needs per unit
+    return _records(backend.get_bom(product_id), 'material_id', 'name', 'quantity')
+
+
+@route('POST', '/products/boms', read=True)
+def boms(query, body):
+    # Bulk: {"product_ids": [...]} -> {product_id: exploded BOM}
+    product_ids = _field(body, 'product_ids', list)
+    if not all(isinstance(product_id, int) for product_id in product_ids):
+        raise ValueError("'product_ids' must be a list of integers")
+    return {str(product_id): _records(lines, 'material_id', 'name', 'quantity')
+            for product_id, lines in backend.get_boms(product_ids).items()}
+
+
+@route('POST', '/products', status=201)
+def add_product(query, body):
+    # {"name", "bom": [{"material_id", "quantity"}], "components": [{"product_id", "quantity"}]}
+    product_id = backend.add_product(_field(body, 'name', str), _items(body, 'bom', 'material_id', 'quantity'),
+                                     _items(body, 'components', 'product_id', 'quantity', default=[]))
+    return {'id': product_id}
+
+
+@route('PUT', '/products/{product_id}/bom')
+def update_bom(query, body, product_id):
+    backend.update_bom(product_id, _items(body, 'bom', 'material_id', 'quantity'),
+                       _items(body, 'components', 'product_id', 'quantity', default=[]))
+    return {'updated': True}
+
+
+@route('DELETE', '/products/{product_id}')
+def delete_product(query, body, product_id):
+    backend.delete_product(product_id)
+    return {'deleted': True}
+
+
+# Orders and history
+def _order_result(result):
+    placed, detail = result
+    if placed:
+        return {'placed': True, 'order_id': detail}
+    return {'placed': False, 'shortages': _records(detail, 'material', 'missing')}
+
+
+@route('POST', '/orders')
+def place_order(query, body):
+    return _order_result(backend.place_order(_field(body, 'product_id'), _field(body, 'quantity')))
+
+
+@route('POST', '/orders/bulk')
+def place_orders(query, body):
+    # {"orders": [{"product_id", "quantity"}], "atomic": true}; see backend.place_orders
+    atomic = body.get('atomic', True)
+    if not isinstance(atomic, bool):
+        raise ValueError("'atomic' must be a boolean")
+    results = backend.place_orders(_items(body, 'orders', 'product_id', 'quantity'), atomic=atomic)
+    return [_order_result(result) for result in results]
+
+
+@route('GET', '/orders')
+def orders(query, body):
+    # Newest first; ?limit, ?after (last order id of the previous page),
+    # ?start, ?end (dates), ?product_id
+    return _records(backend.get_orders(_query_int(query, 'limit', 50), _query_int(query, 'after'),
+                                       query.get('start'), query.get('end'), _query_int(query, 'product_id')),
+                    'order_id', 'product', 'quantity', 'timestamp', 'materials', 'total_used')
+
+
+@route('GET', '/orders/count')
+def count_orders(query, body):
+    return {'orders': backend.count_orders(query.get('start'), query.get('end'), _query_int(query, 'product_id'))}
+
+
+@route('GET', '/orders/{order_id}')
+def order_details(query, body, order_id):
+    details = backend.get_order_details(order_id)
+    if not details:
+        raise HTTPError(404, 'Order not found')
+    return _records(details, 'material_id', 'name', 'quantity_used')
+
+
+@route('GET', '/backorders')
+def backorders(query, body):
+    return _records(backend.get_backorders(query.get('status', 'waiting'), _query_int(query, 'limit')),
+                    'id', 'product', 'quantity', 'priority', 'queued_at', 'status', 'order_id', 'waiting_for')
+
+
+@route('POST', '/backorders', status=201)
+def queue_backorder(query, body):
+    backorder_id, order_id = backend.queue_backorder(_field(body, 'product_id'), _field(body, 'quantity'),
+                                                     _field(body, 'priority', default=0))
+    return {'id': backorder_id, 'order_id': order_id}
+
+
+@route('DELETE', '/backorders/{backorder_id}')
+def cancel_backorder(query, body, backorder_id):
+    backend.cancel_backorder(backorder_id)
+    return {'cancelled': True}
+
+
+# Planning (nothing is written)
+@route('POST', '/plan', read=True)
+def plan(query, body):
+    # {"lines": [{"product_id", "quantity", "due"}]}; see backend.plan_requirements
+    lines = _items(body, 'lines', 'product_id', 'quantity')
+    dues = [str(line.get('due', '')) for line in body['lines']]
+    return _records(backend.plan_requirements([(*line, due) for line, due in zip(lines, dues)]),
+                    'material_id', 'name', 'on_hand', 'demand', 'shortfall', 'first_blocked')
+
+
+@route('POST', '/allocation', read=True)
+def allocation(query, body):
+    # {"lines": [{"product_id", "demand", "weight"}], "method", "time_limit"}
+    lines = _field(body, 'lines', list)
+    if not all(isinstance(line, dict) for line in lines):
+        raise ValueError("'lines' must be a list of objects")
+    weights = [line.get('weight', 1) for line in lines]
+    if not all(isinstance(weight, (int, float)) and not isinstance(weight, bool) for weight in weights):
+        raise ValueError("'weight' must be a number")
+    method = _field(body, 'method', str, 'auto')
+    if method not in ALLOCATION_METHODS:
+        raise ValueError(f"'method' must be one of {', '.join(ALLOCATION_METHODS)}")
+    time_limit = _field(body, 'time_limit', float, backend.ALLOCATION_TIME_LIMIT)
+    if not 0 < time_limit <= MAX_TIME_LIMIT:
+        raise ValueError(f"'time_limit' must be between 0 and {MAX_TIME_LIMIT} seconds")
+    result = backend.optimize_allocation(
+        [(*line, weight) for line, weight in zip(_items(body, 'lines', 'product_id', 'demand'), weights)],
+        method=method, time_limit=time_limit)
+    result['products'] = _records(result['products'], 'product_id', 'name', 'demand', 'weight', 'units')
+    result['materials'] = _records(result['materials'], 'material_id', 'name', 'on_hand', 'needed', 'used')
+    return result
+
+
+def _match(method, path):
+    allowed = []
+    for route_method, pattern, handler, read, status in ROUTES:
+        found = pattern.match(path)
+        if found:
+            if route_method == method:
+                return handler, read, status, {name: int(value) for name, value in found.groupdict().items()}
+            allowed.append(route_method)
+    if allowed:
+        raise HTTPError(405, f"Method not allowed; use {', '.join(allowed)}")
+    raise HTTPError(404, 'Not found')
+
+
+def _call(handler, read, query, body, params):
+    # Runs on a pool thread
+    if read:
+        with backend.read_only():
+            return handler(query, body, **params)
+    return handler(query, body, **params)
+
+
+async def dispatch(pool, slots, method, target, body):
+    # Returns (status, payload)
+    try:
+        url = urlsplit(target)
+        handler, read, status, params = _match(method, url.path.rstrip('/') or '/')
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            raise HTTPError(400, 'Body is not valid JSON')
+        if not isinstance(data, dict):
+            raise HTTPError(400, 'Body must be a JSON object')
+        # Bounded queue in front of the pool: past it, connections wait here
+        async with slots:
+            result = await asyncio.get_running_loop().run_in_executor(
+                pool, _call, handler, read, query, data, params)
+        return status, result
+    except HTTPError as e:
+        return e.status, {'error': str(e)}
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    except sqlite3.OperationalError as e:
+        if 'locked' in str(e) or 'busy' in str(e):
+            return 503, {'error': 'Database is busy, retry later'}
+        return 500, {'error': str(e)}
+    except Exception as e:
+        return 500, {'error': f'{type(e).__name__}: {e}'}
+
+
+def _response(status, payload, keep_alive):
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode()
+    head = (f'HTTP/1.1 {status} {STATUS_TEXT.get(status, "")}\r\n'
+            f'Content-Type: application/json; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+    return head.encode('latin-1') + body
+
+
+async def handle_connection(pool, slots, reader, writer):
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except asyncio.IncompleteReadError:
+                break
+            except asyncio.LimitOverrunError:
+                writer.write(_response(431, {'error': 'Headers too large'}, False))
+                break
+            request_line, *header_lines = head.decode('latin-1').split('\r\n')
+            parts = request_line.split(' ')
+            if len(parts) != 3:
+                writer.write(_response(400, {'error': 'Malformed request line'}, False))
+                break
+            method, target, version = parts
+            headers = {}
+            for line in header_lines:
+                name, _, value = line.partition(':')
+                if name:
+                    headers[name.strip().lower()] = value.strip()
+            connection = headers.get('connection', '').lower()
+            keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+            try:
+                length = int(headers.get('content-length', 0))
+            except ValueError:
+                length = -1
+            if not 0 <= length <= MAX_BODY:
+                writer.write(_response(413 if length > MAX_BODY else 400, {'error': 'Bad Content-Length'}, False))
+                break
+            body = await reader.readexactly(length) if length else b''
+            status, payload = await dispatch(pool, slots, method.upper(), target, body)
+            writer.write(_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=DEFAULT_WORKERS):
+    # One read-only and one read-write connection per worker stay pooled
+    backend.configure(max_idle=max(workers, backend.MAX_IDLE_CONNECTIONS))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api')
+    slots = asyncio.Semaphore(workers * QUEUED_PER_WORKER)
+    server = await asyncio.start_server(functools.partial(handle_connection, pool, slots), host, port,
+                                        limit=MAX_HEADER)
+    print(f'Serving {backend.DB_PATH} on http://{host}:{port} ({workers} workers)', flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        pool.shutdown(wait=True)
+
+
+# Load generator: `concurrency` keep-alive connections issuing requests
+# back to back for `duration` seconds. The mix picks read requests (order
+# history page, product search, BOM, inventory) and small writes (stock
+# adjustments, orders) at the given write ratio.
+async def _request(reader, writer, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else b''
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(data)}\r\n\r\n'.encode('latin-1') + data)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    length = next(int(line.split(':', 1)[1]) for line in lines if line.lower().startswith('content-length:'))
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def _load_worker(host, port, deadline, rng, write_ratio, materials, products, samples):
+    reader, writer = await asyncio.open_connection(host, port, limit=MAX_BODY)
+    try:
+        while time.perf_counter() < deadline:
+            if rng.random() < write_ratio:
+                if rng.random() < 0.5:
+                    kind, method, path, body = 'write', 'POST', f'/materials/{rng.choice(materials)}/adjust', {'quantity': 1}
+                else:
+                    kind, method, path, body = 'write', 'POST', '/orders', {'product_id': rng.choice(products), 'quantity': 1}
+            else:
+                kind, method, body = 'read', 'GET', None
+                path = rng.choice((
+                    '/orders?limit=20',
+                    f'/orders?limit=20&product_id={rng.choice(products)}',
+                    f'/products/search?q=P{rng.randint(0, 9)}&limit=20',
+                    f'/products/{rng.choice(products)}/bom',
+                    '/materials/search?q=M&limit=20',
+                ))
+            start = time.perf_counter()
+            status, _ = await _request(reader, writer, method, path, body)
+            samples.append((kind, status, time.perf_counter() - start))
+    finally:
+        writer.close()
+
+
+def _summary(samples, seconds):
+    latencies = sorted(latency for _, _, latency in samples)
+    if not latencies:
+        return {'requests': 0}
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for _, status, _ in samples if status >= 500),
+        'req_per_sec': round(len(latencies) / seconds, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+    }
+
+
+async def load(host=DEFAULT_HOST, port=DEFAULT_PORT, concurrency=32, duration=10.0, write_ratio=0.1, seed=42):
+    reader, writer = await asyncio.open_connection(host, port, limit=MAX_BODY)
+    try:
+        _, inventory = await _request(reader, writer, 'GET', '/inventory?format=columns')
+        _, products = await _request(reader, writer, 'GET', '/products?limit=1000')
+    finally:
+        writer.close()
+    materials, products = inventory['id'], [product['id'] for product in products]
+    if not materials or not products:
+        raise SystemExit('The database needs materials and products to generate load')
+
+    samples = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _load_worker(host, port, start + duration, random.Random(seed + i), write_ratio, materials, products, samples)
+        for i in range(concurrency)))
+    seconds = time.perf_counter() - start
+    report = {'concurrency': concurrency, 'seconds': round(seconds, 2), 'write_ratio': write_ratio,
+              'all': _summary(samples, seconds)}
+    for kind in ('read', 'write'):
+        report[kind] = _summary([sample for sample in samples if sample[0] == kind], seconds)
+    report['status_counts'] = {str(status): sum(1 for _, s, _ in samples if s == status)
+                               for status in sorted({status for _, status, _ in samples})}
+    return report
+
+
+def _spawn(args):
+    # A server in a child process, so client and server do not share the GIL
+    command = [sys.executable, os.path.abspath(__file__), 'serve', '--host', args.host, '--port', str(args.port),
+               '--workers', str(args.workers)] + (['--write-queue'] if args.write_queue else [])
+    child = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection((args.host, args.port), timeout=1).close()
+            return child
+        except OSError:
+            time.sleep(0.1)
+    child.kill()
+    raise SystemExit('Server did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inventory HTTP/JSON API')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help in (('serve', 'run the API server'), ('load', 'generate load against a running server')):
+        command = commands.add_parser(name, help=help)
+        command.add_argument('--host', default=DEFAULT_HOST)
+        command.add_argument('--port', type=int, default=DEFAULT_PORT)
+        command.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='backend thread pool size')
+        command.add_argument('--write-queue', action='store_true', help='group-commit writes (see backend)')
+    load_command = commands.choices['load']
+    load_command.add_argument('--concurrency', type=int, default=32, help='open connections')
+    load_command.add_argument('--duration', type=float, default=10.0, help='seconds')
+    load_command.add_argument('--write-ratio', type=float, default=0.1, help='share of write requests')
+    load_command.add_argument('--seed', type=int, default=42)
+    load_command.add_argument('--spawn', action='store_true',
+                              help='start a server on --host/--port for the run (uses INVENTORY_DB)')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        if args.write_queue:
+            backend.enable_write_queue()
+        try:
+            asyncio.run(serve(args.host, args.port, args.workers))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    child = _spawn(args) if args.spawn else None
+    try:
+        report = asyncio.run(load(args.host, args.port, args.concurrency, args.duration, args.write_ratio, args.seed))
+    finally:
+        if child is not None:
+            child.terminate()
+            child.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
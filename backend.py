@@ -1,12 +1,500 @@
+import csv
+import functools
+import io
+import itertools
+import json
+import os
+import queue
+import re
 import sqlite3
-from datetime import datetime
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 
-# Database initialization and connection
-def init_db():
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    
-    # Create tables
+try:
+    import numpy as np
+except ImportError:  # only the planning functions need numpy
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet import/export and result='arrow' are optional
+    pa = pq = None
+
+try:
+    from scipy.optimize import Bounds, LinearConstraint, milp
+    from scipy.sparse import csr_array
+except ImportError:  # optimize_allocation falls back to its greedy heuristic
+    milp = None
+
+# Connection settings (override with configure() or the INVENTORY_DB and
+# INVENTORY_ARCHIVE_DIR env vars)
+DB_PATH = os.environ.get('INVENTORY_DB', 'inventory.db')
+BUSY_TIMEOUT = 5.0          # seconds to wait on a locked database
+CACHED_STATEMENTS = 256     # prepared statements kept per connection
+MAX_IDLE_CONNECTIONS = 8    # idle connections kept open in the pool
+WRITE_QUEUE = os.environ.get('INVENTORY_WRITE_QUEUE') == '1'  # see enable_write_queue()
+ARCHIVE_DIR = os.environ.get('INVENTORY_ARCHIVE_DIR')  # default: 'archive' next to DB_PATH
+
+
+class _Connection(sqlite3.Connection):
+    # Times execute/executemany while instrumentation is on (see
+    # enable_instrumentation); otherwise a plain pass-through.
+    instrumented = False
+    discard = False     # set when the connection must not go back to the pool
+
+    def execute(self, sql, parameters=()):
+        if not _instrumentation['enabled']:
+            return super().execute(sql, parameters)
+        cursor = self.cursor(_TimedCursor)
+        cursor.sql, cursor.parameters = sql, parameters
+        start = time.perf_counter()
+        cursor.execute(sql, parameters)
+        cursor.elapsed = time.perf_counter() - start
+        cursor.recorded = False
+        if cursor.description is None:
+            cursor.record()
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        if not _instrumentation['enabled']:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        cursor = super().executemany(sql, seq_of_parameters)
+        _record_statement(self, sql, None, time.perf_counter() - start)
+        return cursor
+
+
+class _TimedCursor(sqlite3.Cursor):
+    # Cursor of an instrumented execute(). SQLite produces rows as they are
+    # fetched, so a query's time keeps running through the fetches and is
+    # recorded once its rows run out (or the cursor is closed or dropped).
+    sql = parameters = None
+    elapsed = 0.0
+    recorded = True
+
+    def _timed(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self.record()
+            raise
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self.record()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if len(rows) < size:
+            self.record()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self.record()
+        return rows
+
+    def close(self):
+        self.record()
+        super().close()
+
+    def __del__(self):
+        # May run after the connection moved on: no EXPLAIN from here
+        self.record(explain=False)
+
+    def record(self, explain=True):
+        if not self.recorded:
+            self.recorded = True
+            _record_statement(self.connection, self.sql, self.parameters if explain else None, self.elapsed)
+
+
+class ConnectionPool:
+    # Long-lived SQLite connections shared between threads. A thread checks a
+    # connection out for the duration of a backend call; nested calls on the
+    # same thread reuse it, so a call never opens a second connection.
+    def __init__(self, path, busy_timeout=BUSY_TIMEOUT,
+                 cached_statements=CACHED_STATEMENTS, max_idle=MAX_IDLE_CONNECTIONS, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+    def _open(self):
+        conn = sqlite3.connect(
+            f'file:{urllib.request.pathname2url(os.path.abspath(self.path))}?mode=ro' if self.read_only else self.path,
+            timeout=self.busy_timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            isolation_level=None,
+            factory=_Connection,
+            uri=self.read_only,
+        )
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}')
+        if self.read_only:
+            conn.execute('PRAGMA query_only = ON')
+            return conn
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._open()
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if not self._closed and not conn.discard and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+        conn = self._acquire()
+        if conn.instrumented != _instrumentation['enabled']:
+            _set_connection_hooks(conn, _instrumentation['enabled'])
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pool = ConnectionPool(DB_PATH)
+# Read-only connections used inside read_only() blocks
+_read_pool = ConnectionPool(DB_PATH, read_only=True)
+_reads = threading.local()
+
+
+def configure(db_path=None, busy_timeout=None, cached_statements=None, max_idle=None, archive_dir=None):
+    # Replace the pool with one using the given settings and make sure the
+    # schema exists in the (possibly new) database file.
+    global _pool, _read_pool, DB_PATH, BUSY_TIMEOUT, CACHED_STATEMENTS, MAX_IDLE_CONNECTIONS, ARCHIVE_DIR
+    if db_path is not None:
+        DB_PATH = db_path
+    if archive_dir is not None:
+        ARCHIVE_DIR = archive_dir
+    if busy_timeout is not None:
+        BUSY_TIMEOUT = busy_timeout
+    if cached_statements is not None:
+        CACHED_STATEMENTS = cached_statements
+    if max_idle is not None:
+        MAX_IDLE_CONNECTIONS = max_idle
+    old, _pool = _pool, ConnectionPool(DB_PATH, BUSY_TIMEOUT, CACHED_STATEMENTS, MAX_IDLE_CONNECTIONS)
+    old_reads, _read_pool = _read_pool, ConnectionPool(DB_PATH, BUSY_TIMEOUT, CACHED_STATEMENTS, MAX_IDLE_CONNECTIONS,
+                                                       read_only=True)
+    old.close()
+    old_reads.close()
+    _close_watcher()
+    init_db()
+    _bump_data_version()
+    _explosion.reset()
+    _feasibility.reset()
+
+
+def close_connections():
+    _pool.close()
+    _read_pool.close()
+    _close_watcher()
+
+
+@contextmanager
+def read_only():
+    # Backend reads made by this thread inside the block use read-only
+    # connections (mode=ro, query_only), e.g. for a server's read requests.
+    # Writing through them fails; mutating calls that go through the write
+    # queue are unaffected.
+    previous = getattr(_reads, 'active', False)
+    _reads.active = True
+    try:
+        yield
+    finally:
+        _reads.active = previous
+
+
+@contextmanager
+def connection():
+    with (_read_pool if getattr(_reads, 'active', False) else _pool).connection() as conn:
+        yield conn
+
+
+_tx = threading.local()
+
+
+def _after_transaction(callback):
+    # Run an invalidation callback once the current thread's outermost
+    # transaction ends, or right away when no transaction is open. Callbacks
+    # also run after a rollback: invalidating unchanged data is harmless, while
+    # skipping it could keep state that was read mid-transaction.
+    pending = getattr(_tx, 'pending', None)
+    if pending is None:
+        callback()
+    else:
+        pending.append(callback)
+
+
+@contextmanager
+def transaction():
+    # BEGIN IMMEDIATE takes the write lock up front so concurrent writers wait
+    # on busy_timeout instead of failing mid-transaction. Nested use becomes a
+    # savepoint that can roll back on its own.
+    with connection() as conn:
+        if conn.in_transaction:
+            conn.execute('SAVEPOINT nested')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK TO nested')
+                conn.execute('RELEASE nested')
+                raise
+            conn.execute('RELEASE nested')
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        _tx.pending = []
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            callbacks, _tx.pending = _tx.pending, None
+            for callback in callbacks:
+                callback()
+
+
+# Optional single-writer mode (enable_write_queue). Every mutating call from
+# another thread is handed to one writer thread instead of competing for the
+# SQLite write lock. The writer takes whatever calls are queued, up to
+# WRITE_BATCH_SIZE, and runs them in one write transaction (group commit):
+# each call's own transaction() becomes a savepoint, so a failing call rolls
+# back alone and its caller gets the exception. Results are handed back only
+# after the commit.
+WRITE_BATCH_SIZE = 64
+
+
+class _WriteQueue:
+    def __init__(self, max_batch=WRITE_BATCH_SIZE):
+        self.max_batch = max_batch
+        self.jobs = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name='inventory-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, func, args, kwargs):
+        # Returns a Future, or None once the queue is stopped (run inline then)
+        future = Future()
+        with self.lock:
+            if self.stopped:
+                return None
+            self.jobs.put((func, args, kwargs, getattr(_current_call, 'record', None), future))
+        return future
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            self.jobs.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self.jobs.get()]
+            while batch[-1] is not None and len(batch) < self.max_batch:
+                try:
+                    batch.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            if batch:
+                self._run_batch(batch)
+            if stop:
+                return
+
+    def _run_batch(self, batch):
+        done = []
+        try:
+            with transaction():
+                for func, args, kwargs, record, future in batch:
+                    # Statements count towards the caller's instrumentation record
+                    _current_call.record = record
+                    try:
+                        done.append((future, func(*args, **kwargs)))
+                    except BaseException as e:
+                        future.set_exception(e)
+                    finally:
+                        _current_call.record = None
+        except BaseException as e:
+            # BEGIN or COMMIT failed: nothing in the batch was written, so
+            # every caller still waiting gets the error
+            for _, _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in done:
+            future.set_result(result)
+
+
+_writer = None
+
+
+def enable_write_queue(enabled=True, max_batch=WRITE_BATCH_SIZE):
+    # Switch single-writer mode on or off for this process; calls already
+    # queued are finished first
+    global _writer
+    old, _writer = _writer, (_WriteQueue(max_batch) if enabled else None)
+    if old is not None:
+        old.stop()
+
+
+def write_queue_enabled():
+    return _writer is not None
+
+
+# Read cache shared by every session in the process. Entries are tagged with
+# the data version they were read at; every mutating function bumps the
+# version once its transaction ends, so a cached read is never stale.
+# Cached results are shared and must not be modified by callers.
+MAX_CACHE_ENTRIES = 1024
+
+_data_version = 0
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def data_version():
+    return _data_version
+
+
+def _bump_data_version():
+    global _data_version
+    with _cache_lock:
+        _data_version += 1
+        _cache.clear()
+
+
+def clear_cache():
+    _bump_data_version()
+
+
+# Commits by other processes (the API server, the Streamlit UI, scripts) do
+# not bump the data version here. PRAGMA data_version on a watcher
+# connection moves whenever another connection commits, so cached reads
+# check it first and drop the cache when it has moved. The BOM explosion and
+# the feasibility engine need no check: they look at bom_versions and the
+# stock ledger on every use.
+_watcher = {'conn': None, 'version': None}
+_watcher_lock = threading.Lock()
+
+
+def _sync_external():
+    with _watcher_lock:
+        if _watcher['conn'] is None:
+            _watcher['conn'] = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        version = _watcher['conn'].execute('PRAGMA data_version').fetchone()[0]
+        if version == _watcher['version']:
+            return
+        _watcher['version'] = version
+    _bump_data_version()
+
+
+def _close_watcher():
+    with _watcher_lock:
+        if _watcher['conn'] is not None:
+            _watcher['conn'].close()
+        _watcher.update(conn=None, version=None)
+
+
+def _mutates(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # In single-writer mode, calls from outside a transaction go through
+        # the writer thread; it runs this wrapper again, inline
+        writer = _writer
+        if (writer is not None and threading.current_thread() is not writer.thread
+                and getattr(_tx, 'pending', None) is None):
+            future = writer.submit(wrapper, args, kwargs)
+            if future is not None:
+                return future.result()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _after_transaction(_bump_data_version)
+    return wrapper
+
+
+def _cached(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        in_write = getattr(_tx, 'pending', None) is not None
+        try:
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            hash(key)
+        except TypeError:
+            key = None
+        # Reads inside a write transaction may see uncommitted rows
+        if key is None or in_write:
+            return func(*args, **kwargs)
+
+        _sync_external()
+        version = _data_version
+        hit = _cache.get(key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        result = func(*args, **kwargs)
+        with _cache_lock:
+            if _data_version == version:
+                if len(_cache) >= MAX_CACHE_ENTRIES:
+                    _cache.clear()
+                _cache[key] = (version, result)
+        return result
+    return wrapper
+
+
+# Schema migrations. Each entry upgrades the schema by one version; the
+# current version is kept in PRAGMA user_version. Migrations only ever add to
+# the schema, so existing inventory.db files upgrade in place.
+def _migration_1(cursor):
+    # Baseline schema. IF NOT EXISTS lets databases created before versioning
+    # (user_version 0) pass through unchanged.
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS materials (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -14,14 +502,14 @@ def init_db():
             quantity INTEGER NOT NULL DEFAULT 0
         )
     ''')
-    
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS products (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT UNIQUE NOT NULL
         )
     ''')
-    
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS bom (
             product_id INTEGER NOT NULL,
@@ -32,7 +520,7 @@ def init_db():
             PRIMARY KEY(product_id, material_id)
         )
     ''')
-    
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS orders (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -42,7 +530,7 @@ def init_db():
             FOREIGN KEY(product_id) REFERENCES products(id)
         )
     ''')
-    
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS order_details (
             order_id INTEGER NOT NULL,
@@ -53,192 +541,2355 @@ def init_db():
             PRIMARY KEY(order_id, material_id)
         )
     ''')
-    
-    conn.commit()
-    conn.close()
+
+    # Row counts kept up to date by triggers so counting is O(1)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS row_counts (
+            name TEXT PRIMARY KEY,
+            rows INTEGER NOT NULL
+        )
+    ''')
+    for table in ('materials', 'products', 'orders'):
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO row_counts (name, rows)
+            SELECT '{table}', COUNT(*) FROM {table}
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_insert AFTER INSERT ON {table}
+            BEGIN
+                UPDATE row_counts SET rows = rows + 1 WHERE name = '{table}';
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_delete AFTER DELETE ON {table}
+            BEGIN
+                UPDATE row_counts SET rows = rows - 1 WHERE name = '{table}';
+            END
+        ''')
+
+def _migration_2(cursor):
+    # Lookups by material: delete_material checks bom, and order details are
+    # looked up by material
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_bom_material ON bom(material_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_details_material ON order_details(material_id)')
+
+def _migration_3(cursor):
+    # Integer epoch timestamp for sorting and range queries. The TEXT
+    # timestamp column stays for display; existing rows were written in local
+    # time, which the 'utc' modifier converts from.
+    cursor.execute('ALTER TABLE orders ADD COLUMN created_at INTEGER')
+    cursor.execute('''
+        UPDATE orders SET created_at = CAST(strftime('%s', timestamp, 'utc') AS INTEGER)
+    ''')
+    cursor.execute('DROP INDEX IF EXISTS idx_orders_timestamp')
+    cursor.execute('CREATE INDEX idx_orders_created_at ON orders(created_at, id)')
+
+def _migration_4(cursor):
+    # Sub-assemblies: products used as BOM components of other products
+    cursor.execute('''
+        CREATE TABLE product_components (
+            product_id INTEGER NOT NULL,
+            component_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            FOREIGN KEY(product_id) REFERENCES products(id),
+            FOREIGN KEY(component_id) REFERENCES products(id),
+            PRIMARY KEY(product_id, component_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_product_components_component ON product_components(component_id)')
+
+def _migration_5(cursor):
+    # Append-only stock ledger plus periodic per-material snapshots (see
+    # _record_movements). Existing stock is booked as an opening movement.
+    cursor.execute('''
+        CREATE TABLE stock_movements (
+            id INTEGER PRIMARY KEY,
+            material_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            order_id INTEGER
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_stock_movements_material ON stock_movements(material_id, created_at)')
+    cursor.execute('''
+        CREATE TABLE stock_snapshots (
+            material_id INTEGER NOT NULL,
+            movement_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            PRIMARY KEY(material_id, movement_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_stock_snapshots_movement ON stock_snapshots(movement_id)')
+    cursor.execute('''
+        CREATE INDEX idx_stock_snapshots_created_at ON stock_snapshots(material_id, created_at, movement_id)
+    ''')
+    cursor.execute('''
+        INSERT INTO stock_movements (material_id, created_at, delta, reason)
+        SELECT id, ?, quantity, 'opening' FROM materials ORDER BY id
+    ''', (int(time.time()),))
+    _snapshot(cursor)
+
+def _migration_6(cursor):
+    # Daily and weekly (Monday-based) consumption per material, kept up to
+    # date by the order functions; backfilled from order history
+    for table, period in (('consumption_daily', 'day'), ('consumption_weekly', 'week')):
+        cursor.execute(f'''
+            CREATE TABLE {table} (
+                material_id INTEGER NOT NULL,
+                {period} TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                PRIMARY KEY(material_id, {period})
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute(f'CREATE INDEX idx_{table}_{period} ON {table}({period})')
+    _rebuild_consumption(cursor)
+
+def _migration_7(cursor):
+    # Backorder queue. backorder_materials indexes each waiting backorder
+    # under the materials it is short of, so a stock increase only looks at
+    # the backorders that wait for the replenished materials.
+    cursor.execute('''
+        CREATE TABLE backorders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            created_at INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'waiting',
+            order_id INTEGER,
+            closed_at INTEGER,
+            FOREIGN KEY(product_id) REFERENCES products(id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX idx_backorders_queue ON backorders(priority DESC, id) WHERE status = 'waiting'
+    ''')
+    cursor.execute('''
+        CREATE TABLE backorder_materials (
+            material_id INTEGER NOT NULL,
+            backorder_id INTEGER NOT NULL,
+            PRIMARY KEY(material_id, backorder_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX idx_backorder_materials_backorder ON backorder_materials(backorder_id)')
+
+def _migration_8(cursor):
+    # Prefix-indexed full-text name search (see search_materials). The FTS
+    # tables are contentless and kept in sync by triggers. Diacritics are
+    # folded and dotless 'ı' is indexed as 'i', so 'celik' finds 'Çelik' and
+    # 'igdir' finds 'Iğdır'.
+    for table in ('materials', 'products'):
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE {table}_fts USING fts5(
+                name, content='', tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+            )
+        ''')
+        cursor.execute(f"INSERT INTO {table}_fts (rowid, name) SELECT id, replace(name, 'ı', 'i') FROM {table}")
+        cursor.execute(f'''
+            CREATE TRIGGER trg_{table}_fts_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {table}_fts (rowid, name) VALUES (new.id, replace(new.name, 'ı', 'i'));
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER trg_{table}_fts_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, name)
+                VALUES ('delete', old.id, replace(old.name, 'ı', 'i'));
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER trg_{table}_fts_update AFTER UPDATE OF name ON {table}
+            BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, name)
+                VALUES ('delete', old.id, replace(old.name, 'ı', 'i'));
+                INSERT INTO {table}_fts (rowid, name) VALUES (new.id, replace(new.name, 'ı', 'i'));
+            END
+        ''')
+
+def _migration_9(cursor):
+    # Order history filtered by product, newest first (see get_orders)
+    cursor.execute('CREATE INDEX idx_orders_product ON orders(product_id, created_at, id)')
+
+def _migration_10(cursor):
+    # Per-month, per-product summary of archived orders (see archive_orders)
+    cursor.execute('''
+        CREATE TABLE order_archive (
+            month TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            orders INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            first_created_at INTEGER NOT NULL,
+            last_created_at INTEGER NOT NULL,
+            PRIMARY KEY (month, product_id)
+        ) WITHOUT ROWID
+    ''')
+
+def _migration_11(cursor):
+    # Per-product BOM version (see BomExplosion). Triggers stamp a product
+    # with the next version whenever its BOM lines, its sub-assembly lines or
+    # the product itself change, whichever process writes, so in-memory BOM
+    # state can catch up on exactly the products changed since it last looked.
+    cursor.execute('''
+        CREATE TABLE bom_versions (
+            product_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_bom_versions_version ON bom_versions(version)')
+    # An upsert rather than INSERT OR REPLACE: a trigger's conflict clause
+    # is overridden by that of the statement firing it (INSERT OR IGNORE)
+    stamp = '''
+        INSERT INTO bom_versions (product_id, version)
+        SELECT {row}, COALESCE(MAX(version), 0) + 1 FROM bom_versions WHERE true
+        ON CONFLICT (product_id) DO UPDATE SET version = excluded.version;
+    '''
+    for table, key in (('bom', 'product_id'), ('product_components', 'product_id'), ('products', 'id')):
+        for event, rows in (('INSERT', ('new',)), ('DELETE', ('old',)), ('UPDATE', ('old', 'new'))):
+            cursor.execute(f'''
+                CREATE TRIGGER trg_{table}_bom_version_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    {''.join(stamp.format(row=f'{row}.{key}') for row in rows)}
+                END
+            ''')
+
+def _migration_12(cursor):
+    # Version of the material names (see material_names_version), bumped on
+    # every insert, delete and rename whichever process writes
+    cursor.execute('CREATE TABLE material_names_version (version INTEGER NOT NULL)')
+    cursor.execute('INSERT INTO material_names_version (version) VALUES (0)')
+    for event in ('INSERT', 'DELETE', 'UPDATE OF name'):
+        cursor.execute(f'''
+            CREATE TRIGGER trg_materials_names_{event.split()[0].lower()} AFTER {event} ON materials
+            BEGIN
+                UPDATE material_names_version SET version = version + 1;
+            END
+        ''')
+
+MIGRATIONS = [
+    _migration_1,
+    _migration_2,
+    _migration_3,
+    _migration_4,
+    _migration_5,
+    _migration_6,
+    _migration_7,
+    _migration_8,
+    _migration_9,
+    _migration_10,
+    _migration_11,
+    _migration_12,
+]
+
+def schema_version():
+    with connection() as conn:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate():
+    # Each step runs in its own write transaction and re-reads the version
+    # under the lock, so concurrent processes never apply a step twice.
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        with transaction() as conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                continue
+            migration(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {version}')
+
+# Database initialization and connection
+def init_db():
+    migrate()
+
+# Result modes for the list readers (get_inventory, get_products,
+# get_order_history, get_order_history_detailed):
+#   'rows'    list of tuples (default)
+#   'columns' {column: list}
+#   'numpy'   {column: ndarray}; text columns become fixed-width str arrays
+#   'arrow'   pyarrow.Table
+# The columnar modes convert FETCH_CHUNK rows at a time, so a large result
+# never exists as one list of row tuples.
+RESULT_MODES = ('rows', 'columns', 'numpy', 'arrow')
+FETCH_CHUNK = 65536
+ORDER_COLUMNS = ('order_id', 'product', 'quantity', 'timestamp')
+
+
+def _fetch(rows, columns, result='rows'):
+    # `rows`: a cursor or any other iterator of row tuples
+    rows = iter(rows)
+    if result == 'rows':
+        return list(rows)
+    if result not in RESULT_MODES:
+        raise ValueError(f"result must be one of {', '.join(RESULT_MODES)}")
+    if result == 'numpy' and np is None:
+        raise RuntimeError("numpy is required for result='numpy'")
+    if result == 'arrow' and pa is None:
+        raise RuntimeError("pyarrow is required for result='arrow'")
+
+    chunks = {column: [] for column in columns}
+    batches = []
+    while True:
+        chunk = list(itertools.islice(rows, FETCH_CHUNK))
+        if not chunk:
+            break
+        data = list(zip(*chunk))
+        del chunk
+        if result == 'arrow':
+            batches.append(pa.RecordBatch.from_arrays([pa.array(values) for values in data], names=list(columns)))
+            continue
+        for column, values in zip(columns, data):
+            if result == 'columns':
+                chunks[column].extend(values)
+            else:
+                chunks[column].append(np.array(values))
+
+    if result == 'arrow':
+        if not batches:
+            return pa.table({column: pa.array([], pa.null()) for column in columns})
+        return pa.Table.from_batches(batches)
+    if result == 'numpy':
+        return {column: np.concatenate(parts) if parts else np.array([]) for column, parts in chunks.items()}
+    return chunks
+
+
+def _result_rows(result):
+    # Row count of a reader result in any mode
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        if result and all(isinstance(value, (list, tuple)) or hasattr(value, 'shape')
+                          for value in result.values()):
+            return len(next(iter(result.values())))
+        return len(result)
+    return getattr(result, 'num_rows', 0)
+
+
+# Stock ledger. Every function that changes materials.quantity also appends
+# its (material_id, delta) movements to stock_movements in the same
+# transaction. Every SNAPSHOT_EVERY movements the current quantity of each
+# material that moved since the last round is stored in stock_snapshots, so a
+# point-in-time query reads one snapshot plus at most that many movements.
+# Point-in-time queries assume created_at does not decrease as ids grow.
+SNAPSHOT_EVERY = 10000
+
+
+def _snapshot(conn):
+    conn.execute('''
+        INSERT OR REPLACE INTO stock_snapshots (material_id, movement_id, created_at, quantity)
+        SELECT sm.material_id, MAX(sm.id), MAX(sm.created_at), m.quantity
+        FROM stock_movements sm
+        JOIN materials m ON m.id = sm.material_id
+        WHERE sm.id > (SELECT COALESCE(MAX(movement_id), 0) FROM stock_snapshots)
+        GROUP BY sm.material_id
+    ''')
+
+
+def _record_movements(conn, movements, reason, created_at=None):
+    # movements: (material_id, delta, order_id) rows, already applied to
+    # materials in this transaction
+    movements = list(movements)
+    if not movements:
+        return
+    if created_at is None:
+        created_at = int(time.time())
+    conn.executemany('''
+        INSERT INTO stock_movements (material_id, created_at, delta, reason, order_id)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(material_id, created_at, delta, reason, order_id)
+          for material_id, delta, order_id in movements])
+    last = conn.execute('SELECT MAX(id) FROM stock_movements').fetchone()[0]
+    if last // SNAPSHOT_EVERY != (last - len(movements)) // SNAPSHOT_EVERY:
+        _snapshot(conn)
+
+
+@_mutates
+def snapshot_stock():
+    # Snapshot now instead of waiting for the next SNAPSHOT_EVERY boundary
+    with transaction() as conn:
+        _snapshot(conn)
+
+
+def _epoch(at):
+    # datetime, date, epoch seconds or an ISO string. A bare date means the
+    # end of that day.
+    if isinstance(at, str):
+        at = datetime.fromisoformat(at) if len(at) > 10 else date.fromisoformat(at)
+    if isinstance(at, datetime):
+        return int(at.timestamp())
+    if isinstance(at, date):
+        return int(datetime.combine(at + timedelta(days=1), datetime.min.time()).timestamp()) - 1
+    return int(at)
+
+
+@_cached
+def get_stock_at(material_id, at=None):
+    # Quantity of one material at `at` (see _epoch): the nearest snapshot at
+    # or before it plus the movements between the two. None means now.
+    with connection() as conn:
+        if at is None:
+            row = conn.execute('SELECT quantity FROM materials WHERE id = ?', (material_id,)).fetchone()
+            return row[0] if row else 0
+        at = _epoch(at)
+        return conn.execute('''
+            WITH snap AS (
+                SELECT movement_id, created_at, quantity FROM stock_snapshots
+                WHERE material_id = ?1 AND created_at <= ?2
+                ORDER BY created_at DESC, movement_id DESC LIMIT 1
+            )
+            SELECT COALESCE((SELECT quantity FROM snap), 0) + COALESCE((
+                SELECT SUM(delta) FROM stock_movements
+                WHERE material_id = ?1
+                  AND created_at BETWEEN COALESCE((SELECT created_at FROM snap), 0) AND ?2
+                  AND id > COALESCE((SELECT movement_id FROM snap), 0)
+            ), 0)
+        ''', (material_id, at)).fetchone()[0]
+
+
+@_cached
+def get_inventory_at(at):
+    # get_inventory() as of `at`: (id, name, quantity) for materials that
+    # existed then
+    at = _epoch(at)
+    with connection() as conn:
+        return conn.execute('''
+            WITH snap AS (
+                SELECT m.id AS material_id, m.name, (
+                    SELECT movement_id FROM stock_snapshots
+                    WHERE material_id = m.id AND created_at <= ?1
+                    ORDER BY created_at DESC, movement_id DESC LIMIT 1
+                ) AS movement_id
+                FROM materials m
+                WHERE EXISTS (
+                    SELECT 1 FROM stock_movements sm
+                    WHERE sm.material_id = m.id AND sm.created_at <= ?1
+                )
+            )
+            SELECT snap.material_id, snap.name,
+                   COALESCE(s.quantity, 0) + COALESCE((
+                       SELECT SUM(delta) FROM stock_movements sm
+                       WHERE sm.material_id = snap.material_id
+                         AND sm.created_at BETWEEN COALESCE(s.created_at, 0) AND ?1
+                         AND sm.id > COALESCE(snap.movement_id, 0)
+                   ), 0)
+            FROM snap
+            LEFT JOIN stock_snapshots s
+              ON s.material_id = snap.material_id AND s.movement_id = snap.movement_id
+            ORDER BY snap.material_id
+        ''', (at,)).fetchall()
+
 
 # Material management functions
+@_mutates
 def add_material(name, quantity):
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
     try:
-        cursor.execute('INSERT INTO materials (name, quantity) VALUES (?, ?)', (name, quantity))
-        conn.commit()
+        with transaction() as conn:
+            material_id = conn.execute('INSERT INTO materials (name, quantity) VALUES (?, ?)',
+                                       (name, quantity)).lastrowid
+            _record_movements(conn, [(material_id, quantity, None)], 'create')
     except sqlite3.IntegrityError:
         raise ValueError("Material with this name already exists")
-    finally:
-        conn.close()
 
+@_mutates
 def update_material(material_id, quantity):
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    cursor.execute('UPDATE materials SET quantity = quantity + ? WHERE id = ?', (quantity, material_id))
-    conn.commit()
-    conn.close()
+    # Returns {backorder_id: order_id} for backorders the new stock filled
+    with transaction() as conn:
+        cursor = conn.execute('UPDATE materials SET quantity = quantity + ? WHERE id = ?', (quantity, material_id))
+        if cursor.rowcount:
+            _record_movements(conn, [(material_id, quantity, None)], 'adjust')
+        filled = _stock_arrived(conn, [material_id] if cursor.rowcount and quantity > 0 else [])
+    return filled
 
+@_mutates
+def receive_stock(receipts):
+    # Books a whole delivery (e.g. one invoice) of (material_id, quantity)
+    # receipts in a single transaction: either every line is applied or none.
+    # Returns {backorder_id: order_id} for backorders the receipt filled.
+    totals = {}
+    for material_id, quantity in receipts:
+        if quantity <= 0:
+            raise ValueError("Received quantity must be positive")
+        totals[material_id] = totals.get(material_id, 0) + quantity
+    if not totals:
+        return {}
+    with transaction() as conn:
+        cursor = conn.executemany('UPDATE materials SET quantity = quantity + ? WHERE id = ?',
+                                  [(quantity, material_id) for material_id, quantity in totals.items()])
+        if cursor.rowcount != len(totals):
+            raise ValueError("Material does not exist")
+        _record_movements(conn, [(material_id, quantity, None) for material_id, quantity in totals.items()],
+                          'receipt')
+        filled = _stock_arrived(conn, totals)
+    return filled
+
+@_mutates
 def delete_material(material_id):
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    
-    # Check if material is used in any BOM
-    cursor.execute('SELECT COUNT(*) FROM bom WHERE material_id = ?', (material_id,))
-    if cursor.fetchone()[0] > 0:
-        conn.close()
-        raise ValueError("Material is used in a product BOM and cannot be deleted")
-    
-    cursor.execute('DELETE FROM materials WHERE id = ?', (material_id,))
-    conn.commit()
-    conn.close()
-
-def get_inventory():
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, name, quantity FROM materials ORDER BY id')
-    inventory = cursor.fetchall()
-    conn.close()
-    return inventory
+    with transaction() as conn:
+        # Check if material is used in any BOM
+        cursor = conn.execute('SELECT COUNT(*) FROM bom WHERE material_id = ?', (material_id,))
+        if cursor.fetchone()[0] > 0:
+            raise ValueError("Material is used in a product BOM and cannot be deleted")
+
+        conn.execute('DELETE FROM materials WHERE id = ?', (material_id,))
+
+def material_names_version():
+    # Changes when a material is added, deleted or renamed, also by another
+    # process; stock changes leave it alone. Not cached: it is one row.
+    with connection() as conn:
+        return conn.execute('SELECT version FROM material_names_version').fetchone()[0]
+
+@_cached
+def get_inventory(result='rows'):
+    with connection() as conn:
+        return _fetch(conn.execute('SELECT id, name, quantity FROM materials ORDER BY id'),
+                      ('id', 'name', 'quantity'), result)
 
 # Product and BOM management functions
-def add_product(name, bom):
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
+def _write_bom(conn, product_id, bom, components):
+    # BOM lines are raw materials (material_id, qty); components are
+    # sub-assemblies (product_id, qty). A product may not contain itself,
+    # directly or through any of its components.
+    bom, components = list(bom), list(components)
+    material_ids = sorted({material_id for material_id, _ in bom})
+    if material_ids:
+        known = conn.execute('''
+            SELECT COUNT(*) FROM materials WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(material_ids),)).fetchone()[0]
+        if known != len(material_ids):
+            raise ValueError("Material does not exist")
+    component_ids = sorted({component_id for component_id, _ in components})
+    if component_ids:
+        known = conn.execute('''
+            SELECT COUNT(*) FROM products WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(component_ids),)).fetchone()[0]
+        if known != len(component_ids):
+            raise ValueError("Sub-assembly product does not exist")
+        cycle = conn.execute('''
+            WITH RECURSIVE below(id) AS (
+                SELECT value FROM json_each(?)
+                UNION
+                SELECT c.component_id FROM product_components c JOIN below ON c.product_id = below.id
+            )
+            SELECT 1 FROM below WHERE id = ? LIMIT 1
+        ''', (json.dumps(component_ids), product_id)).fetchone()
+        if cycle:
+            raise ValueError("Sub-assembly would make the product contain itself")
+
+    conn.executemany('''
+        INSERT INTO bom (product_id, material_id, quantity)
+        VALUES (?, ?, ?)
+    ''', [(product_id, material_id, quantity) for material_id, quantity in bom])
+    conn.executemany('''
+        INSERT INTO product_components (product_id, component_id, quantity)
+        VALUES (?, ?, ?)
+    ''', [(product_id, component_id, quantity) for component_id, quantity in components])
+
+def _bom_written():
+    # Called inside every transaction that changes BOM or product rows: until
+    # it ends, BOM explosions on this thread read the tables directly
+    # instead of the shared memo, which only holds committed BOMs
+    _tx.bom_written = True
+    _after_transaction(_bom_write_ended)
+
+def _bom_write_ended():
+    _tx.bom_written = False
+
+@_mutates
+def add_product(name, bom, components=()):
     try:
-        # Add product
-        cursor.execute('INSERT INTO products (name) VALUES (?)', (name,))
-        product_id = cursor.lastrowid
-        
-        # Add BOM entries
-        for material_id, quantity in bom:
-            cursor.execute('''
-                INSERT INTO bom (product_id, material_id, quantity)
-                VALUES (?, ?, ?)
-            ''', (product_id, material_id, quantity))
-        
-        conn.commit()
+        with transaction() as conn:
+            # Add product
+            cursor = conn.execute('INSERT INTO products (name) VALUES (?)', (name,))
+            product_id = cursor.lastrowid
+            _bom_written()
+
+            # Add BOM entries
+            _write_bom(conn, product_id, bom, components)
     except sqlite3.IntegrityError:
         raise ValueError("Product with this name already exists")
-    finally:
-        conn.close()
+    return product_id
+
+@_mutates
+def update_bom(product_id, bom, components=()):
+    # Replace a product's materials and sub-assemblies
+    with transaction() as conn:
+        _bom_written()
+        conn.execute('DELETE FROM bom WHERE product_id = ?', (product_id,))
+        conn.execute('DELETE FROM product_components WHERE product_id = ?', (product_id,))
+        _write_bom(conn, product_id, bom, components)
+
+@_cached
+def get_products(limit=None, after=None, result='rows'):
+    # Keyset pagination by id: `after` is the last product id already seen
+    with connection() as conn:
+        return _fetch(conn.execute('''
+            SELECT id, name FROM products
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (after or 0, -1 if limit is None else limit)), ('id', 'name'), result)
 
-def get_products():
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, name FROM products ORDER BY id')
-    products = cursor.fetchall()
-    conn.close()
-    return products
+# Name search for pickers: every word of the query is matched as a prefix
+# through the FTS index, so the cost depends on the matches, not the table
+# size. Best matches first (FTS rank, then shorter names); an empty query
+# returns the first `limit` rows by id.
+SEARCH_LIMIT = 50
 
+def _fts_query(text):
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text.replace('ı', 'i')))
+
+def _search(table, columns, query, limit):
+    match = _fts_query(query or '')
+    with connection() as conn:
+        if not match:
+            return conn.execute(f'SELECT {columns} FROM {table} ORDER BY id LIMIT ?', (limit,)).fetchall()
+        return conn.execute(f'''
+            SELECT {', '.join('t.' + column for column in columns.split(', '))}
+            FROM {table}_fts f
+            JOIN {table} t ON t.id = f.rowid
+            WHERE {table}_fts MATCH ?
+            ORDER BY f.rank, length(t.name), t.id
+            LIMIT ?
+        ''', (match, limit)).fetchall()
+
+@_cached
+def search_materials(query, limit=SEARCH_LIMIT):
+    # (id, name, quantity) of the best matching materials
+    return _search('materials', 'id, name, quantity', query, limit)
+
+@_cached
+def search_products(query, limit=SEARCH_LIMIT):
+    # (id, name) of the best matching products
+    return _search('products', 'id, name', query, limit)
+
+def find_products(names):
+    # {name: id} of the products with exactly these names, e.g. to resolve
+    # names read from a file without loading every product
+    with connection() as conn:
+        return dict(conn.execute('''
+            SELECT name, id FROM products WHERE name IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(sorted(set(names))),)))
+
+@_cached
 def get_bom(product_id):
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT m.id, m.name, b.quantity 
-        FROM bom b
-        JOIN materials m ON b.material_id = m.id
-        WHERE b.product_id = ?
-    ''', (product_id,))
-    bom = cursor.fetchall()
-    conn.close()
-    return bom
+    # Raw material requirement per unit, with sub-assemblies exploded
+    return get_boms([product_id])[product_id]
+
+def get_boms(product_ids):
+    # Exploded BOMs of many products, grouped by product id. Products
+    # without a BOM map to an empty list.
+    return _get_boms(tuple(product_ids))
 
+def _named_boms(exploded):
+    material_ids = sorted({material_id for required in exploded.values() for material_id in required})
+    with connection() as conn:
+        names = dict(conn.execute('''
+            SELECT id, name FROM materials WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(material_ids),)))
+    return {product_id: [(material_id, names[material_id], quantity)
+                         for material_id, quantity in sorted(required.items()) if material_id in names]
+            for product_id, required in exploded.items()}
+
+@_cached
+def _get_boms(product_ids):
+    return _named_boms(_explosion.explode_many(product_ids))
+
+@_cached
+def get_all_boms():
+    boms = _named_boms(_explosion.explode_all())
+    return {product_id: bom for product_id, bom in boms.items() if bom}
+
+@_cached
+def get_bom_lines(product_id):
+    # Direct BOM lines of one product: ('material' | 'product', id, name, qty)
+    with connection() as conn:
+        return conn.execute('''
+            SELECT 'material', m.id, m.name, b.quantity
+            FROM bom b
+            JOIN materials m ON b.material_id = m.id
+            WHERE b.product_id = ?
+            UNION ALL
+            SELECT 'product', p.id, p.name, c.quantity
+            FROM product_components c
+            JOIN products p ON c.component_id = p.id
+            WHERE c.product_id = ?
+        ''', (product_id, product_id)).fetchall()
+
+@_mutates
 def delete_product(product_id):
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    
-    # Delete BOM first
-    cursor.execute('DELETE FROM bom WHERE product_id = ?', (product_id,))
-    # Delete product
-    cursor.execute('DELETE FROM products WHERE id = ?', (product_id,))
-    
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        # Check if product is a sub-assembly of another product
+        cursor = conn.execute('SELECT COUNT(*) FROM product_components WHERE component_id = ?', (product_id,))
+        if cursor.fetchone()[0] > 0:
+            raise ValueError("Product is used as a sub-assembly and cannot be deleted")
+        cursor = conn.execute("SELECT COUNT(*) FROM backorders WHERE product_id = ? AND status = 'waiting'",
+                              (product_id,))
+        if cursor.fetchone()[0] > 0:
+            raise ValueError("Product has waiting backorders and cannot be deleted")
+
+        # Delete BOM first
+        _bom_written()
+        conn.execute('DELETE FROM bom WHERE product_id = ?', (product_id,))
+        conn.execute('DELETE FROM product_components WHERE product_id = ?', (product_id,))
+        # Delete product
+        conn.execute('DELETE FROM products WHERE id = ?', (product_id,))
 
 # Order management functions
+def _shortages(conn, product_id, quantity):
+    # Exploded raw material needs, then their stock in a single query. Returns
+    # (material_id, name, needed, current) lines and the subset that is short.
+    required = _explosion.explode(product_id)
+    lines = [(material_id, name, required[material_id] * quantity, current)
+             for material_id, name, current in conn.execute('''
+                 SELECT id, name, quantity FROM materials
+                 WHERE id IN (SELECT value FROM json_each(?))
+             ''', (json.dumps(sorted(required)),))]
+    return lines, [line for line in lines if line[3] < line[2]]
+
+def _place_order(conn, product_id, quantity):
+    # place_order inside an open write transaction
+    lines, short = _shortages(conn, product_id, quantity)
+    if short:
+        return False, [(name, needed - current) for _, name, needed, current in short]
+
+    # Guarded decrements; a row that would go negative is not updated
+    before = conn.total_changes
+    conn.executemany('''
+        UPDATE materials
+        SET quantity = quantity - ?
+        WHERE id = ? AND quantity >= ?
+    ''', [(needed, material_id, needed) for material_id, _, needed, _ in lines])
+    if conn.total_changes - before != len(lines):
+        raise RuntimeError("Stock changed while the order was being placed")
+
+    # Create order record
+    now = datetime.now()
+    order_id = conn.execute('''
+        INSERT INTO orders (product_id, quantity, timestamp, created_at)
+        VALUES (?, ?, ?, ?)
+    ''', (product_id, quantity, now.strftime('%Y-%m-%d %H:%M:%S'), int(now.timestamp()))).lastrowid
+
+    # Create order details
+    conn.executemany('''
+        INSERT INTO order_details (order_id, material_id, quantity_used)
+        VALUES (?, ?, ?)
+    ''', [(order_id, material_id, needed) for material_id, _, needed, _ in lines])
+    _record_movements(conn, [(material_id, -needed, order_id) for material_id, _, needed, _ in lines],
+                      'order', int(now.timestamp()))
+    _record_consumption(conn, [(material_id, needed) for material_id, _, needed, _ in lines], now.date())
+
+    return True, order_id
+
+@_mutates
 def place_order(product_id, quantity):
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    try:
-        # Get BOM and calculate required materials
-        bom = get_bom(product_id)
-        required = {}
-        for material_id, name, qty in bom:
-            required[material_id] = qty * quantity
-        
-        # Check stock availability
-        insufficient = []
-        for material_id, needed in required.items():
-            cursor.execute('SELECT quantity FROM materials WHERE id = ?', (material_id,))
-            current = cursor.fetchone()[0]
-            if current < needed:
-                insufficient.append((name, needed - current))
-        
-        if insufficient:
-            return False, insufficient
-        
-        # Start transaction
-        conn.execute("BEGIN")
-        
-        # Update material quantities
-        for material_id, needed in required.items():
-            cursor.execute('''
-                UPDATE materials 
-                SET quantity = quantity - ? 
-                WHERE id = ?
-            ''', (needed, material_id))
-        
-        # Create order record
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        cursor.execute('''
-            INSERT INTO orders (product_id, quantity, timestamp)
+    # One write transaction: the stock check, the decrements and the order rows
+    # all happen under the same lock, so concurrent orders cannot both pass the
+    # check and drive a material negative.
+    if quantity <= 0:
+        raise ValueError("Quantity must be positive")
+    with transaction() as conn:
+        if conn.execute('SELECT 1 FROM products WHERE id = ?', (product_id,)).fetchone() is None:
+            raise ValueError("Product does not exist")
+        return _place_order(conn, product_id, quantity)
+
+@_mutates
+def place_orders(orders, atomic=True):
+    # Place many (product_id, quantity) orders in one write transaction and
+    # return one place_order-style (success, order_id | insufficient) result per
+    # order. With atomic=True either every order is placed or none is; orders
+    # that would have fitted but were rolled back get (False, []). With
+    # atomic=False orders are filled first-come-first-served from the stock left
+    # by the orders before them.
+    orders = [(int(product_id), int(quantity)) for product_id, quantity in orders]
+    if any(quantity <= 0 for _, quantity in orders):
+        raise ValueError("Quantity must be positive")
+    if not orders:
+        return []
+
+    with transaction() as conn:
+        product_ids = sorted({product_id for product_id, _ in orders})
+        known = conn.execute('''
+            SELECT COUNT(*) FROM products WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(product_ids),)).fetchone()[0]
+        if known != len(product_ids):
+            raise ValueError("Product does not exist")
+
+        # Exploded BOMs of every product involved
+        boms = {product_id: list(required.items()) for product_id, required in
+                _explosion.explode_many(product_ids).items()}
+
+        # Current stock for every material any of the orders needs
+        material_ids = sorted({material_id for bom in boms.values() for material_id, _ in bom})
+        stock, names = {}, {}
+        for material_id, name, quantity in conn.execute('''
+            SELECT id, name, quantity FROM materials
+            WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(material_ids),)):
+            stock[material_id] = quantity
+            names[material_id] = name
+
+        # Aggregate demand; if everything fits there is nothing to arbitrate
+        demand = {}
+        for product_id, quantity in orders:
+            for material_id, qty in boms.get(product_id, ()):
+                demand[material_id] = demand.get(material_id, 0) + qty * quantity
+
+        accepted = [True] * len(orders)
+        results = [None] * len(orders)
+        if any(stock.get(material_id, 0) < needed for material_id, needed in demand.items()):
+            remaining = dict(stock)
+            for index, (product_id, quantity) in enumerate(orders):
+                bom = boms.get(product_id, ())
+                insufficient = [(names[material_id], qty * quantity - remaining.get(material_id, 0))
+                                for material_id, qty in bom
+                                if remaining.get(material_id, 0) < qty * quantity]
+                if insufficient:
+                    accepted[index] = False
+                    results[index] = (False, insufficient)
+                    continue
+                for material_id, qty in bom:
+                    remaining[material_id] -= qty * quantity
+            if atomic and not all(accepted):
+                return [result or (False, []) for result in results]
+            demand = {material_id: stock[material_id] - left
+                      for material_id, left in remaining.items() if left != stock[material_id]}
+
+        # Guarded set-based decrement of the aggregated demand
+        before = conn.total_changes
+        conn.executemany('''
+            UPDATE materials
+            SET quantity = quantity - ?
+            WHERE id = ? AND quantity >= ?
+        ''', [(needed, material_id, needed) for material_id, needed in demand.items()])
+        if conn.total_changes - before != len(demand):
+            raise RuntimeError("Stock changed while the orders were being placed")
+
+        # Order ids are assigned up front so both tables can be bulk-inserted
+        next_id = conn.execute('''
+            SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'orders'), 0),
+                       COALESCE((SELECT MAX(id) FROM orders), 0)) + 1
+        ''').fetchone()[0]
+        now = datetime.now()
+        timestamp, created_at = now.strftime('%Y-%m-%d %H:%M:%S'), int(now.timestamp())
+        order_rows, detail_rows = [], []
+        for index, (product_id, quantity) in enumerate(orders):
+            if not accepted[index]:
+                continue
+            order_id = next_id
+            next_id += 1
+            order_rows.append((order_id, product_id, quantity, timestamp, created_at))
+            detail_rows.extend((order_id, material_id, qty * quantity)
+                               for material_id, qty in boms.get(product_id, ()))
+            results[index] = (True, order_id)
+
+        conn.executemany('''
+            INSERT INTO orders (id, product_id, quantity, timestamp, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', order_rows)
+        conn.executemany('''
+            INSERT INTO order_details (order_id, material_id, quantity_used)
             VALUES (?, ?, ?)
-        ''', (product_id, quantity, timestamp))
-        order_id = cursor.lastrowid
-        
-        # Create order details
-        for material_id, needed in required.items():
-            cursor.execute('''
-                INSERT INTO order_details (order_id, material_id, quantity_used)
-                VALUES (?, ?, ?)
-            ''', (order_id, material_id, needed))
-        
-        conn.commit()
-        return True, order_id
-    except Exception as e:
-        conn.rollback()
-        raise e
+        ''', detail_rows)
+        _record_movements(conn, [(material_id, -needed, order_id) for order_id, material_id, needed in detail_rows],
+                          'order', created_at)
+        _record_consumption(conn, [(material_id, needed) for _, material_id, needed in detail_rows], now.date())
+
+        return results
+
+def _order_range(start=None, end=None):
+    # Epoch bounds of an inclusive date range (see _epoch); a bare `start`
+    # date means the start of that day
+    if start is not None:
+        if isinstance(start, str) and len(start) <= 10:
+            start = date.fromisoformat(start)
+        if isinstance(start, date) and not isinstance(start, datetime):
+            start = datetime.combine(start, datetime.min.time())
+        start = _epoch(start)
+    return start, None if end is None else _epoch(end)
+
+def _order_filter(cursor=None, start=None, end=None, product_id=None):
+    # WHERE clause over orders o. Pagination is keyset over (created_at, id),
+    # newest first: `cursor` is the (created_at, id) of the last order on the
+    # previous page (see _order_cursor). Filters: orders of `product_id`
+    # created between `start` and `end` (see _order_range).
+    # idx_orders_created_at serves the date range, idx_orders_product the
+    # product filter; archives carry the same indexes.
+    conditions, params = [], []
+    if cursor is not None:
+        conditions.append('(o.created_at, o.id) < (?, ?)')
+        params.extend(cursor)
+    start, end = _order_range(start, end)
+    if start is not None:
+        conditions.append('o.created_at >= ?')
+        params.append(start)
+    if end is not None:
+        conditions.append('o.created_at <= ?')
+        params.append(end)
+    if product_id is not None:
+        conditions.append('o.product_id = ?')
+        params.append(product_id)
+    return ('WHERE ' + ' AND '.join(conditions) if conditions else ''), tuple(params)
+
+def _history_rows(conn, sql, limit=None, after=None, start=None, end=None, product_id=None):
+    # Runs a history query on the live tables, then on the archived months
+    # the filters reach, newest first, until `limit` orders are found; an
+    # archive is attached only when the page is not full yet. `sql` reads
+    # {db}.orders o and {db}.order_details, takes {where}, ends in LIMIT ?
+    # (counting orders) and returns the order id first, rows of one order
+    # adjacent.
+    cursor = _order_cursor(conn, after)
+    where, params = _order_filter(cursor, start, end, product_id)
+    sql = sql.replace('{where}', where)
+    remaining = limit
+    for month in [None] + [month for month, _, _, _ in _archive_months(conn, start, end, product_id, cursor)]:
+        if remaining == 0:
+            return
+        with _attached(conn, month) as (reader, db):
+            last = None
+            for row in reader.execute(sql.replace('{db}', db), params + (-1 if remaining is None else remaining,)):
+                if remaining is not None and row[0] != last:
+                    remaining -= 1
+                last = row[0]
+                yield row
+
+@_cached
+def get_order_history(limit=None, after=None, result='rows'):
+    with connection() as conn:
+        return _fetch(_history_rows(conn, '''
+            SELECT o.id, p.name, o.quantity, o.timestamp
+            FROM {db}.orders o
+            JOIN main.products p ON o.product_id = p.id
+            {where}
+            ORDER BY o.created_at DESC, o.id DESC
+            LIMIT ?
+        ''', limit, after), ORDER_COLUMNS, result)
+
+@_cached
+def get_order_history_detailed(limit=None, after=None, result='rows'):
+    # `limit` counts orders, not detail rows
+    with connection() as conn:
+        return _fetch(_history_rows(conn, '''
+            WITH page AS (
+                SELECT o.id, o.product_id, o.quantity, o.timestamp, o.created_at
+                FROM {db}.orders o
+                {where}
+                ORDER BY o.created_at DESC, o.id DESC
+                LIMIT ?
+            )
+            SELECT o.id, p.name, o.quantity, o.timestamp, m.name, od.quantity_used
+            FROM page o
+            JOIN main.products p ON o.product_id = p.id
+            JOIN {db}.order_details od ON o.id = od.order_id
+            JOIN main.materials m ON od.material_id = m.id
+            ORDER BY o.created_at DESC, o.id DESC
+        ''', limit, after), ORDER_COLUMNS + ('material', 'quantity_used'), result)
+
+@_cached
+def get_orders(limit=None, after=None, start=None, end=None, product_id=None, result='rows'):
+    # One row per order, newest first: (order_id, product, quantity,
+    # timestamp, material lines, total quantity used). The material breakdown
+    # of an order comes from get_order_details.
+    with connection() as conn:
+        return _fetch(_history_rows(conn, '''
+            WITH page AS (
+                SELECT o.id, o.product_id, o.quantity, o.timestamp, o.created_at
+                FROM {db}.orders o
+                {where}
+                ORDER BY o.created_at DESC, o.id DESC
+                LIMIT ?
+            )
+            SELECT o.id, p.name, o.quantity, o.timestamp,
+                   (SELECT COUNT(*) FROM {db}.order_details od WHERE od.order_id = o.id),
+                   (SELECT COALESCE(SUM(od.quantity_used), 0) FROM {db}.order_details od WHERE od.order_id = o.id)
+            FROM page o
+            JOIN main.products p ON o.product_id = p.id
+            ORDER BY o.created_at DESC, o.id DESC
+        ''', limit, after, start, end, product_id), ORDER_COLUMNS + ('materials', 'total_used'), result)
+
+@_cached
+def get_order_details(order_id):
+    # (material_id, material name, quantity used) of one order, live or archived
+    with connection() as conn:
+        for month in [None] + _archive_months_for_order(conn, order_id):
+            with _attached(conn, month) as (reader, db):
+                rows = reader.execute(f'''
+                    SELECT m.id, m.name, od.quantity_used
+                    FROM {db}.order_details od
+                    JOIN main.materials m ON m.id = od.material_id
+                    WHERE od.order_id = ?
+                    ORDER BY m.name
+                ''', (order_id,)).fetchall()
+            if rows:
+                return rows
+        return []
+
+# Backorders: orders that could not be placed for lack of stock wait in a
+# queue, highest priority first and FIFO within a priority. Each waiting
+# backorder is indexed under the materials it is short of; a stock increase
+# retries only the backorders indexed under the replenished materials, in
+# queue order, inside the same transaction. A backorder that still cannot be
+# filled is re-indexed under its current shortages and does not hold up
+# smaller backorders behind it.
+def _index_backorder(conn, backorder_id, material_ids):
+    conn.execute('DELETE FROM backorder_materials WHERE backorder_id = ?', (backorder_id,))
+    conn.executemany('INSERT INTO backorder_materials (material_id, backorder_id) VALUES (?, ?)',
+                     [(material_id, backorder_id) for material_id in material_ids])
+
+def _close_backorder(conn, backorder_id, status, order_id=None):
+    conn.execute('''
+        UPDATE backorders SET status = ?, order_id = ?, closed_at = ? WHERE id = ?
+    ''', (status, order_id, int(time.time()), backorder_id))
+    conn.execute('DELETE FROM backorder_materials WHERE backorder_id = ?', (backorder_id,))
+
+def _fill_backorders(conn, backorders):
+    # Tries (id, product_id, quantity) backorders in the given order and
+    # returns {backorder_id: order_id} for the ones that became orders
+    filled = {}
+    for backorder_id, product_id, quantity in backorders:
+        _, short = _shortages(conn, product_id, quantity)
+        if short:
+            _index_backorder(conn, backorder_id, [material_id for material_id, _, _, _ in short])
+            continue
+        _, order_id = _place_order(conn, product_id, quantity)
+        _close_backorder(conn, backorder_id, 'fulfilled', order_id)
+        filled[backorder_id] = order_id
+    return filled
+
+def _stock_arrived(conn, material_ids):
+    # Called inside the transaction of every function that raises stock
+    material_ids = sorted(set(material_ids))
+    if not material_ids:
+        return {}
+    waiting = conn.execute('''
+        SELECT id, product_id, quantity FROM backorders
+        WHERE id IN (
+            SELECT backorder_id FROM backorder_materials
+            WHERE material_id IN (SELECT value FROM json_each(?))
+        )
+        ORDER BY priority DESC, id
+    ''', (json.dumps(material_ids),)).fetchall()
+    return _fill_backorders(conn, waiting)
+
+@_mutates
+def queue_backorder(product_id, quantity, priority=0):
+    # Queues an order that place_order could not fill. If the stock is there
+    # by now it is placed right away. Returns (backorder_id, order_id or None).
+    if quantity <= 0:
+        raise ValueError("Quantity must be positive")
+    with transaction() as conn:
+        if conn.execute('SELECT 1 FROM products WHERE id = ?', (product_id,)).fetchone() is None:
+            raise ValueError("Product does not exist")
+        backorder_id = conn.execute('''
+            INSERT INTO backorders (product_id, quantity, priority, created_at) VALUES (?, ?, ?, ?)
+        ''', (product_id, quantity, priority, int(time.time()))).lastrowid
+        filled = _fill_backorders(conn, [(backorder_id, product_id, quantity)])
+        return backorder_id, filled.get(backorder_id)
+
+@_mutates
+def cancel_backorder(backorder_id):
+    with transaction() as conn:
+        row = conn.execute('SELECT status FROM backorders WHERE id = ?', (backorder_id,)).fetchone()
+        if row is None or row[0] != 'waiting':
+            raise ValueError("Backorder is not waiting")
+        _close_backorder(conn, backorder_id, 'cancelled')
+
+@_mutates
+def retry_backorders():
+    # Retries the whole queue, e.g. after a BOM change; stock increases
+    # already retry the backorders they affect
+    with transaction() as conn:
+        return _fill_backorders(conn, conn.execute('''
+            SELECT id, product_id, quantity FROM backorders
+            WHERE status = 'waiting' ORDER BY priority DESC, id
+        ''').fetchall())
+
+@_cached
+def get_backorders(status='waiting', limit=None):
+    # (id, product name, quantity, priority, queued at, status, order_id,
+    # materials it waits for) in queue order for waiting backorders, most
+    # recently closed first otherwise
+    order = 'b.priority DESC, b.id' if status == 'waiting' else 'b.closed_at DESC, b.id DESC'
+    with connection() as conn:
+        return conn.execute(f'''
+            SELECT b.id, p.name, b.quantity, b.priority,
+                   datetime(b.created_at, 'unixepoch', 'localtime'), b.status, b.order_id,
+                   (SELECT group_concat(m.name, ', ') FROM backorder_materials bm
+                    JOIN materials m ON m.id = bm.material_id
+                    WHERE bm.backorder_id = b.id)
+            FROM backorders b
+            JOIN products p ON p.id = b.product_id
+            WHERE b.status = ?
+            ORDER BY {order}
+            LIMIT ?
+        ''', (status, -1 if limit is None else limit)).fetchall()
+
+# Aggregate counts, read from the trigger-maintained row_counts table
+def _count(table):
+    with connection() as conn:
+        row = conn.execute('SELECT rows FROM row_counts WHERE name = ?', (table,)).fetchone()
+    return row[0] if row else 0
+
+@_cached
+def count_materials():
+    return _count('materials')
+
+@_cached
+def count_products():
+    return _count('products')
+
+@_cached
+def count_orders(start=None, end=None, product_id=None):
+    # Live orders plus archived ones. Unfiltered counts come from row_counts
+    # and the order_archive summary; filtered ones count the matching index
+    # range, attaching only the archived months the range cuts through.
+    where, params = _order_filter(None, start, end, product_id)
+    with connection() as conn:
+        if where:
+            total = conn.execute(f'SELECT COUNT(*) FROM orders o {where}', params).fetchone()[0]
+        else:
+            total = _count('orders')
+        low, high = _order_range(start, end)
+        for month, first, last, orders in _archive_months(conn, start, end, product_id):
+            if (low is None or low <= first) and (high is None or last <= high):
+                total += orders
+                continue
+            with _attached(conn, month) as (reader, db):
+                total += reader.execute(f'SELECT COUNT(*) FROM {db}.orders o {where}', params).fetchone()[0]
+        return total
+
+# Order archive. archive_orders moves old orders and their details out of
+# the live tables into one SQLite file per month (ARCHIVE_DIR/orders-YYYY-MM.db)
+# and adds per-month, per-product summary rows to order_archive. The history
+# readers and count_orders go through the live tables first and attach a
+# month's file only when the requested range or page reaches it; archived
+# orders are always older than live ones.
+def _archive_dir():
+    return ARCHIVE_DIR or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'archive')
+
+def _archive_path(month):
+    return os.path.join(_archive_dir(), f'orders-{month}.db')
+
+@contextmanager
+def _attached(conn, month):
+    # Yields (connection, schema) to read the archive of `month` through;
+    # month None stands for the live tables in main. The archive is attached
+    # as schema 'archive' for the block. Inside a transaction it could not be
+    # detached again, so it is read on a separate read-only connection that
+    # sees only committed rows. A connection that fails to detach is closed
+    # instead of going back to the pool.
+    if month is None:
+        yield conn, 'main'
+        return
+    path = _archive_path(month)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Order archive {path} is missing")
+    if conn.in_transaction:
+        reader = _read_pool._open()
+        try:
+            reader.execute('ATTACH DATABASE ? AS archive', (path,))
+            yield reader, 'archive'
+        finally:
+            reader.close()
+        return
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    try:
+        yield conn, 'archive'
     finally:
-        conn.close()
+        try:
+            conn.execute('DETACH DATABASE archive')
+        except sqlite3.OperationalError:
+            conn.discard = True
 
-def get_order_history():
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT DISTINCT o.id, p.name, o.quantity, o.timestamp
-        FROM orders o
-        JOIN products p ON o.product_id = p.id
-        ORDER BY o.timestamp DESC
+def _archive_months(conn, start=None, end=None, product_id=None, cursor=None):
+    # (month, first created_at, last created_at, orders) of the archived
+    # months holding orders of `product_id` in the range, before `cursor`,
+    # newest first
+    low, high = _order_range(start, end)
+    months = conn.execute('''
+        SELECT month, MIN(first_created_at), MAX(last_created_at), SUM(orders)
+        FROM order_archive
+        WHERE ? IS NULL OR product_id = ?
+        GROUP BY month
+        ORDER BY month DESC
+    ''', (product_id, product_id)).fetchall()
+    return [(month, first, last, orders) for month, first, last, orders in months
+            if (low is None or last >= low) and (high is None or first <= high)
+            and (cursor is None or first <= cursor[0])]
+
+def _archive_months_for_order(conn, order_id):
+    return [month for month, in conn.execute('''
+        SELECT month FROM order_archive
+        GROUP BY month
+        HAVING MIN(first_id) <= ? AND MAX(last_id) >= ?
+        ORDER BY month DESC
+    ''', (order_id, order_id))]
+
+def _order_cursor(conn, after):
+    # (created_at, id) of order `after`, live or archived
+    if after is None:
+        return None
+    row = conn.execute('SELECT created_at, id FROM orders WHERE id = ?', (after,)).fetchone()
+    for month in [] if row else _archive_months_for_order(conn, after):
+        with _attached(conn, month) as (reader, db):
+            row = reader.execute(f'SELECT created_at, id FROM {db}.orders WHERE id = ?', (after,)).fetchone()
+        if row:
+            break
+    if row is None:
+        raise ValueError("Order does not exist")
+    return tuple(row)
+
+def _open_archive(month):
+    # Archives use a rollback journal so each month stays a single file
+    os.makedirs(_archive_dir(), exist_ok=True)
+    archive = sqlite3.connect(_archive_path(month), timeout=BUSY_TIMEOUT)
+    archive.execute('PRAGMA journal_mode = DELETE')
+    archive.executescript('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            timestamp DATETIME NOT NULL,
+            created_at INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS order_details (
+            order_id INTEGER NOT NULL,
+            material_id INTEGER NOT NULL,
+            quantity_used INTEGER NOT NULL,
+            PRIMARY KEY(order_id, material_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at, id);
+        CREATE INDEX IF NOT EXISTS idx_orders_product ON orders(product_id, created_at, id);
     ''')
-    history = cursor.fetchall()
-    print(history)
-    conn.close()
-    return history
+    return archive
 
-def get_order_history_detailed():
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-         SELECT o.id, p.name, o.quantity, o.timestamp, m.name, od.quantity_used
-         FROM orders o
-         JOIN products p ON o.product_id = p.id
-         JOIN order_details od ON o.id = od.order_id
-         JOIN materials m ON od.material_id = m.id
-         ORDER BY o.timestamp DESC
+def _month_bounds(first, cutoff):
+    # (month, start, end) epochs of the local calendar months from the one
+    # holding `first` up to `cutoff`, the last one cut off there
+    day = datetime.fromtimestamp(first).date().replace(day=1)
+    while True:
+        start = int(datetime.combine(day, datetime.min.time()).timestamp())
+        if start >= cutoff:
+            return
+        day = (day + timedelta(days=32)).replace(day=1)
+        end = int(datetime.combine(day, datetime.min.time()).timestamp())
+        yield datetime.fromtimestamp(start).strftime('%Y-%m'), start, min(end, cutoff)
+
+def archive_orders(before):
+    # Moves orders created before `before` (a date means the start of that
+    # day) into the monthly archives. Each month is committed to its archive
+    # file first and then deleted from the live tables in a transaction of
+    # its own, so an interrupted run loses nothing and can be run again.
+    # Runs outside the write queue to keep the write lock per month.
+    # Returns {month: orders archived}.
+    cutoff, _ = _order_range(before)
+    if cutoff is None or cutoff > time.time():
+        raise ValueError("Archive cutoff must be a past date")
+    archived = {}
+    with connection() as conn:
+        first = conn.execute('SELECT MIN(created_at) FROM orders').fetchone()[0]
+        for month, start, end in _month_bounds(first, cutoff) if first is not None else ():
+            span = (start, end)
+            if conn.execute('SELECT 1 FROM orders WHERE created_at >= ? AND created_at < ? LIMIT 1',
+                            span).fetchone() is None:
+                continue
+            archive = _open_archive(month)
+            try:
+                with archive:
+                    archive.executemany('''
+                        INSERT OR IGNORE INTO orders (id, product_id, quantity, timestamp, created_at)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', conn.execute('''
+                        SELECT id, product_id, quantity, timestamp, created_at FROM orders
+                        WHERE created_at >= ? AND created_at < ?
+                    ''', span))
+                    archive.executemany('''
+                        INSERT OR IGNORE INTO order_details (order_id, material_id, quantity_used)
+                        VALUES (?, ?, ?)
+                    ''', conn.execute('''
+                        SELECT od.order_id, od.material_id, od.quantity_used
+                        FROM orders o
+                        JOIN order_details od ON od.order_id = o.id
+                        WHERE o.created_at >= ? AND o.created_at < ?
+                    ''', span))
+                copied = archive.execute('SELECT COUNT(*) FROM orders WHERE created_at >= ? AND created_at < ?',
+                                         span).fetchone()[0]
+            finally:
+                archive.close()
+
+            with transaction() as conn:
+                summary = conn.execute('''
+                    SELECT product_id, COUNT(*), SUM(quantity), MIN(id), MAX(id), MIN(created_at), MAX(created_at)
+                    FROM orders
+                    WHERE created_at >= ? AND created_at < ?
+                    GROUP BY product_id
+                ''', span).fetchall()
+                orders = sum(row[1] for row in summary)
+                if copied < orders:
+                    raise RuntimeError(f"Archive for {month} is incomplete; live orders were kept")
+                conn.executemany('''
+                    INSERT INTO order_archive (month, product_id, orders, quantity, first_id, last_id,
+                                               first_created_at, last_created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (month, product_id) DO UPDATE SET
+                        orders = orders + excluded.orders,
+                        quantity = quantity + excluded.quantity,
+                        first_id = MIN(first_id, excluded.first_id),
+                        last_id = MAX(last_id, excluded.last_id),
+                        first_created_at = MIN(first_created_at, excluded.first_created_at),
+                        last_created_at = MAX(last_created_at, excluded.last_created_at)
+                ''', [(month, *row) for row in summary])
+                conn.execute('''
+                    DELETE FROM order_details
+                    WHERE order_id IN (SELECT id FROM orders WHERE created_at >= ? AND created_at < ?)
+                ''', span)
+                conn.execute('DELETE FROM orders WHERE created_at >= ? AND created_at < ?', span)
+                _after_transaction(_bump_data_version)
+            archived[month] = orders
+    return archived
+
+@_cached
+def get_order_archives():
+    # (month, orders, first order time, last order time) per archived month,
+    # newest first
+    with connection() as conn:
+        return conn.execute('''
+            SELECT month, SUM(orders),
+                   datetime(MIN(first_created_at), 'unixepoch', 'localtime'),
+                   datetime(MAX(last_created_at), 'unixepoch', 'localtime')
+            FROM order_archive
+            GROUP BY month
+            ORDER BY month DESC
+        ''').fetchall()
+
+# Consumption rollups. consumption_daily/consumption_weekly hold the material
+# used by orders per day and per week (keyed by the week's Monday); the order
+# functions add to them in the order's transaction, so trend and
+# days-of-cover queries read at most one row per material and period no
+# matter how long the order history is.
+def _consumption_periods(day):
+    return day.isoformat(), (day - timedelta(days=day.weekday())).isoformat()
+
+
+def _record_consumption(conn, usage, day):
+    # usage: (material_id, quantity) pairs used on `day` (a date)
+    totals = {}
+    for material_id, quantity in usage:
+        totals[material_id] = totals.get(material_id, 0) + quantity
+    for table, period in zip(('consumption_daily', 'consumption_weekly'), _consumption_periods(day)):
+        conn.executemany(f'''
+            INSERT INTO {table} VALUES (?, ?, ?)
+            ON CONFLICT DO UPDATE SET quantity = quantity + excluded.quantity
+        ''', [(material_id, period, quantity) for material_id, quantity in totals.items()])
+
+
+def _rebuild_consumption(conn, archived=()):
+    # `archived`: (material_id, day, quantity) from _archived_consumption
+    conn.execute('DELETE FROM consumption_daily')
+    conn.execute('DELETE FROM consumption_weekly')
+    conn.execute('''
+        INSERT INTO consumption_daily (material_id, day, quantity)
+        SELECT od.material_id, date(o.timestamp), SUM(od.quantity_used)
+        FROM order_details od
+        JOIN orders o ON o.id = od.order_id
+        GROUP BY od.material_id, date(o.timestamp)
     ''')
-    history = cursor.fetchall()
-    print(history)
-    conn.close()
-    return history
+    conn.executemany('''
+        INSERT INTO consumption_daily (material_id, day, quantity) VALUES (?, ?, ?)
+        ON CONFLICT (material_id, day) DO UPDATE SET quantity = quantity + excluded.quantity
+    ''', archived)
+    conn.execute('''
+        INSERT INTO consumption_weekly (material_id, week, quantity)
+        SELECT material_id, date(day, 'weekday 0', '-6 days'), SUM(quantity)
+        FROM consumption_daily
+        GROUP BY material_id, date(day, 'weekday 0', '-6 days')
+    ''')
+
+
+def _archived_consumption():
+    # Daily consumption of the archived orders, read from each month's file
+    # directly (ATTACH is not possible inside the rebuild's transaction). A
+    # missing file is an error rather than a month without consumption.
+    with connection() as conn:
+        months = [month for month, in conn.execute('SELECT DISTINCT month FROM order_archive ORDER BY month')]
+    missing = [month for month in months if not os.path.exists(_archive_path(month))]
+    if missing:
+        raise FileNotFoundError(f"Order archives missing from {_archive_dir()}: {', '.join(missing)}")
+    rows = []
+    for month in months:
+        # Read-only: opening never creates a file
+        archive = sqlite3.connect(f'file:{urllib.request.pathname2url(os.path.abspath(_archive_path(month)))}?mode=ro',
+                                  uri=True)
+        try:
+            rows += archive.execute('''
+                SELECT od.material_id, date(o.timestamp), SUM(od.quantity_used)
+                FROM order_details od
+                JOIN orders o ON o.id = od.order_id
+                GROUP BY od.material_id, date(o.timestamp)
+            ''').fetchall()
+        finally:
+            archive.close()
+    return rows
+
+@_mutates
+def rebuild_consumption():
+    # Recomputes both rollups from order history, archived months included
+    # (e.g. after editing orders outside the backend)
+    archived = _archived_consumption()
+    with transaction() as conn:
+        _rebuild_consumption(conn, archived)
+
+
+@_cached
+def get_consumption(material_id=None, period='day', periods=30, today=None):
+    # Consumption of one material (or all) over the last `periods` days or
+    # weeks, oldest first, as (period_start, quantity) with empty periods as 0
+    if period not in ('day', 'week'):
+        raise ValueError("period must be 'day' or 'week'")
+    today = today or date.today()
+    if period == 'day':
+        starts = [today - timedelta(days=offset) for offset in range(periods - 1, -1, -1)]
+    else:
+        monday = today - timedelta(days=today.weekday())
+        starts = [monday - timedelta(weeks=offset) for offset in range(periods - 1, -1, -1)]
+    table = 'consumption_daily' if period == 'day' else 'consumption_weekly'
+    with connection() as conn:
+        if material_id is None:
+            rows = conn.execute(f'''
+                SELECT {period}, SUM(quantity) FROM {table}
+                WHERE {period} >= ? GROUP BY {period}
+            ''', (starts[0].isoformat(),))
+        else:
+            rows = conn.execute(f'''
+                SELECT {period}, quantity FROM {table}
+                WHERE material_id = ? AND {period} >= ?
+            ''', (material_id, starts[0].isoformat()))
+        used = dict(rows.fetchall())
+    return [(start.isoformat(), used.get(start.isoformat(), 0)) for start in starts]
+
+
+@_cached
+def get_days_of_cover(window=30, today=None):
+    # (material_id, name, on_hand, average daily use over the last `window`
+    # days, days of cover) per material, shortest cover first; cover is None
+    # for materials that were not used in the window
+    today = today or date.today()
+    start = (today - timedelta(days=window - 1)).isoformat()
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT m.id, m.name, m.quantity, COALESCE(c.used, 0)
+            FROM materials m
+            LEFT JOIN (
+                SELECT material_id, SUM(quantity) AS used FROM consumption_daily
+                WHERE day >= ? GROUP BY material_id
+            ) c ON c.material_id = m.id
+        ''', (start,)).fetchall()
+    result = []
+    for material_id, name, on_hand, used in rows:
+        daily = used / window
+        result.append((material_id, name, on_hand, daily, on_hand / daily if daily else None))
+    result.sort(key=lambda row: (row[4] is None, row[4] or 0, row[0]))
+    return result
+
+# Bulk import/export. Files are streamed in batches of IMPORT_BATCH_SIZE rows,
+# each batch upserted with executemany in its own transaction, so memory use
+# does not grow with the file. Bad rows are reported and skipped; at most
+# MAX_IMPORT_ERRORS of them are kept in the result.
+IMPORT_BATCH_SIZE = 5000
+MAX_IMPORT_ERRORS = 1000
+
+MATERIAL_COLUMNS = ('name', 'quantity')
+BOM_COLUMNS = ('product', 'material', 'quantity')
+
+
+def _file_format(source, fmt):
+    if fmt is not None:
+        return fmt
+    name = source if isinstance(source, str) else getattr(source, 'name', '')
+    return 'parquet' if str(name).lower().endswith('.parquet') else 'csv'
+
+
+_UNDECODED = re.compile('[\udc80-\udcff]')
+
+
+def _read_batches(source, fmt, columns, batch_size, encoding='utf-8-sig', result=None):
+    # Yields lists of (row_number, values) with values ordered like `columns`;
+    # row numbers count data rows from 1. CSV rows holding bytes that are not
+    # valid in `encoding` are reported to `result` and skipped.
+    if fmt == 'parquet':
+        if pq is None:
+            raise RuntimeError("pyarrow is required for Parquet files")
+        number = 0
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=batch_size, columns=list(columns)):
+            data = [batch.column(column).to_pylist() for column in columns]
+            rows = []
+            for values in zip(*data):
+                number += 1
+                rows.append((number, values))
+            yield rows
+        return
+
+    close = isinstance(source, str)
+    # surrogateescape keeps undecodable bytes as lone surrogates, so a bad
+    # row is found and skipped instead of aborting the import midway
+    if close:
+        text = open(source, newline='', encoding=encoding, errors='surrogateescape')
+    elif isinstance(source, io.TextIOBase):
+        text = source
+    else:
+        text = io.TextIOWrapper(source, newline='', encoding=encoding, errors='surrogateescape')
+    try:
+        reader = csv.DictReader(text)
+        missing = [column for column in columns if column not in (reader.fieldnames or ())]
+        if missing:
+            raise ValueError(f"Missing column(s): {', '.join(missing)}")
+        rows = []
+        for number, row in enumerate(reader, start=1):
+            values = tuple(row[column] for column in columns)
+            if any(value and _UNDECODED.search(value) for value in values):
+                if result is not None:
+                    result['rows'] += 1
+                    _import_error(result, number, f"not valid {encoding} text; check the file's encoding")
+                continue
+            rows.append((number, values))
+            if len(rows) >= batch_size:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+    finally:
+        if close:
+            text.close()
+        elif not isinstance(source, io.TextIOBase):
+            text.detach()
+
+
+def _parse_quantity(value, minimum):
+    quantity = int(str(value).strip())
+    if quantity < minimum:
+        raise ValueError(f"quantity must be at least {minimum}")
+    return quantity
+
+
+def _import_result():
+    return {'rows': 0, 'imported': 0, 'errors': 0, 'error_rows': []}
+
+
+def _import_error(result, number, message):
+    result['errors'] += 1
+    if len(result['error_rows']) < MAX_IMPORT_ERRORS:
+        result['error_rows'].append((number, message))
+
+
+def import_materials(source, fmt=None, mode='set', batch_size=IMPORT_BATCH_SIZE, encoding='utf-8-sig'):
+    # Columns: name, quantity. New names are inserted; for existing ones
+    # mode='set' overwrites the quantity and mode='add' adds to it. CSV
+    # files are read as `encoding` (e.g. 'cp1254' for Turkish Excel exports).
+    if mode not in ('set', 'add'):
+        raise ValueError("mode must be 'set' or 'add'")
+    result = _import_result()
+    # Earlier batches stay committed if a later one fails
+    for batch in _read_batches(source, _file_format(source, fmt), MATERIAL_COLUMNS, batch_size, encoding, result):
+        rows = []
+        for number, (name, quantity) in batch:
+            result['rows'] += 1
+            name = (name or '').strip()
+            if not name:
+                _import_error(result, number, "name is empty")
+                continue
+            try:
+                rows.append((name, _parse_quantity(quantity, 0)))
+            except (TypeError, ValueError) as e:
+                _import_error(result, number, f"invalid quantity {quantity!r}: {e}")
+        if rows:
+            _import_material_rows(rows, mode)
+        result['imported'] += len(rows)
+    return result
+
+
+@_mutates
+def _import_material_rows(rows, mode):
+    # One batch of import_materials. Each batch is a write of its own (one
+    # queued call in single-writer mode), so an import never holds the write
+    # lock for longer than a batch.
+    update = 'excluded.quantity' if mode == 'set' else 'quantity + excluded.quantity'
+    with transaction() as conn:
+        # Quantities before and after the upsert give the ledger deltas
+        names = json.dumps(sorted({name for name, _ in rows}))
+        lookup = '''
+            SELECT id, quantity FROM materials WHERE name IN (SELECT value FROM json_each(?))
+        '''
+        old = dict(conn.execute(lookup, (names,)))
+        conn.executemany(f'''
+            INSERT INTO materials (name, quantity) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET quantity = {update}
+        ''', rows)
+        movements = [(material_id, quantity - old.get(material_id, 0), None)
+                     for material_id, quantity in conn.execute(lookup, (names,))
+                     if material_id not in old or quantity != old[material_id]]
+        _record_movements(conn, movements, 'import')
+        _stock_arrived(conn, [material_id for material_id, delta, _ in movements if delta > 0])
+
+
+def import_boms(source, fmt=None, batch_size=IMPORT_BATCH_SIZE, encoding='utf-8-sig'):
+    # Columns: product, material, quantity (names). Unknown products are
+    # created; unknown materials are reported as row errors. An existing
+    # (product, material) line gets the new quantity. CSV files are read as
+    # `encoding`.
+    with connection() as conn:
+        material_ids = dict(conn.execute('SELECT name, id FROM materials'))
+        product_ids = dict(conn.execute('SELECT name, id FROM products'))
+    result = _import_result()
+    for batch in _read_batches(source, _file_format(source, fmt), BOM_COLUMNS, batch_size, encoding, result):
+        lines = []
+        for number, (product, material, quantity) in batch:
+            result['rows'] += 1
+            product, material = (product or '').strip(), (material or '').strip()
+            if not product:
+                _import_error(result, number, "product is empty")
+                continue
+            material_id = material_ids.get(material)
+            if material_id is None:
+                _import_error(result, number, f"unknown material {material!r}")
+                continue
+            try:
+                lines.append((product, material_id, _parse_quantity(quantity, 1)))
+            except (TypeError, ValueError) as e:
+                _import_error(result, number, f"invalid quantity {quantity!r}: {e}")
+        if lines:
+            product_ids.update(_import_bom_lines(lines, product_ids))
+        result['imported'] += len(lines)
+    return result
+
+
+@_mutates
+def _import_bom_lines(lines, product_ids):
+    # One batch of import_boms, written like _import_material_rows; returns
+    # {name: id} of the products it created
+    with transaction() as conn:
+        _bom_written()
+        new_products = sorted({product for product, _, _ in lines if product not in product_ids})
+        created = {}
+        if new_products:
+            conn.executemany('INSERT OR IGNORE INTO products (name) VALUES (?)',
+                             [(name,) for name in new_products])
+            created = dict(conn.execute('''
+                SELECT name, id FROM products WHERE name IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(new_products),)))
+        conn.executemany('''
+            INSERT INTO bom (product_id, material_id, quantity) VALUES (?, ?, ?)
+            ON CONFLICT(product_id, material_id) DO UPDATE SET quantity = excluded.quantity
+        ''', [(product_ids.get(product) or created[product], material_id, quantity)
+              for product, material_id, quantity in lines])
+    return created
+
+
+def _write_rows(dest, fmt, columns, cursor, batch_size):
+    # Streams cursor rows into dest (a path or a file object)
+    if fmt == 'parquet':
+        if pq is None:
+            raise RuntimeError("pyarrow is required for Parquet files")
+        writer = None
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                table = pa.table({column: list(values) for column, values in zip(columns, zip(*rows))})
+                if writer is None:
+                    writer = pq.ParquetWriter(dest, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        return
+
+    close = isinstance(dest, str)
+    if close:
+        text = open(dest, 'w', newline='', encoding='utf-8')
+    elif isinstance(dest, io.TextIOBase):
+        text = dest
+    else:
+        text = io.TextIOWrapper(dest, newline='', encoding='utf-8')
+    try:
+        writer = csv.writer(text)
+        writer.writerow(columns)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            writer.writerows(rows)
+    finally:
+        if close:
+            text.close()
+        else:
+            text.flush()
+            if not isinstance(dest, io.TextIOBase):
+                text.detach()
+
+
+def export_materials(dest, fmt=None, batch_size=IMPORT_BATCH_SIZE):
+    with connection() as conn:
+        cursor = conn.execute('SELECT name, quantity FROM materials ORDER BY id')
+        _write_rows(dest, _file_format(dest, fmt), MATERIAL_COLUMNS, cursor, batch_size)
+
+
+def export_boms(dest, fmt=None, batch_size=IMPORT_BATCH_SIZE):
+    # Direct raw-material lines only; the same format import_boms reads
+    with connection() as conn:
+        cursor = conn.execute('''
+            SELECT p.name, m.name, b.quantity
+            FROM bom b
+            JOIN products p ON b.product_id = p.id
+            JOIN materials m ON b.material_id = m.id
+            ORDER BY b.product_id, b.material_id
+        ''')
+        _write_rows(dest, _file_format(dest, fmt), BOM_COLUMNS, cursor, batch_size)
+
+
+# BOM explosion: flattens a product and all of its sub-assemblies into raw
+# material quantities per unit. The product graph is loaded once and every
+# product is exploded at most once (memoized). Before every explosion the
+# products stamped in bom_versions since the last look (by any process) get
+# their edges reloaded and their memo, and that of everything above them,
+# forgotten. The check runs on the caller's connection, so inside a write
+# transaction it sees the BOMs the transaction will commit against.
+class BomExplosion:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def reset(self):
+        with self._lock:
+            self._loaded = False
+
+    def _load(self, conn):
+        # The version is read before the rows: a change committed in between
+        # is applied again on the next sync, which is harmless
+        self.version = conn.execute('SELECT COALESCE(MAX(version), 0) FROM bom_versions').fetchone()[0]
+        self.materials = {}
+        self.components = {}
+        self.parents = {}
+        self.memo = {}
+        for product_id, material_id, qty in conn.execute('SELECT product_id, material_id, quantity FROM bom'):
+            self.materials.setdefault(product_id, {})[material_id] = qty
+        for product_id, component_id, qty in conn.execute(
+                'SELECT product_id, component_id, quantity FROM product_components'):
+            self.components.setdefault(product_id, {})[component_id] = qty
+            self.parents.setdefault(component_id, set()).add(product_id)
+        self._loaded = True
+
+    def _forget(self, product_id):
+        # Drop the memo of a product and of every product that contains it
+        stack = [product_id]
+        while stack:
+            current = stack.pop()
+            if self.memo.pop(current, None) is not None or current == product_id:
+                stack.extend(self.parents.get(current, ()))
+
+    def _sync(self, conn):
+        if not self._loaded:
+            self._load(conn)
+            return
+        changed = conn.execute('SELECT product_id, version FROM bom_versions WHERE version > ?',
+                               (self.version,)).fetchall()
+        if not changed:
+            return
+        self.version = max(version for _, version in changed)
+        dirty = sorted(product_id for product_id, _ in changed)
+        for product_id in dirty:
+            self._forget(product_id)
+            for component_id in self.components.pop(product_id, {}):
+                self.parents.get(component_id, set()).discard(product_id)
+            self.materials.pop(product_id, None)
+        ids = json.dumps(dirty)
+        for product_id, material_id, qty in conn.execute('''
+            SELECT product_id, material_id, quantity FROM bom
+            WHERE product_id IN (SELECT value FROM json_each(?))
+        ''', (ids,)):
+            self.materials.setdefault(product_id, {})[material_id] = qty
+        for product_id, component_id, qty in conn.execute('''
+            SELECT product_id, component_id, quantity FROM product_components
+            WHERE product_id IN (SELECT value FROM json_each(?))
+        ''', (ids,)):
+            self.components.setdefault(product_id, {})[component_id] = qty
+            self.parents.setdefault(component_id, set()).add(product_id)
+
+    def _explode(self, product_id, visiting):
+        required = self.memo.get(product_id)
+        if required is not None:
+            return required
+        if product_id in visiting:
+            raise ValueError("Product tree contains a cycle")
+        visiting.add(product_id)
+        required = dict(self.materials.get(product_id, {}))
+        for component_id, qty in self.components.get(product_id, {}).items():
+            for material_id, per_unit in self._explode(component_id, visiting).items():
+                required[material_id] = required.get(material_id, 0) + per_unit * qty
+        visiting.discard(product_id)
+        self.memo[product_id] = required
+        return required
+
+    def explode_many(self, product_ids):
+        # {product_id: {material_id: qty per unit}}; the dicts are shared
+        # with the memo and must not be modified
+        with connection() as conn:
+            if getattr(_tx, 'bom_written', False):
+                # This transaction changed BOMs and may still roll back:
+                # explode from a private copy of the graph
+                private = BomExplosion()
+                private._load(conn)
+                return {product_id: private._explode(product_id, set()) for product_id in product_ids}
+            with self._lock:
+                self._sync(conn)
+                return {product_id: self._explode(product_id, set()) for product_id in product_ids}
+
+    def explode(self, product_id):
+        return self.explode_many([product_id])[product_id]
+
+    def with_parents(self, product_ids):
+        # The products plus every product containing one of them, directly
+        # or through other sub-assemblies
+        with connection() as conn, self._lock:
+            self._sync(conn)
+            found = set()
+            stack = list(product_ids)
+            while stack:
+                product_id = stack.pop()
+                if product_id not in found:
+                    found.add(product_id)
+                    stack.extend(self.parents.get(product_id, ()))
+            return found
+
+    def explode_all(self):
+        with connection() as conn:
+            product_ids = [row[0] for row in conn.execute('SELECT id FROM products ORDER BY id')]
+        return self.explode_many(product_ids)
+
+
+_explosion = BomExplosion()
+
+
+# Feasibility engine: how many units of each product current stock supports.
+# The BOM is held as a sparse product x material matrix (COO entries sorted
+# by product) and every product is evaluated in one vectorized pass. Before
+# each pass the engine catches up with what was committed since its last
+# look, by this process or any other: materials with new stock ledger
+# movements get their stock and entries refreshed, and products stamped in
+# bom_versions get their rows replaced, together with every product that
+# contains them.
+class FeasibilityEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def reset(self):
+        with self._lock:
+            self._loaded = False
+
+    @staticmethod
+    def _entries(product_ids, exploded):
+        # (product_id, material_id, qty) rows of the exploded BOMs
+        return np.array([(product_id, material_id, qty)
+                         for product_id in product_ids
+                         for material_id, qty in exploded[product_id].items() if qty > 0],
+                        dtype=np.int64).reshape(-1, 3)
+
+    def _load(self, conn):
+        # Versions first: anything committed after them is applied again on
+        # the next pass, which is harmless
+        self.movement = conn.execute('SELECT COALESCE(MAX(id), 0) FROM stock_movements').fetchone()[0]
+        self.version = conn.execute('SELECT COALESCE(MAX(version), 0) FROM bom_versions').fetchone()[0]
+        self.product_ids = np.array(
+            [row[0] for row in conn.execute('SELECT id FROM products ORDER BY id')], dtype=np.int64)
+        materials = np.array(
+            conn.execute('SELECT id, quantity FROM materials ORDER BY id').fetchall(), dtype=np.int64).reshape(-1, 2)
+        self.material_ids = materials[:, 0]
+        # A material missing from the table counts as an extra column with
+        # zero stock
+        self.stock = np.append(materials[:, 1], 0)
+        self.entries = self._entries(self.product_ids.tolist(), _explosion.explode_many(self.product_ids.tolist()))
+        self._index()
+        self._loaded = True
+
+    def _index(self):
+        cols = self._columns(self.entries[:, 1])
+        cols[cols < 0] = len(self.material_ids)
+        self.cols = cols
+        self.qty = self.entries[:, 2]
+        rows = np.searchsorted(self.product_ids, self.entries[:, 0])
+        # First entry of every product that has a BOM
+        self.segment_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else rows
+        self.segment_rows = rows[self.segment_starts]
+        # Entries grouped by column, for incremental stock updates
+        self.by_column = np.argsort(cols, kind='stable')
+        self.column_starts = np.searchsorted(cols[self.by_column], np.arange(len(self.stock) + 1))
+        self.ratio = self.stock[self.cols] // self.qty
+
+    def _columns(self, material_ids):
+        # Column index of each material id, -1 for ids not in the matrix
+        cols = np.searchsorted(self.material_ids, material_ids)
+        found = cols < len(self.material_ids)
+        found[found] = self.material_ids[cols[found]] == material_ids[found]
+        return np.where(found, cols, -1)
+
+    def _update_products(self, conn):
+        changed = conn.execute('SELECT product_id, version FROM bom_versions WHERE version > ?',
+                               (self.version,)).fetchall()
+        if not changed:
+            return
+        self.version = max(version for _, version in changed)
+        affected = np.array(sorted(_explosion.with_parents(product_id for product_id, _ in changed)), dtype=np.int64)
+        existing = np.array([row[0] for row in conn.execute('''
+            SELECT id FROM products WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id
+        ''', (json.dumps(affected.tolist()),))], dtype=np.int64)
+        self.product_ids = np.union1d(np.setdiff1d(self.product_ids, affected), existing)
 
+        # Rows of the affected products are replaced by their new explosion
+        new = self._entries(existing.tolist(), _explosion.explode_many(existing.tolist()))
+        entries = np.concatenate([self.entries[~np.isin(self.entries[:, 0], affected)], new])
+        self.entries = entries[np.argsort(entries[:, 0], kind='stable')]
+
+        # Materials the matrix has no column for yet
+        unknown = np.setdiff1d(new[:, 1], self.material_ids)
+        if len(unknown):
+            added = np.array(conn.execute('''
+                SELECT id, quantity FROM materials WHERE id IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(unknown.tolist()),)).fetchall(), dtype=np.int64).reshape(-1, 2)
+            ids = np.concatenate([self.material_ids, added[:, 0]])
+            order = np.argsort(ids, kind='stable')
+            self.material_ids = ids[order]
+            self.stock = np.append(np.concatenate([self.stock[:-1], added[:, 1]])[order], 0)
+        self._index()
+
+    def _refresh_stock(self, conn):
+        last = conn.execute('SELECT COALESCE(MAX(id), 0) FROM stock_movements').fetchone()[0]
+        if last == self.movement:
+            return
+        changed = conn.execute('''
+            SELECT id, quantity FROM materials
+            WHERE id IN (SELECT material_id FROM stock_movements WHERE id > ?)
+        ''', (self.movement,)).fetchall()
+        self.movement = last
+        if not changed:
+            return
+        changed = np.array(changed, dtype=np.int64)
+        cols = self._columns(changed[:, 0])
+        known = cols >= 0
+        cols = cols[known]
+        self.stock[cols] = changed[known, 1]
+        entries = np.concatenate([self.by_column[self.column_starts[c]:self.column_starts[c + 1]] for c in cols] or
+                                 [np.empty(0, dtype=np.int64)])
+        self.ratio[entries] = self.stock[self.cols[entries]] // self.qty[entries]
+
+    def buildable(self):
+        # {product_id: units buildable from current stock}; None for products
+        # without a BOM
+        if np is None:
+            raise RuntimeError("numpy is required for feasibility calculations")
+        with self._lock:
+            with connection() as conn:
+                if not self._loaded:
+                    self._load(conn)
+                else:
+                    self._update_products(conn)
+                    self._refresh_stock(conn)
+            result = dict.fromkeys(self.product_ids.tolist())
+            if len(self.segment_starts):
+                units = np.maximum(np.minimum.reduceat(self.ratio, self.segment_starts), 0)
+                result.update(zip(self.product_ids[self.segment_rows].tolist(), units.tolist()))
+            return result
+
+
+_feasibility = FeasibilityEngine()
+
+def get_buildable_quantities():
+    return _feasibility.buildable()
+
+# What-if material requirements planning. Nothing is written: the backlog's
+# exploded demand is netted against current stock in due-date order.
+def plan_requirements(lines):
+    # lines: iterable of (product_id, quantity, due_date); due dates only need
+    # to be mutually comparable. Returns one row per material the backlog
+    # needs, as (material_id, name, on_hand, demand, shortfall, first_blocked)
+    # where first_blocked is the index in `lines` of the earliest-due line
+    # that cannot be covered, or None when stock suffices.
+    if np is None:
+        raise RuntimeError("numpy is required for requirements planning")
+    lines = list(lines)
+    if not lines:
+        return []
+
+    # Stable due-date order; ties keep their input order
+    order = sorted(range(len(lines)), key=lambda index: lines[index][2])
+    line_products = np.array([lines[index][0] for index in order], dtype=np.int64)
+    line_qty = np.array([lines[index][1] for index in order], dtype=np.int64)
+
+    # Exploded BOMs of the distinct products as CSR arrays
+    products, product_index = np.unique(line_products, return_inverse=True)
+    exploded = _explosion.explode_many(products.tolist())
+    counts = np.array([len(exploded[product_id]) for product_id in products.tolist()], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    bom_materials = np.fromiter((material_id for product_id in products.tolist()
+                                 for material_id in exploded[product_id]), dtype=np.int64, count=offsets[-1])
+    bom_qty = np.fromiter((qty for product_id in products.tolist()
+                           for qty in exploded[product_id].values()), dtype=np.int64, count=offsets[-1])
+
+    # One entry per (line, material): expand every line into its BOM
+    lengths = counts[product_index]
+    total = int(lengths.sum())
+    if total == 0:
+        return []
+    entry_line = np.repeat(np.arange(len(order)), lengths)
+    entry_start = np.repeat(offsets[product_index] - (np.cumsum(lengths) - lengths), lengths)
+    entry_bom = entry_start + np.arange(total)
+    entry_material = bom_materials[entry_bom]
+    entry_qty = bom_qty[entry_bom] * line_qty[entry_line]
+
+    # Group by material, keeping due-date order inside each group
+    sort = np.lexsort((entry_line, entry_material))
+    entry_material, entry_line, entry_qty = entry_material[sort], entry_line[sort], entry_qty[sort]
+    materials, group_starts = np.unique(entry_material, return_index=True)
+    running = np.cumsum(entry_qty)
+    group_base = np.repeat(running[group_starts] - entry_qty[group_starts],
+                           np.diff(np.append(group_starts, total)))
+    cumulative = running - group_base
+    demand = np.add.reduceat(entry_qty, group_starts)
+
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT id, name, quantity FROM materials
+            WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(materials.tolist()),)).fetchall()
+    names = {material_id: name for material_id, name, _ in rows}
+    stock_by_id = {material_id: quantity for material_id, _, quantity in rows}
+    on_hand = np.array([stock_by_id.get(material_id, 0) for material_id in materials.tolist()], dtype=np.int64)
+
+    # First entry in each group whose running demand exceeds stock
+    group = np.repeat(np.arange(len(materials)), np.diff(np.append(group_starts, total)))
+    exceeded = np.flatnonzero(cumulative > on_hand[group])
+    first_blocked = [None] * len(materials)
+    if len(exceeded):
+        blocked_groups, first = np.unique(group[exceeded], return_index=True)
+        for g, entry in zip(blocked_groups.tolist(), exceeded[first].tolist()):
+            first_blocked[g] = order[entry_line[entry]]
+
+    shortfall = np.maximum(demand - on_hand, 0)
+    return [(material_id, names.get(material_id), have, need, short, blocked)
+            for material_id, have, need, short, blocked in zip(
+                materials.tolist(), on_hand.tolist(), demand.tolist(), shortfall.tolist(), first_blocked)]
+
+# Allocation optimizer: splits scarce stock between competing products.
+# Maximizes sum(weight * units) subject to exploded material use <= stock and
+# units <= demand, units integer. Only materials whose total demand exceeds
+# stock are constraints; products that use none of them get their full
+# demand. The integer program is solved with scipy's HiGHS MILP when scipy is
+# installed, within `time_limit` seconds; otherwise (or when the solver
+# finds nothing better) a greedy heuristic fills products in order of weight
+# per unit of scarce stock used.
+ALLOCATION_TIME_LIMIT = 5.0
+
+def _greedy_allocation(order_weight, demand, cols, qty, offsets, stock):
+    # Products in descending `order_weight`, each given as many units as
+    # the remaining stock allows; cols/qty/offsets are the CSR rows
+    remaining = stock.copy()
+    units = np.zeros(len(demand), dtype=np.int64)
+    for p in np.argsort(-order_weight, kind='stable').tolist():
+        start, end = offsets[p], offsets[p + 1]
+        if start == end:
+            units[p] = demand[p]
+            continue
+        row_cols, row_qty = cols[start:end], qty[start:end]
+        units[p] = min(int(demand[p]), int((remaining[row_cols] // row_qty).min()))
+        if units[p] > 0:
+            remaining[row_cols] -= row_qty * units[p]
+    return units
+
+def optimize_allocation(lines, method='auto', time_limit=ALLOCATION_TIME_LIMIT):
+    # lines: iterable of (product_id, demand, weight) with each product once.
+    # method: 'auto' (MILP when scipy is available), 'milp' or 'greedy'.
+    # Returns {'method', 'status', 'objective', 'seconds',
+    #          'products': [(product_id, name, demand, weight, units)],
+    #          'materials': [(material_id, name, on_hand, needed, used)]}
+    # where materials are those the full demand would over-use. Nothing is
+    # written.
+    if np is None:
+        raise RuntimeError("numpy is required for allocation")
+    if method not in ('auto', 'milp', 'greedy'):
+        raise ValueError("method must be 'auto', 'milp' or 'greedy'")
+    if method == 'milp' and milp is None:
+        raise RuntimeError("scipy is required for method='milp'")
+    if not time_limit > 0:
+        raise ValueError("time_limit must be positive")
+    started = time.perf_counter()
+    lines = list(lines)
+    product_ids = [product_id for product_id, _, _ in lines]
+    if len(set(product_ids)) != len(product_ids):
+        raise ValueError("Each product may appear only once")
+    if any(demand < 0 or weight < 0 for _, demand, weight in lines):
+        raise ValueError("Demand and weight must not be negative")
+    with connection() as conn:
+        names = dict(conn.execute('''
+            SELECT id, name FROM products WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(product_ids),)).fetchall())
+    if len(names) != len(product_ids):
+        raise ValueError("Product does not exist")
+    demand = np.array([demand for _, demand, _ in lines], dtype=np.int64)
+    weight = np.array([weight for _, _, weight in lines], dtype=np.float64)
+
+    # Exploded BOMs as CSR rows over material columns
+    exploded = _explosion.explode_many(product_ids)
+    counts = np.array([len(exploded[product_id]) for product_id in product_ids], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    entry_material = np.fromiter((material_id for product_id in product_ids for material_id in exploded[product_id]),
+                                 dtype=np.int64, count=offsets[-1])
+    qty = np.fromiter((qty for product_id in product_ids for qty in exploded[product_id].values()),
+                      dtype=np.int64, count=offsets[-1])
+    materials, cols = np.unique(entry_material, return_inverse=True)
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT id, name, quantity FROM materials WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(materials.tolist()),)).fetchall()
+    material_names = {material_id: name for material_id, name, _ in rows}
+    stock_by_id = {material_id: quantity for material_id, _, quantity in rows}
+    stock = np.array([max(stock_by_id.get(material_id, 0), 0) for material_id in materials.tolist()], dtype=np.int64)
+    entry_product = np.repeat(np.arange(len(lines)), counts)
+    needed = np.bincount(cols, weights=qty * demand[entry_product], minlength=len(materials)).astype(np.int64)
+    scarce = needed > stock
+
+    # Greedy order: weight per unit of scarce stock, each scarce material
+    # priced by how oversubscribed it is
+    price = np.where(scarce, needed / np.maximum(stock, 1), 0.0)
+    cost = np.bincount(entry_product, weights=qty * price[cols], minlength=len(lines))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        efficiency = np.where(cost > 0, weight / cost, np.inf)
+    units = _greedy_allocation(efficiency, demand, cols, qty, offsets, stock)
+    used_method, status = 'greedy', 'heuristic'
+
+    if method != 'greedy' and milp is not None and scarce.any():
+        # Only products touching a scarce material are decision variables
+        scarce_entry = scarce[cols]
+        free = np.bincount(entry_product[scarce_entry], minlength=len(lines)) == 0
+        variables = np.flatnonzero(~free)
+        position = np.full(len(lines), -1)
+        position[variables] = np.arange(len(variables))
+        constraint_rows = np.cumsum(scarce) - 1
+        matrix = csr_array((qty[scarce_entry], (constraint_rows[cols[scarce_entry]], position[entry_product[scarce_entry]])),
+                           shape=(int(scarce.sum()), len(variables)))
+        result = milp(
+            -weight[variables],
+            constraints=LinearConstraint(matrix, -np.inf, stock[scarce]),
+            integrality=np.ones(len(variables)),
+            bounds=Bounds(0, demand[variables]),
+            options={'time_limit': time_limit, 'disp': False},
+        )
+        if result.x is not None:
+            candidate = demand.copy()
+            candidate[variables] = np.floor(result.x + 1e-6).astype(np.int64)
+            fits = (matrix @ candidate[variables] <= stock[scarce]).all()
+            if fits and weight @ candidate >= weight @ units:
+                units = candidate
+                used_method, status = 'milp', 'optimal' if result.status == 0 else 'time_limit'
+
+    used = np.bincount(cols, weights=qty * units[entry_product], minlength=len(materials)).astype(np.int64)
+    return {
+        'method': used_method,
+        'status': status,
+        'objective': float(weight @ units),
+        'seconds': round(time.perf_counter() - started, 4),
+        'products': [(product_id, names[product_id], d, w, u) for product_id, d, w, u in zip(
+            product_ids, demand.tolist(), weight.tolist(), units.tolist())],
+        'materials': [(material_id, material_names.get(material_id), have, need, use)
+                      for material_id, have, need, use in zip(
+                          materials[scarce].tolist(), stock[scarce].tolist(),
+                          needed[scarce].tolist(), used[scarce].tolist())],
+    }
+
+# Opt-in instrumentation. When enabled, every public function records call
+# counts, a latency histogram and rows returned; every statement run through
+# a pooled connection records its time, fetching its rows included. SQLite's
+# trace and progress callbacks attribute statements (including trigger
+# bodies) and VM work to the public call that caused them. With explain_slow
+# set, statements slower than slow_ms have their EXPLAIN QUERY PLAN captured.
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+SLOWEST_KEPT = 20
+PROGRESS_STEPS = 1000
+
+_instrumentation = {'enabled': False, 'explain_slow': False, 'slow_ms': 50.0}
+_stats_lock = threading.Lock()
+_function_stats = {}
+_statement_stats = {}
+_slowest = []
+_current_call = threading.local()
+
+
+def enable_instrumentation(enabled=True, explain_slow=None, slow_ms=None):
+    _instrumentation['enabled'] = bool(enabled)
+    if explain_slow is not None:
+        _instrumentation['explain_slow'] = bool(explain_slow)
+    if slow_ms is not None:
+        _instrumentation['slow_ms'] = float(slow_ms)
+
+
+def instrumentation_settings():
+    return dict(_instrumentation)
+
+
+def reset_performance_stats():
+    with _stats_lock:
+        _function_stats.clear()
+        _statement_stats.clear()
+        del _slowest[:]
+
+
+def _set_connection_hooks(conn, enabled):
+    if enabled:
+        conn.set_trace_callback(_trace_statement)
+        conn.set_progress_handler(_count_progress, PROGRESS_STEPS)
+    else:
+        conn.set_trace_callback(None)
+        conn.set_progress_handler(None, PROGRESS_STEPS)
+    conn.instrumented = enabled
+
+
+def _trace_statement(sql):
+    call = getattr(_current_call, 'record', None)
+    if call is not None:
+        call['statements'] += 1
+
+
+def _count_progress():
+    call = getattr(_current_call, 'record', None)
+    if call is not None:
+        call['vm_steps'] += PROGRESS_STEPS
+    return 0
+
+
+def _record_statement(conn, sql, parameters, seconds):
+    elapsed_ms = seconds * 1000
+    key = ' '.join(sql.split())
+    plan = None
+    if (_instrumentation['explain_slow'] and elapsed_ms >= _instrumentation['slow_ms']
+            and parameters is not None and key.upper().startswith(('SELECT', 'WITH'))):
+        plan = [row[3] for row in
+                sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()]
+    with _stats_lock:
+        stats = _statement_stats.get(key)
+        if stats is None:
+            stats = _statement_stats[key] = {'sql': key, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+        stats['count'] += 1
+        stats['total_ms'] += elapsed_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        if len(_slowest) < SLOWEST_KEPT or elapsed_ms > _slowest[-1]['ms']:
+            call = getattr(_current_call, 'record', None)
+            _slowest.append({'ms': round(elapsed_ms, 3), 'sql': key,
+                             'function': call['name'] if call else None, 'plan': plan})
+            _slowest.sort(key=lambda entry: -entry['ms'])
+            del _slowest[SLOWEST_KEPT:]
+
+
+def _instrumented(func):
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _instrumentation['enabled']:
+            return func(*args, **kwargs)
+        outer = getattr(_current_call, 'record', None)
+        record = {'name': name, 'statements': 0, 'vm_steps': 0}
+        if outer is None:
+            _current_call.record = record
+        failed = False
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if outer is None:
+                _current_call.record = None
+            rows = _result_rows(result) if not failed else 0
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound),
+                          len(LATENCY_BUCKETS_MS))
+            with _stats_lock:
+                stats = _function_stats.get(name)
+                if stats is None:
+                    stats = _function_stats[name] = {
+                        'function': name, 'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                        'rows': 0, 'statements': 0, 'vm_steps': 0,
+                        'histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                    }
+                stats['calls'] += 1
+                stats['errors'] += failed
+                stats['total_ms'] += elapsed_ms
+                stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+                stats['rows'] += rows
+                stats['histogram'][bucket] += 1
+                # Statements and VM work are attributed to the outermost call only
+                if outer is None:
+                    stats['statements'] += record['statements']
+                    stats['vm_steps'] += record['vm_steps']
+        return result
+    return wrapper
+
+
+def get_performance_stats():
+    # Snapshot of the collected numbers, slowest totals first
+    labels = [f'<={bound}ms' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}ms']
+    with _stats_lock:
+        functions = []
+        for stats in _function_stats.values():
+            entry = dict(stats)
+            entry['mean_ms'] = entry['total_ms'] / entry['calls']
+            entry['histogram'] = dict(zip(labels, stats['histogram']))
+            functions.append(entry)
+        statements = [dict(stats, mean_ms=stats['total_ms'] / stats['count'])
+                      for stats in _statement_stats.values()]
+        slowest = [dict(entry) for entry in _slowest]
+    functions.sort(key=lambda entry: -entry['total_ms'])
+    statements.sort(key=lambda entry: -entry['total_ms'])
+    return {'settings': instrumentation_settings(), 'functions': functions,
+            'statements': statements, 'slowest': slowest}
+
+
+# Public data functions wrapped for instrumentation
+_INSTRUMENTED = [
+    'add_material', 'update_material', 'receive_stock', 'delete_material', 'get_inventory',
+    'snapshot_stock', 'get_stock_at', 'get_inventory_at',
+    'add_product', 'update_bom', 'get_products', 'search_materials', 'search_products', 'get_bom', 'get_boms', 'get_all_boms',
+    'get_bom_lines', 'delete_product', 'place_order', 'place_orders',
+    'get_order_history', 'get_order_history_detailed', 'get_orders', 'get_order_details',
+    'queue_backorder', 'cancel_backorder', 'retry_backorders', 'get_backorders',
+    'count_materials', 'count_products', 'count_orders', 'archive_orders', 'get_order_archives',
+    'rebuild_consumption', 'get_consumption', 'get_days_of_cover',
+    'get_buildable_quantities', 'plan_requirements', 'optimize_allocation',
+    'import_materials', 'import_boms', 'export_materials', 'export_boms',
+]
+for _name in _INSTRUMENTED:
+    globals()[_name] = _instrumented(globals()[_name])
+del _name
 
 # Initialize database on first import
-init_db()
\ No newline at end of file
+init_db()
+if WRITE_QUEUE:
+    enable_write_queue()
+
+# Maintenance commands, e.g. python backend.py rebuild-consumption
+if __name__ == '__main__':
+    import argparse
+    commands = {'rebuild-consumption': rebuild_consumption, 'snapshot-stock': snapshot_stock,
+                'archive-orders': None}
+    parser = argparse.ArgumentParser(description='Inventory database maintenance')
+    parser.add_argument('command', choices=sorted(commands))
+    parser.add_argument('--before', help='archive-orders: archive orders before this date (YYYY-MM-DD)')
+    parser.add_argument('--days', type=int, default=365,
+                        help='archive-orders: archive orders older than this many days (default: 365)')
+    args = parser.parse_args()
+    if args.command == 'archive-orders':
+        before = args.before or date.today() - timedelta(days=args.days)
+        for month, orders in archive_orders(before).items():
+            print(f'{month}: {orders} orders -> {_archive_path(month)}')
+    else:
+        commands[args.command]()
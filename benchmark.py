@@ -0,0 +1,507 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from datetime import datetime
+
+# Benchmarks run against a scratch database, never the real inventory.db
+os.environ['INVENTORY_DB'] = os.path.join(tempfile.mkdtemp(prefix='inventory-bench-'), 'bench.db')
+
+import backend
+
+
+# Databases created by reset_db carry this PRAGMA application_id; any other
+# existing file is left alone unless --force is given
+BENCH_APPLICATION_ID = 0x42454E43
+
+
+def is_bench_db(path):
+    try:
+        conn = sqlite3.connect(f'file:{urllib.request.pathname2url(os.path.abspath(path))}?mode=ro', uri=True)
+    except sqlite3.Error:
+        return False
+    try:
+        return conn.execute('PRAGMA application_id').fetchone()[0] == BENCH_APPLICATION_ID
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+
+
+def check_bench_db(path, force=False):
+    if os.path.exists(path) and not force and not is_bench_db(path):
+        raise SystemExit(f'{path} exists and is not a benchmark database; pass --force to overwrite it')
+
+
+def reset_db(path, force=False):
+    check_bench_db(path, force)
+    backend.close_connections()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    backend.configure(db_path=path)
+    with backend.connection() as conn:
+        conn.execute(f'PRAGMA application_id = {BENCH_APPLICATION_ID}')
+
+
+# Synthetic dataset: materials, products with random BOMs and an order
+# history with matching order_details, generated from a fixed seed.
+def generate_dataset(args):
+    rng = random.Random(args.seed)
+    materials = max(1, int(args.materials * args.scale))
+    products = max(1, int(args.products * args.scale))
+    orders = int(args.orders * args.scale)
+
+    with backend.connection() as conn:
+        conn.execute('PRAGMA synchronous = OFF')
+    with backend.transaction() as conn:
+        conn.executemany('INSERT INTO materials (name, quantity) VALUES (?, ?)',
+                         ((f'M{i:07d}', rng.randint(10 ** 8, 10 ** 9)) for i in range(materials)))
+        # Unused materials that delete_material can remove
+        conn.executemany('INSERT INTO materials (name, quantity) VALUES (?, ?)',
+                         ((f'SPARE{i:07d}', 0) for i in range(args.repeat)))
+        conn.executemany('INSERT INTO products (name) VALUES (?)',
+                         ((f'P{i:07d}',) for i in range(products)))
+        boms = []
+        for product_id in range(1, products + 1):
+            lines = rng.randint(args.bom_min, args.bom_max)
+            boms.append([(material_id, rng.randint(1, 5))
+                         for material_id in rng.sample(range(1, materials + 1), min(lines, materials))])
+        conn.executemany('INSERT INTO bom (product_id, material_id, quantity) VALUES (?, ?, ?)',
+                         ((product_id, material_id, qty)
+                          for product_id, bom in enumerate(boms, start=1) for material_id, qty in bom))
+
+    # Orders spread evenly over the last two years, oldest first
+    end = int(time.time())
+    start = end - 2 * 365 * 86400
+    step = (end - start) / max(orders, 1)
+    chunk = 20000
+    for first in range(0, orders, chunk):
+        order_rows, detail_rows = [], []
+        for order_id in range(first + 1, min(first + chunk, orders) + 1):
+            product_id = rng.randint(1, products)
+            quantity = rng.randint(1, 5)
+            created_at = int(start + order_id * step)
+            order_rows.append((order_id, product_id, quantity,
+                               datetime.fromtimestamp(created_at).strftime('%Y-%m-%d %H:%M:%S'), created_at))
+            detail_rows.extend((order_id, material_id, qty * quantity) for material_id, qty in boms[product_id - 1])
+        with backend.transaction() as conn:
+            conn.executemany('INSERT INTO orders (id, product_id, quantity, timestamp, created_at) VALUES (?, ?, ?, ?, ?)',
+                             order_rows)
+            conn.executemany('INSERT INTO order_details (order_id, material_id, quantity_used) VALUES (?, ?, ?)',
+                             detail_rows)
+
+    with backend.connection() as conn:
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA synchronous = NORMAL')
+    backend.clear_cache()
+    return {'materials': materials, 'products': products, 'orders': orders,
+            'bom_lines': sum(len(bom) for bom in boms)}
+
+
+def timed(func, repeat, setup=None):
+    # Runs func `repeat` times with the read cache cleared before each run
+    samples = []
+    for i in range(repeat):
+        args = setup(i) if setup else ()
+        backend.clear_cache()
+        start = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'runs': repeat,
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+    }
+
+
+def seed_small(rng, materials, products, bom_lines, stock):
+    with backend.transaction() as conn:
+        conn.executemany('INSERT INTO materials (name, quantity) VALUES (?, ?)',
+                         [(f'M{i:06d}', stock) for i in range(materials)])
+        conn.executemany('INSERT INTO products (name) VALUES (?)',
+                         [(f'P{i:06d}',) for i in range(products)])
+        rows = []
+        for product_id in range(1, products + 1):
+            for material_id in rng.sample(range(1, materials + 1), bom_lines):
+                rows.append((product_id, material_id, rng.randint(1, 3)))
+        conn.executemany('INSERT INTO bom (product_id, material_id, quantity) VALUES (?, ?, ?)', rows)
+
+
+# The original place_order: a fresh connection per call, one SELECT per BOM
+# line outside any lock, then per-line UPDATE/INSERT statements.
+def legacy_place_order(path, product_id, quantity):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            SELECT m.id, m.name, b.quantity FROM bom b
+            JOIN materials m ON b.material_id = m.id
+            WHERE b.product_id = ?
+        ''', (product_id,))
+        required = {material_id: qty * quantity for material_id, _, qty in cursor.fetchall()}
+        insufficient = []
+        for material_id, needed in required.items():
+            cursor.execute('SELECT quantity FROM materials WHERE id = ?', (material_id,))
+            current = cursor.fetchone()[0]
+            if current < needed:
+                insufficient.append((material_id, needed - current))
+        if insufficient:
+            return False, insufficient
+        conn.execute("BEGIN")
+        for material_id, needed in required.items():
+            cursor.execute('UPDATE materials SET quantity = quantity - ? WHERE id = ?', (needed, material_id))
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        cursor.execute('INSERT INTO orders (product_id, quantity, timestamp) VALUES (?, ?, ?)',
+                       (product_id, quantity, timestamp))
+        order_id = cursor.lastrowid
+        for material_id, needed in required.items():
+            cursor.execute('INSERT INTO order_details (order_id, material_id, quantity_used) VALUES (?, ?, ?)',
+                           (order_id, material_id, needed))
+        conn.commit()
+        return True, order_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def check_stock(initial_stock):
+    with backend.connection() as conn:
+        lowest = conn.execute('SELECT MIN(quantity) FROM materials').fetchone()[0]
+        # Every unit missing from stock must be accounted for by an order line
+        drift = conn.execute('''
+            SELECT COUNT(*) FROM materials m
+            LEFT JOIN (SELECT material_id, SUM(quantity_used) AS used
+                       FROM order_details GROUP BY material_id) u ON u.material_id = m.id
+            WHERE m.quantity + COALESCE(u.used, 0) != ?
+        ''', (initial_stock,)).fetchone()[0]
+    return lowest, drift
+
+
+def run_threads(place, threads, orders_per_thread, products, seed):
+    counts = {'placed': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        local = {'placed': 0, 'rejected': 0, 'errors': 0}
+        for _ in range(orders_per_thread):
+            try:
+                ok, _ = place(rng.randint(1, products), rng.randint(1, 3))
+                local['placed' if ok else 'rejected'] += 1
+            except Exception:
+                local['errors'] += 1
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    counts['seconds'] = round(elapsed, 4)
+    counts['orders_per_sec'] = round((counts['placed'] + counts['rejected']) / elapsed, 1)
+    return counts
+
+
+def bench_place_order_stress(args):
+    path = args.db + '.stress'
+    results = {}
+    for name in ('legacy', 'current'):
+        reset_db(path, args.force)
+        seed_small(random.Random(args.seed), args.stress_materials, args.stress_products,
+                   args.stress_bom_lines, args.stress_stock)
+        if name == 'legacy':
+            place = lambda product_id, qty: legacy_place_order(path, product_id, qty)
+        else:
+            place = backend.place_order
+        result = run_threads(place, args.threads, args.stress_orders, args.stress_products, args.seed)
+        result['min_stock'], result['inconsistent_materials'] = check_stock(args.stress_stock)
+        results[name] = result
+    results['speedup'] = round(results['current']['orders_per_sec'] / results['legacy']['orders_per_sec'], 2)
+    return results
+
+
+# Many threads issuing small writes (stock adjustments and orders), with
+# per-call commits versus the single-writer group-commit queue
+def bench_write_queue(args):
+    path = args.db + '.writes'
+    results = {}
+    for name in ('per_call', 'write_queue'):
+        reset_db(path, args.force)
+        seed_small(random.Random(args.seed), args.stress_materials, args.stress_products,
+                   args.stress_bom_lines, 10 ** 9)
+        backend.enable_write_queue(name == 'write_queue')
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+
+        def worker(index):
+            rng = random.Random(args.seed + index)
+            local, failed = [], 0
+            for i in range(args.write_ops):
+                start = time.perf_counter()
+                try:
+                    if i % 2:
+                        backend.place_order(rng.randint(1, args.stress_products), 1)
+                    else:
+                        backend.update_material(rng.randint(1, args.stress_materials), 1)
+                except Exception:
+                    failed += 1
+                local.append(time.perf_counter() - start)
+            with lock:
+                latencies.extend(local)
+                errors[0] += failed
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(args.writers)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+        backend.enable_write_queue(False)
+        latencies.sort()
+        results[name] = {
+            'writes': len(latencies),
+            'errors': errors[0],
+            'seconds': round(elapsed, 4),
+            'writes_per_sec': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+            'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+        }
+    results['speedup'] = round(results['write_queue']['writes_per_sec'] / results['per_call']['writes_per_sec'], 2)
+    return results
+
+
+# Allocation over thousands of products competing for scarce stock: the
+# greedy heuristic against the MILP (when scipy is installed)
+def bench_allocation(args):
+    path = args.db + '.allocation'
+    reset_db(path, args.force)
+    rng = random.Random(args.seed)
+    seed_small(rng, args.alloc_materials, args.alloc_products, args.stress_bom_lines, 0)
+    with backend.transaction() as conn:
+        conn.executemany('UPDATE materials SET quantity = ? WHERE id = ?',
+                         [(rng.randint(50, 5000), material_id) for material_id in range(1, args.alloc_materials + 1)])
+    lines = [(product_id, rng.randint(0, 40), rng.choice((1, 1, 2, 5, 10)))
+             for product_id in range(1, args.alloc_products + 1)]
+    results = {'upper_bound': sum(demand * weight for _, demand, weight in lines)}
+    for method in ('greedy', 'milp') if backend.milp is not None else ('greedy',):
+        result = backend.optimize_allocation(lines, method=method)
+        results[method] = {key: result[key] for key in ('method', 'status', 'objective', 'seconds')}
+        results[method]['scarce_materials'] = len(result['materials'])
+    return results
+
+
+def bench_get_inventory(args, data):
+    return timed(backend.get_inventory, args.repeat)
+
+
+def bench_get_bom(args, data):
+    rng = random.Random(args.seed)
+    return timed(backend.get_bom, args.repeat, lambda i: (rng.randint(1, data['products']),))
+
+
+def bench_place_order(args, data):
+    rng = random.Random(args.seed)
+    return timed(backend.place_order, args.repeat, lambda i: (rng.randint(1, data['products']), 1))
+
+
+def bench_place_order_concurrent(args, data):
+    return run_threads(backend.place_order, args.threads, args.repeat, data['products'], args.seed)
+
+
+def bench_get_order_history(args, data):
+    # First page, a page from the middle of the history, and the full table
+    middle = max(1, data['orders'] // 2)
+    return {
+        'first_page': timed(lambda: backend.get_order_history(limit=50), args.repeat),
+        'middle_page': timed(lambda: backend.get_order_history(limit=50, after=middle), args.repeat),
+        'count': timed(backend.count_orders, args.repeat),
+        'full': timed(backend.get_order_history, max(1, args.repeat // 10)),
+        # Grouped pages as the history page reads them, unfiltered and for one product
+        'grouped_page': timed(lambda: backend.get_orders(limit=20), args.repeat),
+        'product_page': timed(lambda: backend.get_orders(limit=20, product_id=1), args.repeat),
+        'product_count': timed(lambda: backend.count_orders(product_id=1), args.repeat),
+    }
+
+
+def bench_get_order_history_detailed(args, data):
+    middle = max(1, data['orders'] // 2)
+    return {
+        'first_page': timed(lambda: backend.get_order_history_detailed(limit=20), args.repeat),
+        'middle_page': timed(lambda: backend.get_order_history_detailed(limit=20, after=middle), args.repeat),
+    }
+
+
+def bench_result_modes(args, data):
+    # Full order history (one row per order) and roughly as many detail rows,
+    # read as row tuples, as the list of dicts the UI used to build from them,
+    # and in the columnar modes. Peak is the tracemalloc high-water mark of one
+    # read; retained is what the result still holds afterwards. Arrow buffers
+    # live outside the Python allocator and are added from Arrow's own count.
+    per_order = max(1, data['bom_lines'] // max(1, data['products']))
+    readers = {
+        'order_history': backend.get_order_history,
+        'order_history_detailed': lambda **kw: backend.get_order_history_detailed(
+            limit=max(1, data['orders'] // per_order), **kw),
+    }
+    modes = {
+        'rows': lambda read: read(),
+        'dicts': lambda read: [dict(zip(backend.ORDER_COLUMNS, row)) for row in read()],
+        'columns': lambda read: read(result='columns'),
+    }
+    if backend.np is not None:
+        modes['numpy'] = lambda read: read(result='numpy')
+    if backend.pa is not None:
+        modes['arrow'] = lambda read: read(result='arrow')
+
+    results = {}
+    for reader, read in readers.items():
+        results[reader] = {}
+        for mode, fetch in modes.items():
+            result = timed(lambda: fetch(read), max(1, args.repeat // 10))
+            backend.clear_cache()
+            gc.collect()
+            arrow_before = backend.pa.total_allocated_bytes() if backend.pa is not None else 0
+            tracemalloc.start()
+            value = fetch(read)
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            if backend.pa is not None:
+                arrow = backend.pa.total_allocated_bytes() - arrow_before
+                retained, peak = retained + arrow, peak + arrow
+            result['rows'] = backend._result_rows(value)
+            del value
+            backend.clear_cache()
+            result['peak_mb'] = round(peak / 2 ** 20, 1)
+            result['retained_mb'] = round(retained / 2 ** 20, 1)
+            results[reader][mode] = result
+    return results
+
+
+def bench_delete_material(args, data):
+    # The SPARE materials come right after the regular ones
+    first_spare = data['materials'] + 1
+    return timed(backend.delete_material, args.repeat, lambda i: (first_spare + i,))
+
+
+# Benchmarks over the generated dataset, in run order
+SUITE = {
+    'get_inventory': bench_get_inventory,
+    'get_bom': bench_get_bom,
+    'get_order_history': bench_get_order_history,
+    'get_order_history_detailed': bench_get_order_history_detailed,
+    'result_modes': bench_result_modes,
+    'delete_material': bench_delete_material,
+    'place_order': bench_place_order,
+    'place_order_concurrent': bench_place_order_concurrent,
+}
+
+# Benchmarks that build their own small database
+STANDALONE = {
+    'place_order_stress': bench_place_order_stress,
+    'write_queue': bench_write_queue,
+    'allocation': bench_allocation,
+}
+
+BENCHMARKS = {**SUITE, **STANDALONE}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backend benchmarks; prints JSON results.')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help='benchmarks to run (default: all): ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', default=backend.DB_PATH, help='database file for the generated dataset')
+    parser.add_argument('--reuse', action='store_true',
+                        help='reuse the dataset in --db if it exists instead of regenerating it')
+    parser.add_argument('--force', action='store_true',
+                        help='overwrite --db (and its .stress/.writes/.allocation files) even if '
+                             'it is not a benchmark database')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for dataset sizes')
+    parser.add_argument('--materials', type=int, default=50000)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--bom-min', type=int, default=5)
+    parser.add_argument('--bom-max', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=50, help='timed runs per benchmark')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--stress-orders', type=int, default=200, help='orders per thread in place_order_stress')
+    parser.add_argument('--stress-materials', type=int, default=200)
+    parser.add_argument('--stress-products', type=int, default=50)
+    parser.add_argument('--stress-bom-lines', type=int, default=10)
+    parser.add_argument('--stress-stock', type=int, default=100)
+    parser.add_argument('--writers', type=int, default=32, help='writer threads in write_queue')
+    parser.add_argument('--write-ops', type=int, default=200, help='writes per thread in write_queue')
+    parser.add_argument('--alloc-products', type=int, default=3000, help='products in allocation')
+    parser.add_argument('--alloc-materials', type=int, default=2000, help='materials in allocation')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error('unknown benchmark: ' + ', '.join(unknown))
+    args.benchmarks = args.benchmarks or list(BENCHMARKS)
+
+    results = {}
+    dataset = None
+    if any(name in SUITE for name in args.benchmarks):
+        if args.reuse and os.path.exists(args.db):
+            # The suite writes to the dataset, so only a benchmark database is reused
+            check_bench_db(args.db, args.force)
+            backend.configure(db_path=args.db)
+            with backend.connection() as conn:
+                dataset = {'materials': conn.execute("SELECT COUNT(*) FROM materials WHERE name LIKE 'M%'").fetchone()[0],
+                           'products': backend.count_products(), 'orders': backend.count_orders(),
+                           'bom_lines': conn.execute('SELECT COUNT(*) FROM bom').fetchone()[0]}
+            dataset['generate_seconds'] = None
+        else:
+            reset_db(args.db, args.force)
+            start = time.perf_counter()
+            dataset = generate_dataset(args)
+            dataset['generate_seconds'] = round(time.perf_counter() - start, 2)
+        for name in args.benchmarks:
+            if name in SUITE:
+                results[name] = SUITE[name](args, dataset)
+    for name in args.benchmarks:
+        if name in STANDALONE:
+            results[name] = STANDALONE[name](args)
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite_version': sqlite3.sqlite_version,
+        'db_path': args.db,
+        'params': {k: v for k, v in vars(args).items() if k not in ('benchmarks', 'output', 'db')},
+        'dataset': dataset,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
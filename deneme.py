@@ -1,18 +1,191 @@
-from PIL import Image
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image, ImageOps
 import pytesseract
 
 # Install tesseract first: https://github.com/UB-Mannheim/tesseract/wiki
 # pip install pytesseract pillow
 
-def extract_text_from_image(image_path):
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.tif', '.tiff', '.bmp')
+CACHE_DIR = '.ocr_cache'
+
+
+def preprocess_image(img, grayscale=False, threshold=None, scale=None):
+    # Optional cleanup before OCR: grayscale, binarize at `threshold`
+    # (0-255, implies grayscale) and resize by `scale`
+    if grayscale or threshold is not None:
+        img = ImageOps.grayscale(img)
+    if threshold is not None:
+        img = img.point(lambda value: 255 if value > threshold else 0)
+    if scale and scale != 1:
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                         Image.Resampling.LANCZOS)
+    return img
+
+
+def extract_text_from_image(image_path, lang='tur', grayscale=False, threshold=None, scale=None):
     # Open the image file
-    img = Image.open(image_path)
-    
-    # Extract text using Tesseract
-    text = pytesseract.image_to_string(img, lang='tur')  # 'tur' for Turkish
-    
+    with Image.open(image_path) as img:
+        img = preprocess_image(img, grayscale, threshold, scale)
+
+        # Extract text using Tesseract
+        text = pytesseract.image_to_string(img, lang=lang)  # 'tur' for Turkish
+
     return text
 
-# Usage
-extracted_text = extract_text_from_image('efatura.webp')
-print(extracted_text)
\ No newline at end of file
+
+def cache_key(image_path, **options):
+    # Results are keyed by image content and OCR settings, so a renamed file
+    # is still a hit and changed settings are not
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def read_cache(cache_dir, key):
+    try:
+        with open(os.path.join(cache_dir, key + '.txt'), encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def write_cache(cache_dir, key, text):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + '.txt')
+    # Write then rename so an interrupted run never leaves a partial entry
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(path + '.tmp', path)
+
+
+def _init_worker():
+    # Each process runs one tesseract at a time; keep tesseract's own OpenMP
+    # threads from oversubscribing the cores the pool already uses
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+
+
+def _ocr_worker(image_path, options):
+    start = time.perf_counter()
+    text = extract_text_from_image(image_path, **options)
+    return text, time.perf_counter() - start
+
+
+def available_cores():
+    # Cores this process may run on (respects taskset/container CPU limits)
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def find_images(directory):
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def ocr_directory(directory, workers=None, cache_dir=CACHE_DIR, lang='tur',
+                  grayscale=False, threshold=None, scale=None, on_result=None):
+    # OCRs every image in `directory` on a process pool. Returns
+    # {path: (text, seconds, cached, error)}; on_result(path, text, seconds,
+    # cached, error) is called as each image finishes. An image that cannot
+    # be read or OCRed gets text None and the error message, and the batch
+    # goes on.
+    options = {'lang': lang, 'grayscale': grayscale, 'threshold': threshold, 'scale': scale}
+    results, pending = {}, {}
+
+    def finish(path, text, seconds, cached, error=None):
+        results[path] = (text, seconds, cached, error)
+        if on_result:
+            on_result(path, *results[path])
+
+    for path in find_images(directory):
+        start = time.perf_counter()
+        try:
+            key = cache_key(path, **options) if cache_dir else None
+        except OSError as e:
+            finish(path, None, time.perf_counter() - start, False, str(e))
+            continue
+        text = read_cache(cache_dir, key) if key else None
+        if text is None:
+            pending[path] = key
+            continue
+        finish(path, text, time.perf_counter() - start, True)
+
+    if pending:
+        workers = min(workers or available_cores(), len(pending))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = {pool.submit(_ocr_worker, path, options): path for path in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    text, seconds = future.result()
+                except Exception as e:
+                    finish(path, None, 0.0, False, f'{type(e).__name__}: {e}')
+                    continue
+                if cache_dir:
+                    write_cache(cache_dir, pending[path], text)
+                finish(path, text, seconds, False)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch OCR of e-invoice images')
+    parser.add_argument('directory', help='directory of images to OCR')
+    parser.add_argument('--workers', type=int, help='worker processes (default: all cores)')
+    parser.add_argument('--lang', default='tur', help='tesseract language (default: tur)')
+    parser.add_argument('--grayscale', action='store_true', help='convert to grayscale first')
+    parser.add_argument('--threshold', type=int, help='binarize at this gray level (0-255)')
+    parser.add_argument('--scale', type=float, help='resize factor, e.g. 2 for small scans')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help=f'result cache (default: {CACHE_DIR})')
+    parser.add_argument('--no-cache', action='store_true', help='ignore and do not write the cache')
+    parser.add_argument('--output', help='write {file: text} as JSON here instead of printing the text')
+    args = parser.parse_args()
+    if args.threshold is not None and not 0 <= args.threshold <= 255:
+        parser.error('--threshold must be between 0 and 255')
+
+    def report(path, text, seconds, cached, error):
+        if error is not None:
+            print(f'{os.path.basename(path)}: failed ({error})', flush=True)
+            return
+        source = 'cache' if cached else f'{seconds:.2f}s'
+        print(f'{os.path.basename(path)}: {len(text)} chars ({source})', flush=True)
+        if not args.output:
+            print(text)
+
+    start = time.perf_counter()
+    results = ocr_directory(
+        args.directory, workers=args.workers, cache_dir=None if args.no_cache else args.cache_dir,
+        lang=args.lang, grayscale=args.grayscale, threshold=args.threshold, scale=args.scale,
+        on_result=report
+    )
+    elapsed = time.perf_counter() - start
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            # A failed image is written as {"error": message} instead of its text
+            json.dump({os.path.basename(path): text if error is None else {'error': error}
+                       for path, (text, _, _, error) in sorted(results.items())},
+                      f, ensure_ascii=False, indent=2)
+
+    failed = [path for path, (_, _, _, error) in results.items() if error is not None]
+    ocr_times = [seconds for _, seconds, cached, error in results.values() if not cached and error is None]
+    cached = sum(1 for _, _, cached, _ in results.values() if cached)
+    print(f'{len(results)} images in {elapsed:.2f}s ({len(results) / elapsed if elapsed else 0:.2f} images/s), '
+          f'{cached} from cache, {len(failed)} failed')
+    if ocr_times:
+        print(f'OCR time per image: mean {sum(ocr_times) / len(ocr_times):.2f}s, max {max(ocr_times):.2f}s')
+
+
+# Usage: python deneme.py faturalar/ --grayscale --threshold 160
+if __name__ == '__main__':
+    main()
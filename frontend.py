@@ -1,9 +1,17 @@
+import csv
+import io
 import streamlit as st
 import backend
-from datetime import datetime
+import invoice
+from datetime import date
 
 from PIL import Image
 
+try:
+    import deneme  # OCR; needs pytesseract and tesseract installed
+except ImportError:
+    deneme = None
+
 image = Image.open("logo.png")
 
 # Sayfa konfigürasyonu
@@ -50,16 +58,156 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# Sayfa başına gösterilen sipariş / ürün sayısı
+HISTORY_PAGE_SIZE = 20
+PRODUCTS_PAGE_SIZE = 25
+# Seçim kutularında gösterilen en iyi arama sonucu sayısı
+SEARCH_RESULTS = 50
+
 # Oturum durumu başlatma
 if 'bom_rows' not in st.session_state:
     st.session_state.bom_rows = 1
 
 # Yardımcı fonksiyonlar
-def get_material_choices():
-    return {name: id for id, name, _ in backend.get_inventory()}
+def page_cursor(key):
+    # Sayfalama imleçleri: her sayfadan önceki son kaydın ID'si
+    cursors = st.session_state.setdefault(f"{key}_cursors", [None])
+    return cursors[-1]
+
+def page_nav(key, next_cursor, total, page_size):
+    cursors = st.session_state[f"{key}_cursors"]
+    page_no = len(cursors)
+    total_pages = max(1, -(-total // page_size))
+    col_prev, col_info, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if page_no > 1 and st.button("◀ Önceki", key=f"{key}_prev", use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with col_info:
+        st.markdown(f"Sayfa {page_no} / {total_pages}")
+    with col_next:
+        if next_cursor is not None and st.button("Sonraki ▶", key=f"{key}_next", use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun()
+
+def search_select(label, search, key, describe, all_option=None):
+    # Arama kutusu + en iyi eşleşmelerden seçim; tam liste yüklenmez.
+    # Seçilen kaydın ID'sini döndürür (all_option seçiliyse None)
+    query = st.text_input(label, key=f"{key}_query", placeholder="Aramak için yazın...")
+    labels = {row[0]: describe(row) for row in search(query, SEARCH_RESULTS)}
+    if all_option is not None:
+        labels = {None: all_option, **labels}
+    if not labels:
+        st.caption("Eşleşme yok")
+        return None
+    return st.selectbox(label, list(labels), format_func=labels.get, key=key, label_visibility="collapsed")
+
+def component_options(query, exclude_product=None, current=None):
+    # Ürün ağacına eklenebilecek bileşenler: aramaya uyan hammaddeler ve alt montajlar
+    options = [("material", id, name) for id, name, _ in backend.search_materials(query, SEARCH_RESULTS)]
+    options += [("product", id, name) for id, name in backend.search_products(query, SEARCH_RESULTS)
+                if id != exclude_product]
+    if current is not None and current not in options:
+        options.insert(0, current)
+    return options
+
+def format_component(option):
+    kind, _, name = option
+    return f"🧱 {name}" if kind == "material" else f"🛠️ {name} (alt montaj)"
+
+def bom_editor(prefix, exclude_product=None):
+    # Dinamik BOM satırları; (malzemeler, alt montajlar) listelerini döndürür
+    rows_key = f"{prefix}bom_rows"
+    if rows_key not in st.session_state:
+        st.session_state[rows_key] = 1
+    for i in range(st.session_state[rows_key]):
+        cols = st.columns([2, 3, 1, 1])
+        with cols[0]:
+            query = st.text_input(f"Ara {i+1}", key=f"{prefix}bom_search_{i}", placeholder="Bileşen ara...")
+        with cols[1]:
+            st.selectbox(
+                f"Bileşen {i+1}", 
+                component_options(query, exclude_product, st.session_state.get(f"{prefix}mat_{i}")),
+                format_func=format_component,
+                key=f"{prefix}mat_{i}"
+            )
+        with cols[2]:
+            st.number_input(
+                f"Miktar", 
+                min_value=1,
+                key=f"{prefix}qty_{i}"
+            )
+        with cols[3]:
+            if i > 0 and st.button("❌", key=f"{prefix}remove_{i}"):
+                st.session_state[rows_key] -= 1
+                st.rerun()
+
+    if st.button("➕ Bileşen Ekle", key=f"{prefix}add_row"):
+        st.session_state[rows_key] += 1
+        st.rerun()
+
+    # Aynı bileşen birden fazla satırda seçildiyse miktarları topla
+    lines = {}
+    for i in range(st.session_state[rows_key]):
+        if st.session_state.get(f"{prefix}mat_{i}") is None:
+            continue
+        kind, id, _ = st.session_state[f"{prefix}mat_{i}"]
+        lines[(kind, id)] = lines.get((kind, id), 0) + st.session_state[f"{prefix}qty_{i}"]
+    bom = [(id, qty) for (kind, id), qty in lines.items() if kind == "material"]
+    components = [(id, qty) for (kind, id), qty in lines.items() if kind == "product"]
+    return bom, components
 
-def get_product_choices():
-    return {name: id for id, name in backend.get_products()}
+def product_lines(prefix, columns):
+    # Ürün satırları tablosu: ürünler arama kutusuyla eklenir (tam ürün listesi
+    # yüklenmez), diğer sütunlar tabloda düzenlenir, satırlar tablodan silinir.
+    # columns: {sütun: (yeni satırın değeri, column_config)}.
+    # (ürün ID, ürün adı, sütun değerleri...) satırlarını döndürür.
+    data_key, editor_key = f"{prefix}_lines", f"{prefix}_editor"
+    if data_key not in st.session_state:
+        st.session_state[data_key] = {"ID": [], "Ürün": [], **{column: [] for column in columns}}
+    edited = st.session_state[data_key]
+    if edited["ID"]:
+        edited = st.data_editor(
+            edited,
+            column_config={
+                "ID": None,
+                "Ürün": st.column_config.TextColumn("Ürün", disabled=True),
+                **{column: config for column, (_, config) in columns.items()}
+            },
+            num_rows="dynamic",
+            use_container_width=True,
+            key=editor_key
+        )
+    else:
+        # Boş tabloda sütun tipleri belirlenemez; ilk satır eklenene kadar gösterilmez
+        st.caption("Henüz satır yok; aşağıdan ürün arayıp ekleyin.")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        selected_id = search_select("Ürün Ekle", backend.search_products, f"{prefix}_product",
+                                    lambda product: product[1])
+    with col2:
+        if st.button("Satır Ekle", key=f"{prefix}_add", disabled=selected_id is None, use_container_width=True):
+            names = dict(backend.search_products(st.session_state[f"{prefix}_product_query"], SEARCH_RESULTS))
+            data = {column: list(values) for column, values in edited.items()}
+            data["ID"].append(selected_id)
+            data["Ürün"].append(names[selected_id])
+            for column, (value, _) in columns.items():
+                data[column].append(value)
+            # Tablodaki düzenlemeler artık verinin parçası
+            st.session_state[data_key] = data
+            st.session_state.pop(editor_key, None)
+            st.rerun()
+    return list(zip(edited["ID"], edited["Ürün"], *(edited[column] for column in columns)))
+
+def resolve_products(rows):
+    # Dosya satırlarının ilk hücresi ürün adı veya ID'dir; yalnızca dosyadaki
+    # adlar sorgulanır. (ürün ID veya None, hücre, kalan hücreler...) döndürür
+    found = backend.find_products(str(row[0]).strip() for row in rows)
+    resolved = []
+    for product, *rest in rows:
+        product = str(product).strip()
+        resolved.append((found.get(product) or (int(product) if product.isdigit() else None), product, *rest))
+    return resolved
 
 # Ana uygulama
 def main():
@@ -94,7 +242,7 @@ def main():
         
         page = st.radio(
             "Navigasyon",
-            ["🏠 Pano", "📦 Envanter", "🛠️ Ürünler/Ürün Ağacı", "🛒 Siparişler", "📜 Sipariş Geçmişi"],
+            ["🏠 Pano", "📦 Envanter", "🛠️ Ürünler/Ürün Ağacı", "🛒 Siparişler", "📜 Sipariş Geçmişi", "📅 Planlama", "⚖️ Stok Tahsisi", "🧾 Fatura Girişi", "📥 İçe/Dışa Aktar", "⚡ Performans"],
             label_visibility="collapsed"
         )
 
@@ -106,20 +254,54 @@ def main():
         
         with col1:
             st.markdown('<div class="card"><h3>Toplam Malzeme</h3><h2 style="color: #4CAF50;">' + 
-                         str(len(backend.get_inventory())) + '</h2></div>', unsafe_allow_html=True)
+                         str(backend.count_materials()) + '</h2></div>', unsafe_allow_html=True)
         
         with col2:
             st.markdown('<div class="card"><h3>Toplam Ürün</h3><h2 style="color: #2196F3;">' + 
-                         str(len(backend.get_products())) + '</h2></div>', unsafe_allow_html=True)
+                         str(backend.count_products()) + '</h2></div>', unsafe_allow_html=True)
         
         with col3:
             st.markdown('<div class="card"><h3>Toplam Sipariş</h3><h2 style="color: #FF9800;">' + 
-                         str(len(backend.get_order_history())) + '</h2></div>', unsafe_allow_html=True)
+                         str(backend.count_orders()) + '</h2></div>', unsafe_allow_html=True)
+        
+        # Tüketim eğilimi ve stok yeterliliği (özet tablolardan okunur)
+        st.markdown('<div class="subheader">Malzeme Tüketimi</div>', unsafe_allow_html=True)
+        col1, col2 = st.columns([2, 1], gap="large")
+        
+        with col1:
+            selected = search_select("Malzeme", backend.search_materials, "consumption_material",
+                                     lambda material: material[1], all_option="Tümü")
+            period = st.radio("Dönem", ["Günlük (30 gün)", "Haftalık (12 hafta)"], horizontal=True, key="consumption_period")
+            trend = backend.get_consumption(
+                selected,
+                "day" if period.startswith("Günlük") else "week",
+                30 if period.startswith("Günlük") else 12
+            )
+            st.bar_chart(
+                {"Dönem": [start for start, _ in trend], "Tüketim": [used for _, used in trend]},
+                x="Dönem", y="Tüketim"
+            )
+        
+        with col2:
+            st.markdown("**Stok Yeterliliği (son 30 gün)**")
+            cover = [row for row in backend.get_days_of_cover(30) if row[4] is not None][:10]
+            if cover:
+                st.dataframe(
+                    [{
+                        "Malzeme": name,
+                        "Stok": on_hand,
+                        "Günlük": round(daily, 1),
+                        "Yeterlilik (gün)": round(days, 1)
+                    } for _, name, on_hand, daily, days in cover],
+                    hide_index=True,
+                    use_container_width=True
+                )
+            else:
+                st.markdown('<div class="info-box">Son 30 günde tüketim yok</div>', unsafe_allow_html=True)
         
         st.markdown('<div class="subheader">Son Siparişler</div>', unsafe_allow_html=True)
-        history = backend.get_order_history()
-        if history:
-            recent_orders = history[:5]
+        recent_orders = backend.get_order_history(limit=5)
+        if recent_orders:
             st.table([{
                 "Sipariş ID": order_id,
                 "Ürün": pname,
@@ -151,16 +333,11 @@ def main():
                                 st.markdown(f'<div class="error-box">{str(e)}</div>', unsafe_allow_html=True)
                 
                 with st.expander("🔄 Stok Güncelle"):
-                    materials = backend.get_inventory()
-                    if materials:
-                        material_id = st.selectbox(
-                            "Malzeme Seç", 
-                            [f"{id} - {name} (Mevcut: {qty})" for id, name, qty in materials],
-                            key="update_select"
-                        )
-                        selected_id = int(material_id.split(" - ")[0])
+                    if backend.count_materials():
+                        selected_id = search_select("Malzeme Seç", backend.search_materials, "update_select",
+                                                    lambda material: f"{material[1]} (Mevcut: {material[2]})")
                         new_qty = st.number_input("Yeni Miktar", min_value=0, key="update_qty")
-                        if st.button("Miktarı Güncelle", use_container_width=True):
+                        if st.button("Miktarı Güncelle", use_container_width=True, disabled=selected_id is None):
                             backend.update_material(selected_id, new_qty)
                             st.markdown('<div class="success-box">Miktar başarıyla güncellendi!</div>', unsafe_allow_html=True)
                             st.rerun()
@@ -169,19 +346,16 @@ def main():
         
         with col2:
             st.markdown('<div class="subheader">Mevcut Envanter</div>', unsafe_allow_html=True)
-            inventory = backend.get_inventory()
+            inventory = backend.get_inventory(result='columns')
             
-            if inventory:
-                # Durum göstergeleri ile güzel bir tablo oluştur
-                inventory_data = []
-                for id, name, qty in inventory:
-                    status = "🟢" if qty > 10 else "🟡" if qty > 0 else "🔴"
-                    inventory_data.append({
-                        "ID": id,
-                        "Malzeme": name,
-                        "Miktar": qty,
-                        "Durum": status
-                    })
+            if inventory["id"]:
+                # Durum göstergeleri ile güzel bir tablo oluştur (satır satır sözlük yerine sütunlar)
+                inventory_data = {
+                    "ID": inventory["id"],
+                    "Malzeme": inventory["name"],
+                    "Miktar": inventory["quantity"],
+                    "Durum": ["🟢" if qty > 10 else "🟡" if qty > 0 else "🔴" for qty in inventory["quantity"]]
+                }
                 
                 st.dataframe(
                     inventory_data,
@@ -196,13 +370,9 @@ def main():
                 )
                 
                 with st.expander("🗑️ Malzeme Sil"):
-                    material_id = st.selectbox(
-                        "Silinecek malzemeyi seç", 
-                        [f"{id} - {name}" for id, name, _ in inventory],
-                        key="delete_select"
-                    )
-                    selected_id = int(material_id.split(" - ")[0])
-                    if st.button("Malzemeyi Sil", use_container_width=True, type="primary"):
+                    selected_id = search_select("Silinecek malzemeyi seç", backend.search_materials, "delete_select",
+                                                lambda material: material[1])
+                    if st.button("Malzemeyi Sil", use_container_width=True, type="primary", disabled=selected_id is None):
                         try:
                             backend.delete_material(selected_id)
                             st.markdown('<div class="success-box">Malzeme başarıyla silindi!</div>', unsafe_allow_html=True)
@@ -216,55 +386,22 @@ def main():
     elif page == "🛠️ Ürünler/Ürün Ağacı":
         st.markdown('<div class="header">🛠️ Ürün & Ürün Ağacı Yönetimi</div>', unsafe_allow_html=True)
         
-        tab1, tab2, tab3 = st.tabs(["➕ Ürün Ekle", "👀 Ürünleri Görüntüle", "🗑️ Ürün Sil"])
+        tab1, tab2, tab_edit, tab3 = st.tabs(["➕ Ürün Ekle", "👀 Ürünleri Görüntüle", "✏️ Ürün Ağacı Düzenle", "🗑️ Ürün Sil"])
         
         with tab1:
             st.markdown('<div class="subheader">Yeni Ürün Ekle</div>', unsafe_allow_html=True)
             product_name = st.text_input("Ürün Adı", placeholder="Örn: Sandalye, Masa")
             
             st.markdown('<div class="subheader">Ürün Ağacı (BOM)</div>', unsafe_allow_html=True)
-            materials = backend.get_inventory()
-            
-            if not materials:
+            if not backend.count_materials() and not backend.count_products():
                 st.markdown('<div class="info-box">Kullanılabilir malzeme yok. Önce malzeme ekleyin.</div>', unsafe_allow_html=True)
             else:
-                # Dinamik BOM satırları
-                for i in range(st.session_state.bom_rows):
-                    cols = st.columns([3, 1, 1])
-                    with cols[0]:
-                        mat_name = st.selectbox(
-                            f"Malzeme {i+1}", 
-                            [name for _, name, _ in materials],
-                            key=f"mat_{i}"
-                        )
-                    with cols[1]:
-                        qty = st.number_input(
-                            f"Miktar", 
-                            min_value=1, value=1,
-                            key=f"qty_{i}"
-                        )
-                    with cols[2]:
-                        if i > 0 and st.button("❌", key=f"remove_{i}"):
-                            st.session_state.bom_rows -= 1
-                            st.rerun()
-                
-                col_add, col_submit = st.columns([1, 3])
-                with col_add:
-                    if st.button("➕ Malzeme Ekle", use_container_width=True):
-                        st.session_state.bom_rows += 1
-                        st.rerun()
+                # Dinamik BOM satırları (hammadde veya alt montaj)
+                bom, components = bom_editor("")
                 
                 if st.button("Ürün Ekle", type="primary", use_container_width=True):
                     try:
-                        # BOM girişlerini al
-                        bom = []
-                        material_map = {name: id for id, name, _ in materials}
-                        for i in range(st.session_state.bom_rows):
-                            mat_name = st.session_state[f"mat_{i}"]
-                            qty = st.session_state[f"qty_{i}"]
-                            bom.append((material_map[mat_name], qty))
-                        
-                        backend.add_product(product_name, bom)
+                        backend.add_product(product_name, bom, components)
                         st.session_state.bom_rows = 1
                         st.markdown('<div class="success-box">Ürün başarıyla eklendi!</div>', unsafe_allow_html=True)
                     except Exception as e:
@@ -272,13 +409,33 @@ def main():
         
         with tab2:
             st.markdown('<div class="subheader">Mevcut Ürünler</div>', unsafe_allow_html=True)
-            products = backend.get_products()
+            # Yalnızca görünen sayfadaki ürünler ve ürün ağaçları yüklenir
+            products = backend.get_products(limit=PRODUCTS_PAGE_SIZE + 1, after=page_cursor("products"))
+            has_next = len(products) > PRODUCTS_PAGE_SIZE
+            products = products[:PRODUCTS_PAGE_SIZE]
             if products:
+                boms = backend.get_boms([product_id for product_id, _ in products])
+                buildable = backend.get_buildable_quantities()
+                st.dataframe(
+                    [{
+                        "ID": product_id,
+                        "Ürün": name,
+                        "Üretilebilir Miktar": buildable.get(product_id)
+                    } for product_id, name in products],
+                    column_config={
+                        "Üretilebilir Miktar": st.column_config.NumberColumn(
+                            "Üretilebilir Miktar",
+                            help="Mevcut stokla üretilebilecek adet (ürün ağacı yoksa boş)"
+                        )
+                    },
+                    hide_index=True,
+                    use_container_width=True
+                )
                 for product_id, name in products:
-                    with st.expander(f"🛠️ {name}", expanded=True):
-                        bom = backend.get_bom(product_id)
+                    with st.expander(f"🛠️ {name}", expanded=False):
+                        bom = boms[product_id]
                         if bom:
-                            st.markdown("**Ürün Ağacı:**")
+                            st.markdown("**Ürün Ağacı (alt montajlar dahil hammadde ihtiyacı):**")
                             bom_data = []
                             for mid, mname, qty in bom:
                                 bom_data.append({
@@ -292,44 +449,62 @@ def main():
                             )
                         else:
                             st.markdown('<div class="info-box">Bu ürün için tanımlı ürün ağacı yok</div>', unsafe_allow_html=True)
+                page_nav("products", products[-1][0] if has_next else None,
+                         backend.count_products(), PRODUCTS_PAGE_SIZE)
             else:
                 st.markdown('<div class="info-box">Kullanılabilir ürün yok</div>', unsafe_allow_html=True)
         
+        with tab_edit:
+            st.markdown('<div class="subheader">Ürün Ağacını Düzenle</div>', unsafe_allow_html=True)
+            product_id = search_select("Düzenlenecek ürünü seç", backend.search_products, "edit_product",
+                                       lambda product: product[1])
+            if product_id is not None:
+                # Ürün değiştiğinde satırları mevcut ürün ağacıyla doldur
+                if st.session_state.get("edit_loaded") != product_id:
+                    lines = backend.get_bom_lines(product_id)
+                    st.session_state.edit_loaded = product_id
+                    st.session_state.edit_bom_rows = max(1, len(lines))
+                    for i, (kind, id, name, qty) in enumerate(lines):
+                        st.session_state[f"edit_mat_{i}"] = (kind, id, name)
+                        st.session_state[f"edit_qty_{i}"] = qty
+                
+                bom, components = bom_editor("edit_", exclude_product=product_id)
+                if st.button("Ürün Ağacını Kaydet", type="primary", use_container_width=True):
+                    try:
+                        backend.update_bom(product_id, bom, components)
+                        st.markdown('<div class="success-box">Ürün ağacı başarıyla güncellendi!</div>', unsafe_allow_html=True)
+                    except Exception as e:
+                        st.markdown(f'<div class="error-box">{str(e)}</div>', unsafe_allow_html=True)
+            elif not backend.count_products():
+                st.markdown('<div class="info-box">Kullanılabilir ürün yok</div>', unsafe_allow_html=True)
+        
         with tab3:
             st.markdown('<div class="subheader">Ürün Sil</div>', unsafe_allow_html=True)
-            products = backend.get_products()
-            if products:
-                product_id = st.selectbox(
-                    "Silinecek ürünü seç", 
-                    [f"{id} - {name}" for id, name in products],
-                    key="delete_product"
-                )
-                selected_id = int(product_id.split(" - ")[0])
+            selected_id = search_select("Silinecek ürünü seç", backend.search_products, "delete_product",
+                                        lambda product: product[1])
+            if selected_id is not None:
                 if st.button("Ürünü Sil", type="primary", use_container_width=True):
-                    backend.delete_product(selected_id)
-                    st.markdown('<div class="success-box">Ürün başarıyla silindi!</div>', unsafe_allow_html=True)
-                    st.rerun()
-            else:
+                    try:
+                        backend.delete_product(selected_id)
+                        st.markdown('<div class="success-box">Ürün başarıyla silindi!</div>', unsafe_allow_html=True)
+                        st.rerun()
+                    except Exception as e:
+                        st.markdown(f'<div class="error-box">{str(e)}</div>', unsafe_allow_html=True)
+            elif not backend.count_products():
                 st.markdown('<div class="info-box">Kullanılabilir ürün yok</div>', unsafe_allow_html=True)
 
     # Sipariş Yönetimi
     elif page == "🛒 Siparişler":
         st.markdown('<div class="header">🛒 Sipariş Yönetimi</div>', unsafe_allow_html=True)
         
-        products = backend.get_products()
-        
-        if not products:
+        if not backend.count_products():
             st.markdown('<div class="info-box">Sipariş verilebilecek ürün yok</div>', unsafe_allow_html=True)
         else:
             with st.container():
                 col1, col2 = st.columns(2)
                 with col1:
-                    product_id = st.selectbox(
-                        "Ürün Seç", 
-                        [f"{id} - {name}" for id, name in products],
-                        key="order_product"
-                    )
-                    selected_id = int(product_id.split(" - ")[0])
+                    selected_id = search_select("Ürün Seç", backend.search_products, "order_product",
+                                                lambda product: product[1])
                 
                 with col2:
                     quantity = st.number_input(
@@ -339,7 +514,14 @@ def main():
                         key="order_qty"
                     )
                 
-                if st.button("Sipariş Ver", type="primary", use_container_width=True):
+                col1, col2 = st.columns(2)
+                with col1:
+                    queue = st.checkbox("Stok yetersizse bekleme kuyruğuna al", value=True, key="order_backorder")
+                with col2:
+                    priority = st.number_input("Öncelik", value=0, step=1, key="order_priority",
+                                               help="Yüksek öncelikli bekleyen siparişler stok gelince önce karşılanır")
+                
+                if st.button("Sipariş Ver", type="primary", use_container_width=True, disabled=selected_id is None):
                     success, result = backend.place_order(selected_id, quantity)
                     if success:
                         st.markdown(f"""
@@ -357,50 +539,460 @@ def main():
                             {missing_items}
                         </div>
                         """, unsafe_allow_html=True)
+                        if queue:
+                            backorder_id, order_id = backend.queue_backorder(selected_id, quantity, priority)
+                            if order_id is None:
+                                st.markdown(f'<div class="info-box">Sipariş #{backorder_id} bekleme kuyruğuna alındı; stok gelince otomatik olarak verilecek.</div>', unsafe_allow_html=True)
+                            else:
+                                st.markdown(f'<div class="success-box">Stok bu arada geldi, sipariş #{order_id} verildi.</div>', unsafe_allow_html=True)
+            
+            # Bekleyen siparişler
+            st.markdown('<div class="subheader">Bekleme Kuyruğu</div>', unsafe_allow_html=True)
+            waiting = backend.get_backorders()
+            if not waiting:
+                st.markdown('<div class="info-box">Bekleyen sipariş yok</div>', unsafe_allow_html=True)
+            else:
+                st.dataframe(
+                    [{
+                        "No": backorder_id,
+                        "Ürün": pname,
+                        "Miktar": qty,
+                        "Öncelik": prio,
+                        "Sıraya Alındı": queued,
+                        "Beklenen Malzemeler": waiting_on or "-"
+                    } for backorder_id, pname, qty, prio, queued, _, _, waiting_on in waiting],
+                    hide_index=True,
+                    use_container_width=True
+                )
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    labels = {backorder_id: f"#{backorder_id} {pname} x{qty}" for backorder_id, pname, qty, *_ in waiting}
+                    cancel = st.selectbox(
+                        "Bekleyen sipariş",
+                        list(labels),
+                        format_func=labels.get,
+                        key="backorder_cancel",
+                        label_visibility="collapsed"
+                    )
+                with col2:
+                    if st.button("İptal Et", use_container_width=True):
+                        backend.cancel_backorder(cancel)
+                        st.rerun()
+            
+            fulfilled = backend.get_backorders("fulfilled", limit=10)
+            if fulfilled:
+                with st.expander("Kuyruktan karşılanan son siparişler"):
+                    st.table([{
+                        "No": backorder_id,
+                        "Ürün": pname,
+                        "Miktar": qty,
+                        "Sipariş ID": order_id
+                    } for backorder_id, pname, qty, _, _, _, order_id, _ in fulfilled])
 
     # Sipariş Geçmişi
     elif page == "📜 Sipariş Geçmişi":
         st.markdown('<div class="header">📜 Sipariş Geçmişi</div>', unsafe_allow_html=True)
-        history = backend.get_order_history_detailed()
         
-        if not history:
-            st.markdown('<div class="info-box">Henüz sipariş verilmedi</div>', unsafe_allow_html=True)
+        col1, col2, col3 = st.columns([1, 1, 2])
+        with col1:
+            start = st.date_input("Başlangıç", value=None, key="history_start")
+        with col2:
+            end = st.date_input("Bitiş", value=None, key="history_end")
+        with col3:
+            product_id = search_select("Ürün", backend.search_products, "history_product",
+                                       lambda product: product[1], all_option="Tüm ürünler")
+        
+        # Filtre değişince ilk sayfaya dön
+        filters = (start, end, product_id)
+        if st.session_state.get("history_filters") != filters:
+            st.session_state["history_filters"] = filters
+            st.session_state["history_cursors"] = [None]
+        
+        cursor = page_cursor("history")
+        page_orders = backend.get_orders(limit=HISTORY_PAGE_SIZE + 1, after=cursor,
+                                         start=start, end=end, product_id=product_id)
+        has_next = len(page_orders) > HISTORY_PAGE_SIZE
+        page_orders = page_orders[:HISTORY_PAGE_SIZE]
+
+        if not page_orders:
+            st.markdown('<div class="info-box">Bu filtrelerle sipariş bulunamadı</div>', unsafe_allow_html=True)
         else:
-            # Sipariş detaylarını ID'ye göre grupla
-            orders = {}
-            for order_id, pname, qty, ts, mname, used in history:
-                if order_id not in orders:
-                    orders[order_id] = {
-                        "product": pname,
-                        "quantity": qty,
-                        "timestamp": ts,
-                        "materials": []
-                    }
-                orders[order_id]["materials"].append((mname, used))
-            
-            # Her siparişi bir genişletilebilir alanda göster
-            for order_id, details in sorted(orders.items(), key=lambda x: x[1]['timestamp'], reverse=True):
-                with st.expander(f"🛒 Sipariş #{order_id} - {details['product']} (x{details['quantity']}) - {details['timestamp']}", expanded=True):
+            # Malzeme dökümü yalnızca açılan siparişler için yüklenir
+            for order_id, pname, qty, ts, lines, total_used in page_orders:
+                details = st.expander(f"🛒 Sipariş #{order_id} - {pname} (x{qty}) - {ts}",
+                                      key=f"history_order_{order_id}", on_change="rerun")
+                with details:
                     st.markdown(f"""
                     <div style="margin-bottom: 1rem;">
-                        <strong>Ürün:</strong> {details['product']}<br>
-                        <strong>Miktar:</strong> {details['quantity']}<br>
-                        <strong>Tarih:</strong> {details['timestamp']}
+                        <strong>Ürün:</strong> {pname}<br>
+                        <strong>Miktar:</strong> {qty}<br>
+                        <strong>Tarih:</strong> {ts}<br>
+                        <strong>Malzeme:</strong> {lines} kalem, toplam {total_used}
                     </div>
                     """, unsafe_allow_html=True)
                     
-                    st.markdown("**Kullanılan Malzemeler:**")
-                    mat_data = []
-                    for mname, used in details["materials"]:
-                        mat_data.append({
-                            "Malzeme": mname,
-                            "Kullanılan Miktar": used
-                        })
+                    if details.open:
+                        st.markdown("**Kullanılan Malzemeler:**")
+                        st.dataframe(
+                            [{"Malzeme": mname, "Kullanılan Miktar": used}
+                             for _, mname, used in backend.get_order_details(order_id)],
+                            hide_index=True,
+                            use_container_width=True
+                        )
+
+            page_nav("history", page_orders[-1][0] if has_next else None,
+                     backend.count_orders(start, end, product_id), HISTORY_PAGE_SIZE)
+        
+        archives = backend.get_order_archives()
+        if archives:
+            st.caption(f"{sum(orders for _, orders, _, _ in archives)} eski sipariş {len(archives)} aylık arşivde "
+                       f"({archives[-1][0]} – {archives[0][0]}); gerektiğinde arşivden okunur.")
+
+    # Malzeme İhtiyaç Planlaması (yalnızca simülasyon, stok değişmez)
+    elif page == "📅 Planlama":
+        st.markdown('<div class="header">📅 Malzeme İhtiyaç Planlaması</div>', unsafe_allow_html=True)
+        st.markdown('<div class="info-box">Siparişler verilmeden önce hangi malzemelerin ne kadar eksik kalacağını gösterir. Stok değiştirilmez.</div>', unsafe_allow_html=True)
+        
+        if backend.count_products() == 0:
+            st.markdown('<div class="info-box">Planlanabilecek ürün yok</div>', unsafe_allow_html=True)
+        else:
+            uploaded = st.file_uploader(
+                "Sipariş listesi (CSV: urun, miktar, termin)", type="csv",
+                help="urun sütunu ürün adı veya ID olabilir, termin YYYY-AA-GG biçimindedir"
+            )
+            if uploaded is None:
+                rows = product_lines("plan", {
+                    "Miktar": (1, st.column_config.NumberColumn("Miktar", min_value=1, step=1, required=True)),
+                    "Termin": (date.today(), st.column_config.DateColumn("Termin", required=True))
+                })
+            else:
+                reader = csv.reader(io.TextIOWrapper(uploaded, encoding="utf-8-sig"))
+                rows = [row[:3] for row in reader if len(row) >= 3]
+                if rows and not rows[0][1].strip().isdigit():
+                    rows = rows[1:]  # başlık satırı
+                rows = resolve_products(rows)
+            
+            if st.button("Planla", type="primary", use_container_width=True):
+                lines, labels, errors = [], [], []
+                for number, (product_id, product, qty, due) in enumerate(rows, start=1):
+                    if product_id is None or not str(qty).strip().isdigit():
+                        errors.append(number)
+                        continue
+                    lines.append((product_id, int(qty), str(due)))
+                    labels.append((number, product, str(due)))
+                if errors:
+                    st.markdown(f'<div class="error-box">Okunamayan satırlar atlandı: {", ".join(map(str, errors[:20]))}</div>', unsafe_allow_html=True)
+                
+                plan = backend.plan_requirements(lines)
+                shortages = [row for row in plan if row[4] > 0]
+                if not shortages:
+                    st.markdown(f'<div class="success-box">{len(lines)} satırlık plan mevcut stokla karşılanabiliyor.</div>', unsafe_allow_html=True)
+                else:
+                    st.markdown(f'<div class="error-box">{len(shortages)} malzemede eksik var.</div>', unsafe_allow_html=True)
+                    st.dataframe(
+                        [{
+                            "Malzeme": name,
+                            "Mevcut": on_hand,
+                            "İhtiyaç": demand,
+                            "Eksik": shortfall,
+                            "İlk Etkilenen Satır": labels[blocked][0],
+                            "Ürün": labels[blocked][1],
+                            "Termin": labels[blocked][2]
+                        } for _, name, on_hand, demand, shortfall, blocked in sorted(shortages, key=lambda row: -row[4])],
+                        hide_index=True,
+                        use_container_width=True
+                    )
+
+    # Kıt stokun rakip ürünler arasında paylaştırılması (yalnızca öneri, stok değişmez)
+    elif page == "⚖️ Stok Tahsisi":
+        st.markdown('<div class="header">⚖️ Stok Tahsisi</div>', unsafe_allow_html=True)
+        st.markdown('<div class="info-box">Aynı malzemeleri kullanan ürünler için mevcut stokla en değerli üretim karışımını hesaplar. Stok değiştirilmez.</div>', unsafe_allow_html=True)
+
+        if backend.count_products() == 0:
+            st.markdown('<div class="info-box">Tahsis yapılabilecek ürün yok</div>', unsafe_allow_html=True)
+        else:
+            uploaded = st.file_uploader(
+                "Talep listesi (CSV: urun, talep, agirlik)", type="csv", key="allocation_file",
+                help="urun sütunu ürün adı veya ID olabilir; agirlik bir birimin değeri/önceliğidir (boşsa 1)"
+            )
+            if uploaded is None:
+                rows = product_lines("allocation", {
+                    "Talep": (1, st.column_config.NumberColumn("Talep", min_value=0, step=1, required=True)),
+                    "Ağırlık": (1.0, st.column_config.NumberColumn("Ağırlık", min_value=0.0, required=True))
+                })
+            else:
+                reader = csv.reader(io.TextIOWrapper(uploaded, encoding="utf-8-sig"))
+                rows = [(row + [""])[:3] for row in reader if len(row) >= 2]
+                if rows and not rows[0][1].strip().isdigit():
+                    rows = rows[1:]  # başlık satırı
+                rows = resolve_products(rows)
+
+            col1, col2 = st.columns(2)
+            with col1:
+                greedy = st.checkbox("Yalnızca hızlı sezgisel yöntem", value=not backend.milp,
+                                     disabled=not backend.milp,
+                                     help="Tamsayı programlama için scipy gerekir; yoksa sezgisel yöntem kullanılır")
+            with col2:
+                time_limit = st.number_input("Çözücü süre sınırı (sn)", min_value=1, value=int(backend.ALLOCATION_TIME_LIMIT),
+                                             disabled=greedy)
+
+            if st.button("Optimize Et", type="primary", use_container_width=True):
+                # Aynı ürün birden çok satırda ise talepler toplanır, en yüksek ağırlık kullanılır
+                lines, errors = {}, []
+                for number, (product_id, _, qty, weight) in enumerate(rows, start=1):
+                    try:
+                        qty, weight = int(str(qty).strip()), float(str(weight).strip().replace(",", ".") or 1)
+                    except ValueError:
+                        product_id = None
+                    if product_id is None or qty < 0 or weight < 0:
+                        errors.append(number)
+                        continue
+                    demand, best = lines.get(product_id, (0, 0.0))
+                    lines[product_id] = (demand + qty, max(best, weight))
+                if errors:
+                    st.markdown(f'<div class="error-box">Okunamayan satırlar atlandı: {", ".join(map(str, errors[:20]))}</div>', unsafe_allow_html=True)
+
+                try:
+                    result = backend.optimize_allocation(
+                        [(product_id, demand, weight) for product_id, (demand, weight) in lines.items()],
+                        method="greedy" if greedy else "auto", time_limit=time_limit
+                    )
+                except ValueError as e:
+                    st.markdown(f'<div class="error-box">{str(e)}</div>', unsafe_allow_html=True)
+                else:
+                    methods = {"milp": "Tamsayı programlama", "greedy": "Sezgisel"}
+                    statuses = {"optimal": "en iyi çözüm", "time_limit": "süre sınırında bulunan çözüm", "heuristic": "yaklaşık çözüm"}
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("Toplam Değer", f"{result['objective']:,.0f}")
+                    col2.metric("Yöntem", methods[result["method"]], statuses[result["status"]], delta_color="off")
+                    col3.metric("Süre", f"{result['seconds']:.2f} sn")
+
+                    st.markdown('<div class="subheader">Üretim Karışımı</div>', unsafe_allow_html=True)
                     st.dataframe(
-                        mat_data,
+                        [{
+                            "Ürün": name,
+                            "Talep": demand,
+                            "Ağırlık": weight,
+                            "Üretilecek": units,
+                            "Karşılanmayan": demand - units
+                        } for _, name, demand, weight, units in sorted(result["products"], key=lambda row: row[4] - row[2])],
                         hide_index=True,
                         use_container_width=True
                     )
+                    if result["materials"]:
+                        st.markdown('<div class="subheader">Kıt Malzemeler</div>', unsafe_allow_html=True)
+                        st.dataframe(
+                            [{
+                                "Malzeme": name,
+                                "Mevcut": on_hand,
+                                "Tam Talep İhtiyacı": needed,
+                                "Kullanılan": used,
+                                "Kalan": on_hand - used
+                            } for _, name, on_hand, needed, used in sorted(result["materials"], key=lambda row: row[3] - row[2], reverse=True)],
+                            hide_index=True,
+                            use_container_width=True
+                        )
+                    else:
+                        st.markdown('<div class="success-box">Tüm talep mevcut stokla karşılanabiliyor.</div>', unsafe_allow_html=True)
+
+    # Faturadan stok girişi: OCR metni → satırlar → kontrol → tek işlemde stok
+    elif page == "🧾 Fatura Girişi":
+        st.markdown('<div class="header">🧾 Faturadan Stok Girişi</div>', unsafe_allow_html=True)
+        
+        if deneme is not None:
+            uploaded = st.file_uploader("Fatura görüntüsü", type=["png", "jpg", "jpeg", "webp", "tif", "tiff"])
+        else:
+            uploaded = None
+            st.markdown('<div class="info-box">OCR için pytesseract kurulu değil; fatura metnini aşağıya yapıştırabilirsiniz.</div>', unsafe_allow_html=True)
+        text = st.text_area("Fatura metni", height=200, key="invoice_text",
+                            help="Görüntü yüklenirse metin OCR ile okunur")
+        
+        if st.button("Satırları Çıkar", use_container_width=True):
+            if uploaded is not None:
+                with st.spinner("Fatura okunuyor..."):
+                    text = deneme.extract_text_from_image(uploaded)
+            st.session_state.invoice_items = invoice.match_invoice(text)
+            st.session_state.invoice_materials = {}
+        
+        items = st.session_state.get("invoice_items")
+        if items is not None:
+            if not items:
+                st.markdown('<div class="info-box">Metinde fatura satırı bulunamadı</div>', unsafe_allow_html=True)
+            else:
+                st.markdown('<div class="subheader">Kontrol</div>', unsafe_allow_html=True)
+                # Seçenekler: satırların aday malzemeleri ve aranıp bulunanlar; tam liste yüklenmez
+                query = st.text_input("Listede olmayan malzemeyi ara", key="invoice_material_query",
+                                      placeholder="Aramak için yazın...")
+                found = st.session_state.setdefault("invoice_materials", {})
+                if query:
+                    found.update({name: id for id, name, _ in backend.search_materials(query, SEARCH_RESULTS)})
+                material_ids = {name: id for _, _, _, candidates in items for id, name, _ in candidates}
+                material_ids.update(found)
+                reviewed = st.data_editor(
+                    {
+                        "Uygula": [bool(candidates) and quantity is not None for _, _, quantity, candidates in items],
+                        "Fatura Satırı": [line for line, _, _, _ in items],
+                        "Malzeme": [candidates[0][1] if candidates else None for _, _, _, candidates in items],
+                        "Benzerlik": [candidates[0][2] if candidates else 0.0 for _, _, _, candidates in items],
+                        "Miktar": [quantity or 0 for _, _, quantity, _ in items]
+                    },
+                    column_config={
+                        "Uygula": st.column_config.CheckboxColumn("Uygula"),
+                        "Fatura Satırı": st.column_config.TextColumn("Fatura Satırı", disabled=True),
+                        "Malzeme": st.column_config.SelectboxColumn("Malzeme", options=list(material_ids)),
+                        "Benzerlik": st.column_config.ProgressColumn("Benzerlik", min_value=0.0, max_value=1.0, format="%.2f"),
+                        "Miktar": st.column_config.NumberColumn("Miktar", min_value=0, step=1)
+                    },
+                    hide_index=True,
+                    use_container_width=True,
+                    key="invoice_review"
+                )
+                
+                if st.button("Stoğa İşle", type="primary", use_container_width=True):
+                    receipts = [
+                        (material_ids[name], int(qty))
+                        for apply, name, qty in zip(reviewed["Uygula"], reviewed["Malzeme"], reviewed["Miktar"])
+                        if apply and name in material_ids and qty
+                    ]
+                    if not receipts:
+                        st.markdown('<div class="error-box">İşlenecek satır seçilmedi</div>', unsafe_allow_html=True)
+                    else:
+                        try:
+                            filled = backend.receive_stock(receipts)
+                        except Exception as e:
+                            st.markdown(f'<div class="error-box">{str(e)}</div>', unsafe_allow_html=True)
+                        else:
+                            del st.session_state.invoice_items
+                            st.markdown(f'<div class="success-box">{len(receipts)} satır stoğa işlendi.</div>', unsafe_allow_html=True)
+                            if filled:
+                                st.markdown(f'<div class="info-box">Bekleme kuyruğundan {len(filled)} sipariş karşılandı.</div>', unsafe_allow_html=True)
+
+    # Toplu içe/dışa aktarma (CSV veya Parquet)
+    elif page == "📥 İçe/Dışa Aktar":
+        st.markdown('<div class="header">📥 İçe/Dışa Aktar</div>', unsafe_allow_html=True)
+        
+        tab_import, tab_export = st.tabs(["İçe Aktar", "Dışa Aktar"])
+        
+        with tab_import:
+            kind = st.radio("Veri", ["Malzemeler", "Ürün Ağaçları"], horizontal=True, key="import_kind")
+            if kind == "Malzemeler":
+                st.markdown('<div class="info-box">Sütunlar: name, quantity. Yeni malzemeler eklenir, mevcut olanların stoğu güncellenir.</div>', unsafe_allow_html=True)
+                mode = st.radio("Mevcut malzemeler için", ["Stoğu değiştir", "Stoğa ekle"], horizontal=True, key="import_mode")
+            else:
+                st.markdown('<div class="info-box">Sütunlar: product, material, quantity. Olmayan ürünler oluşturulur, malzemeler önceden tanımlı olmalıdır.</div>', unsafe_allow_html=True)
+            uploaded = st.file_uploader("Dosya", type=["csv", "parquet"], key="import_file")
+            # Excel'in Türkçe CSV çıktısı UTF-8 değil, Windows-1254 kodlamalıdır
+            encodings = {"UTF-8": "utf-8-sig", "Windows-1254 (Excel)": "cp1254"}
+            encoding = encodings[st.radio("CSV karakter kodlaması", list(encodings), horizontal=True, key="import_encoding")]
+            
+            if uploaded is not None and st.button("İçe Aktar", type="primary", use_container_width=True):
+                fmt = "parquet" if uploaded.name.lower().endswith(".parquet") else "csv"
+                try:
+                    with st.spinner("İçe aktarılıyor..."):
+                        if kind == "Malzemeler":
+                            result = backend.import_materials(uploaded, fmt, mode="set" if mode == "Stoğu değiştir" else "add",
+                                                              encoding=encoding)
+                        else:
+                            result = backend.import_boms(uploaded, fmt, encoding=encoding)
+                except Exception as e:
+                    st.markdown(f'<div class="error-box">{str(e)}</div>', unsafe_allow_html=True)
+                else:
+                    st.markdown(f'<div class="success-box">{result["rows"]} satırdan {result["imported"]} tanesi içe aktarıldı.</div>', unsafe_allow_html=True)
+                    if result["errors"]:
+                        st.markdown(f'<div class="error-box">{result["errors"]} satır atlandı.</div>', unsafe_allow_html=True)
+                        st.dataframe(
+                            [{"Satır": number, "Hata": message} for number, message in result["error_rows"]],
+                            hide_index=True,
+                            use_container_width=True
+                        )
+        
+        with tab_export:
+            fmt = st.radio("Biçim", ["csv", "parquet"], horizontal=True, key="export_fmt")
+            col1, col2 = st.columns(2)
+            for col, label, export, filename in (
+                (col1, "Malzemeler", backend.export_materials, "materials"),
+                (col2, "Ürün Ağaçları", backend.export_boms, "boms")
+            ):
+                with col:
+                    # Dosya yalnızca istendiğinde hazırlanır, her yeniden çizimde değil
+                    if st.button(f"{label} dosyasını hazırla", use_container_width=True, key=f"prepare_{filename}"):
+                        buffer = io.BytesIO()
+                        try:
+                            export(buffer, fmt)
+                            st.session_state[f"export_{filename}"] = (fmt, buffer.getvalue())
+                        except Exception as e:
+                            st.markdown(f'<div class="error-box">{str(e)}</div>', unsafe_allow_html=True)
+                    prepared = st.session_state.get(f"export_{filename}")
+                    if prepared and prepared[0] == fmt:
+                        st.download_button(
+                            f"⬇️ {filename}.{fmt}", prepared[1], file_name=f"{filename}.{fmt}",
+                            use_container_width=True, key=f"download_{filename}"
+                        )
+
+    # Performans izleme
+    elif page == "⚡ Performans":
+        st.markdown('<div class="header">⚡ Performans</div>', unsafe_allow_html=True)
+        settings = backend.instrumentation_settings()
+        
+        col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
+        with col1:
+            enabled = st.toggle("Ölçümü aç", value=settings["enabled"])
+        with col2:
+            explain = st.toggle("Yavaş sorgularda EXPLAIN QUERY PLAN", value=settings["explain_slow"])
+        with col3:
+            slow_ms = st.number_input("Yavaş sorgu eşiği (ms)", min_value=0.0, value=settings["slow_ms"], step=10.0)
+        with col4:
+            if st.button("İstatistikleri Sıfırla", use_container_width=True):
+                backend.reset_performance_stats()
+        backend.enable_instrumentation(enabled, explain_slow=explain, slow_ms=slow_ms)
+        
+        # Tüm oturumlar için geçerli: yazmalar tek bir yazıcı iş parçacığında toplu işlenir
+        write_queue = st.toggle("Tek yazıcı kuyruğu (toplu commit)", value=backend.write_queue_enabled(),
+                                help="Eşzamanlı oturumlarda 'database is locked' beklemelerini önler", key="write_queue")
+        if write_queue != backend.write_queue_enabled():
+            backend.enable_write_queue(write_queue)
+        
+        stats = backend.get_performance_stats()
+        if not stats["functions"]:
+            st.markdown('<div class="info-box">Henüz ölçüm yok. Ölçümü açıp uygulamayı kullanın.</div>', unsafe_allow_html=True)
+        else:
+            st.markdown('<div class="subheader">Fonksiyonlar</div>', unsafe_allow_html=True)
+            st.dataframe(
+                [{
+                    "Fonksiyon": f["function"],
+                    "Çağrı": f["calls"],
+                    "Hata": f["errors"],
+                    "Toplam (ms)": round(f["total_ms"], 2),
+                    "Ortalama (ms)": round(f["mean_ms"], 3),
+                    "En Uzun (ms)": round(f["max_ms"], 2),
+                    "Dönen Satır": f["rows"],
+                    "SQL Sayısı": f["statements"],
+                    "VM Adımı": f["vm_steps"],
+                    **f["histogram"]
+                } for f in stats["functions"]],
+                hide_index=True,
+                use_container_width=True
+            )
+            
+            st.markdown('<div class="subheader">SQL İfadeleri</div>', unsafe_allow_html=True)
+            st.dataframe(
+                [{
+                    "SQL": q["sql"],
+                    "Sayı": q["count"],
+                    "Toplam (ms)": round(q["total_ms"], 2),
+                    "Ortalama (ms)": round(q["mean_ms"], 3),
+                    "En Uzun (ms)": round(q["max_ms"], 2)
+                } for q in stats["statements"][:50]],
+                hide_index=True,
+                use_container_width=True
+            )
+            
+            st.markdown('<div class="subheader">En Yavaş Sorgular</div>', unsafe_allow_html=True)
+            for entry in stats["slowest"]:
+                with st.expander(f"{entry['ms']} ms - {entry['function'] or '-'} - {entry['sql'][:80]}"):
+                    st.code(entry["sql"], language="sql")
+                    if entry["plan"]:
+                        st.code("\n".join(entry["plan"]), language="text")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,120 @@
+import re
+from collections import Counter
+
+import backend
+
+# Turns OCR'd e-invoice text into stock receipts: line items are parsed out
+# of the text and their names matched against the materials table through a
+# character trigram index, so each line only looks at materials sharing
+# trigrams with it instead of scanning the whole table.
+
+MIN_MATCH_SCORE = 0.4
+
+# OCR and typing both mix up Turkish letters with their ASCII look-alikes, so
+# names are compared with them folded away
+_TURKISH_FOLD = str.maketrans('çğıöşüÇĞİIÖŞÜâîûÂÎÛ', 'cgiosuCGIIOSUaiuAIU')
+
+# Units a delivered quantity is counted in. Size units (mm, cm, inch) are
+# left out since they show up inside names such as 'Boru 20 mm'.
+UNITS = r'adet|ad|kg|gr|ton|lt|litre|mt|metre|m2|m3|paket|pk|kutu|koli|rulo|takım|tk|çift|set'
+_NUMBER = r'\d{1,3}(?:\.\d{3})+(?:,\d+)?|\d+(?:[.,]\d+)?'
+_LINE_NO = re.compile(r'^\s*\d{1,3}(?:[.)\-|]\s*|\s+)')
+_QUANTITY_WITH_UNIT = re.compile(rf'(?<![\w.,])({_NUMBER})\s*(?:{UNITS})\b', re.IGNORECASE)
+_QUANTITY = re.compile(rf'(?<![\w.,])({_NUMBER})(?![\w.,])')
+# Header, total and tax lines that also contain numbers
+_SKIP = re.compile(
+    r'toplam|tutar|kdv|vergi|iskonto|fatura|tarih|vkn|tckn|ettn|sayfa|bakiye|ödenecek|mal hizmet',
+    re.IGNORECASE
+)
+
+
+def normalize(name):
+    return ' '.join(re.findall(r'[a-z0-9]+', name.translate(_TURKISH_FOLD).lower()))
+
+
+def _trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def parse_quantity(text):
+    # Turkish number format: '.' groups thousands, ',' is the decimal mark
+    if ',' in text:
+        text = text.replace('.', '').replace(',', '.')
+    elif re.fullmatch(r'\d{1,3}(?:\.\d{3})+', text):
+        text = text.replace('.', '')
+    value = float(text)
+    return int(value) if value.is_integer() else None
+
+
+def parse_invoice_lines(text):
+    # Returns (line, name, quantity) for every line that looks like an item.
+    # The quantity is the first number followed by a unit, else the first
+    # number after the name; the name is the text before it. Quantities that
+    # are not whole numbers come back as None for the reviewer to fill in.
+    items = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or _SKIP.search(line):
+            continue
+        body = _LINE_NO.sub('', line, count=1)
+        match = _QUANTITY_WITH_UNIT.search(body)
+        if match is None:
+            match = next((m for m in _QUANTITY.finditer(body) if normalize(body[:m.start()])), None)
+        if match is None:
+            continue
+        name = body[:match.start()].strip(' |:-')
+        if normalize(name):
+            items.append((line, name, parse_quantity(match.group(1))))
+    return items
+
+
+class MaterialMatcher:
+    def __init__(self, materials):
+        # materials: (id, name) pairs
+        self.materials = [(id, name) for id, name in materials]
+        self.keys = [normalize(name) for _, name in self.materials]
+        self.index = {}
+        for position, key in enumerate(self.keys):
+            for gram in _trigrams(key):
+                self.index.setdefault(gram, []).append(position)
+        self.sizes = [len(_trigrams(key)) for key in self.keys]
+
+    def match(self, name, limit=3, min_score=MIN_MATCH_SCORE):
+        # Best (material_id, material_name, score) candidates, score being the
+        # Dice coefficient of the trigram sets (1.0 = same normalized name)
+        key = normalize(name)
+        grams = _trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.index.get(gram, ()))
+        scored = []
+        for position, count in shared.items():
+            score = 2 * count / (len(grams) + self.sizes[position])
+            if self.keys[position] == key:
+                score = 1.0
+            if score >= min_score:
+                scored.append((score, position))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(*self.materials[position], round(score, 3)) for score, position in scored[:limit]]
+
+
+_matcher = None
+
+
+def get_matcher():
+    # Rebuilt only when material names change (one-row version check), not
+    # on stock changes
+    global _matcher
+    version = backend.material_names_version()
+    if _matcher is None or _matcher[0] != version:
+        _matcher = (version, MaterialMatcher((id, name) for id, name, _ in backend.get_inventory()))
+    return _matcher[1]
+
+
+def match_invoice(text, min_score=MIN_MATCH_SCORE):
+    # Returns (line, name, quantity, candidates) per parsed item; candidates
+    # as from MaterialMatcher.match, best first (empty when nothing matches)
+    matcher = get_matcher()
+    return [(line, name, quantity, matcher.match(name, min_score=min_score))
+            for line, name, quantity in parse_invoice_lines(text)]
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# backend migrates INVENTORY_DB on import; keep that away from inventory.db
+os.environ['INVENTORY_DB'] = os.path.join(tempfile.mkdtemp(prefix='inventory-tests-'), 'import.db')
+os.environ.pop('INVENTORY_WRITE_QUEUE', None)
+
+import backend  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    # A fresh database (and archive directory) per test
+    path = str(tmp_path / 'inventory.db')
+    backend.configure(db_path=path, busy_timeout=0.5, archive_dir=str(tmp_path / 'archive'))
+    yield path
+    backend.enable_write_queue(False)
+    backend.close_connections()
@@ -0,0 +1,110 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import api_server
+import backend
+from test_cross_process import run_elsewhere
+
+
+def request(method, path, body=None):
+    # (status, payload) of one request, without a socket in between
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode() if body is not None else b''
+
+    async def send():
+        with ThreadPoolExecutor(2) as pool:
+            return await api_server.dispatch(pool, asyncio.Semaphore(4), method, path, body)
+    return asyncio.run(send())
+
+
+@pytest.fixture
+def product(db):
+    backend.add_material('Steel', 100)
+    backend.add_material('Copper', 50)
+    return backend.add_product('Frame', [(1, 2), (2, 1)])
+
+
+@pytest.mark.parametrize('quantity', [-10, 0])
+def test_order_quantity_must_be_positive(product, quantity):
+    assert request('POST', '/orders', {'product_id': product, 'quantity': quantity})[0] == 400
+    assert request('POST', '/orders/bulk', {'orders': [{'product_id': product, 'quantity': 1},
+                                                       {'product_id': product, 'quantity': quantity}]})[0] == 400
+    assert request('POST', '/backorders', {'product_id': product, 'quantity': quantity})[0] == 400
+    assert backend.get_inventory() == [(1, 'Steel', 100), (2, 'Copper', 50)]
+
+
+
+def test_order_product_must_exist(product):
+    assert request('POST', '/orders', {'product_id': 999, 'quantity': 1})[0] == 400
+    assert request('POST', '/orders/bulk', {'orders': [{'product_id': product, 'quantity': 1},
+                                                       {'product_id': 999, 'quantity': 1}]})[0] == 400
+    assert request('POST', '/backorders', {'product_id': 999, 'quantity': 1})[0] == 400
+    with pytest.raises(ValueError, match='Product does not exist'):
+        backend.place_orders([(999, 1)], atomic=False)
+    assert backend.count_orders() == 0 and backend.get_order_history() == []
+    assert backend.get_inventory() == [(1, 'Steel', 100), (2, 'Copper', 50)]
+
+
+@pytest.mark.parametrize('body', [
+    {'product_id': 1},
+    {'product_id': 1, 'quantity': '5'},
+    {'product_id': 1, 'quantity': True},
+    {'product_id': 1, 'quantity': 1.5},
+])
+def test_order_fields_are_checked(product, body):
+    assert request('POST', '/orders', body)[0] == 400
+
+
+def test_valid_order(product):
+    assert request('POST', '/orders', {'product_id': product, 'quantity': 10}) == (200, {'placed': True, 'order_id': 1})
+    assert backend.get_inventory() == [(1, 'Steel', 80), (2, 'Copper', 40)]
+
+
+@pytest.mark.parametrize('options', [
+    {'method': 'fastest'},
+    {'method': 1},
+    {'time_limit': 0},
+    {'time_limit': -1},
+    {'time_limit': 'soon'},
+    {'time_limit': True},
+    {'time_limit': 10 ** 6},
+])
+def test_allocation_options_are_checked(product, options):
+    status, payload = request('POST', '/allocation', {'lines': [{'product_id': product, 'demand': 5}], **options})
+    assert status == 400, payload
+
+
+def test_allocation(product):
+    status, payload = request('POST', '/allocation', {'lines': [{'product_id': product, 'demand': 60}],
+                                                      'method': 'greedy', 'time_limit': 1})
+    assert status == 200
+    assert payload['products'][0]['units'] == 50
+
+
+def test_current_stock_reads_share_one_cache_entry(product):
+    assert request('GET', '/materials/1/stock') == (200, {'material_id': 1, 'at': None, 'quantity': 100})
+    entries = len(backend._cache)
+    for _ in range(3):
+        assert request('GET', '/materials/1/stock')[1]['quantity'] == 100
+    assert len(backend._cache) == entries
+
+
+def test_bad_json_and_unknown_routes(product):
+    assert request('POST', '/orders', b'{')[0] == 400
+    assert request('POST', '/orders', b'[1]')[0] == 400
+    assert request('GET', '/nowhere')[0] == 404
+    assert request('PATCH', '/orders')[0] == 405
+
+
+def test_writes_by_another_process_are_seen(db, product):
+    assert request('GET', '/inventory')[1][0]['quantity'] == 100
+    assert request('GET', '/products/buildable')[1] == [{'product_id': product, 'units': 50}]
+    run_elsewhere(db, f'backend.update_material(1, -90)\nbackend.update_bom({product}, [(1, 1)])')
+    assert request('GET', '/inventory')[1][0]['quantity'] == 10
+    assert request('GET', '/products/buildable')[1] == [{'product_id': product, 'units': 10}]
+    assert request('GET', f'/products/{product}/bom')[1] == [{'material_id': 1, 'name': 'Steel', 'quantity': 1}]
+    assert request('POST', '/orders', {'product_id': product, 'quantity': 10})[1]['placed']
+    assert backend.get_inventory() == [(1, 'Steel', 0), (2, 'Copper', 50)]
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+from datetime import date, datetime
+
+import pytest
+
+import backend
+
+
+def age_orders(days_by_order):
+    # Moves orders back in time, as if placed `days` ago
+    with backend.transaction() as conn:
+        for order_id, when in days_by_order.items():
+            conn.execute('UPDATE orders SET timestamp = ?, created_at = ? WHERE id = ?',
+                         (when.strftime('%Y-%m-%d %H:%M:%S'), int(when.timestamp()), order_id))
+        backend._rebuild_consumption(conn)
+
+
+@pytest.fixture
+def history(db):
+    backend.add_material('Steel', 1000)
+    backend.add_material('Copper', 1000)
+    frame = backend.add_product('Frame', [(1, 2)])
+    cable = backend.add_product('Cable', [(1, 1), (2, 3)])
+    for index in range(12):
+        assert backend.place_order(frame if index % 3 else cable, index + 1)[0]
+    # Orders 1-8 fall in January and February 2024, the rest stay live
+    age_orders({order_id: datetime(2024, 1 + (order_id > 4), 1 + order_id, 12) for order_id in range(1, 9)})
+    return frame, cable
+
+
+def snapshot(product_id):
+    return {
+        'orders': backend.get_orders(),
+        'page': backend.get_orders(limit=5, after=backend.get_orders(limit=3)[-1][0]),
+        'filtered': backend.get_orders(start='2024-01-01', end=date(2024, 1, 31), product_id=product_id),
+        'history': backend.get_order_history_detailed(),
+        'count': backend.count_orders(),
+        'count_filtered': backend.count_orders('2024-02-01', None, product_id),
+        'details': {order_id: backend.get_order_details(order_id) for order_id in range(1, 13)},
+        'consumption': backend.get_consumption(1, periods=10000, today=date.today()),
+    }
+
+
+def test_round_trip(history):
+    frame, _ = history
+    before = snapshot(frame)
+    assert backend.archive_orders('2024-03-01') == {'2024-01': 4, '2024-02': 4}
+    archive_dir = backend._archive_dir()
+    assert sorted(os.listdir(archive_dir)) == ['orders-2024-01.db', 'orders-2024-02.db']
+    with backend.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0] == 4
+    backend.clear_cache()
+    assert snapshot(frame) == before
+    assert [(month, orders) for month, orders, _, _ in backend.get_order_archives()] == [('2024-02', 4),
+                                                                                         ('2024-01', 4)]
+
+    # Rebuilding the rollups reads the archives back
+    backend.rebuild_consumption()
+    assert snapshot(frame) == before
+
+    # Running it again finds nothing left to move
+    assert backend.archive_orders('2024-03-01') == {}
+
+
+def test_missing_archive_is_reported_not_created(history):
+    backend.archive_orders('2024-03-01')
+    path = backend._archive_path('2024-01')
+    os.remove(path)
+    with pytest.raises(FileNotFoundError, match='2024-01'):
+        backend.rebuild_consumption()
+    with pytest.raises(FileNotFoundError):
+        backend.get_order_details(1)
+    assert not os.path.exists(path)
+
+
+def test_cutoff_must_be_past(history):
+    with pytest.raises(ValueError):
+        backend.archive_orders(date(2999, 1, 1))
+
+
+def test_archive_read_inside_transaction(history):
+    backend.archive_orders('2024-03-01')
+    backend.clear_cache()
+    expected = backend.get_orders(), backend.count_orders('2024-01-01', '2024-01-03'), backend.get_order_details(1)
+    with backend.transaction() as conn:
+        backend.clear_cache()
+        assert (backend.get_orders(), backend.count_orders('2024-01-01', '2024-01-03'),
+                backend.get_order_details(1)) == expected
+        # The transaction's own connection never had the archive attached
+        assert [name for _, name, _ in conn.execute('PRAGMA database_list')] == ['main']
+    backend.clear_cache()
+    assert backend.get_orders() == expected[0]
+
+
+def test_failed_detach_drops_the_connection(history):
+    backend.archive_orders('2024-03-01')
+    with backend.connection() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            with backend._attached(conn, '2024-01') as (reader, db):
+                # A statement still running on the archive keeps it locked
+                rows = reader.execute(f'SELECT id FROM {db}.orders')
+                rows.fetchone()
+                raise sqlite3.OperationalError('boom')
+        assert conn.discard
+    backend.clear_cache()
+    assert backend.get_order_details(1)
@@ -0,0 +1,26 @@
+import pytest
+
+import backend
+
+
+@pytest.fixture
+def product(db):
+    backend.add_material('Steel', 100)
+    return backend.add_product('Frame', [(1, 2)])
+
+
+def test_unknown_material_is_rejected(product):
+    with pytest.raises(ValueError, match='Material does not exist'):
+        backend.add_product('Cable', [(1, 1), (999, 3)])
+    with pytest.raises(ValueError, match='Material does not exist'):
+        backend.update_bom(product, [(999, 1)])
+    assert backend.count_products() == 1
+    assert backend.get_bom(product) == [(1, 'Steel', 2)]
+    assert backend.place_orders([(product, 1)]) == [(True, 1)]
+
+
+def test_unknown_component_is_rejected(product):
+    with pytest.raises(ValueError, match='Sub-assembly product does not exist'):
+        backend.add_product('Bike', [], [(999, 1)])
+    with pytest.raises(ValueError, match='contain itself'):
+        backend.update_bom(product, [], [(product, 1)])
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import backend
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_elsewhere(db, code):
+    # Runs `code` in another process against the same database
+    subprocess.run([sys.executable, '-c', 'import backend\n' + code], cwd=ROOT, check=True,
+                   env={**os.environ, 'INVENTORY_DB': db})
+
+
+@pytest.fixture
+def product(db):
+    backend.add_material('Steel', 100)
+    backend.add_material('Copper', 50)
+    return backend.add_product('Frame', [(1, 2)])
+
+
+def test_order_uses_bom_changed_by_another_process(db, product):
+    assert backend.get_bom(product) == [(1, 'Steel', 2)]
+    run_elsewhere(db, f'backend.update_bom({product}, [(2, 10)])')
+    assert backend.place_order(product, 1)[0]
+    assert backend.get_inventory() == [(1, 'Steel', 100), (2, 'Copper', 40)]
+
+
+def test_sub_assembly_changed_by_another_process(db, product):
+    assembly = backend.add_product('Bike', [], [(product, 2)])
+    assert backend.place_orders([(assembly, 1)]) == [(True, 1)]
+    run_elsewhere(db, f'backend.update_bom({product}, [(2, 5)])')
+    assert backend.place_orders([(assembly, 1)]) == [(True, 2)]
+    assert backend.get_inventory() == [(1, 'Steel', 96), (2, 'Copper', 40)]
+
+
+def test_rolled_back_bom_change_is_not_kept(db, product):
+    with pytest.raises(RuntimeError):
+        with backend.transaction():
+            backend.update_bom(product, [(2, 1)])
+            # Same transaction: the order sees the new BOM
+            assert backend.place_order(product, 1)[0]
+            assert backend.get_inventory()[1] == (2, 'Copper', 49)
+            raise RuntimeError
+    assert backend.place_order(product, 1)[0]
+    assert backend.get_inventory() == [(1, 'Steel', 98), (2, 'Copper', 50)]
+
+
+def test_buildable_follows_other_processes(db, product):
+    assert backend.get_buildable_quantities() == {product: 50}
+    run_elsewhere(db, 'backend.update_material(1, -40)')
+    assert backend._feasibility.buildable() == {product: 30}
+    run_elsewhere(db, f"backend.update_bom({product}, [(2, 10)])\n"
+                      "backend.add_material('Rubber', 9)\n"
+                      "backend.add_product('Wheel', [(3, 2)])")
+    assert backend._feasibility.buildable() == {product: 5, product + 1: 4}
+    assert backend._feasibility.buildable() == backend.FeasibilityEngine().buildable()
+
+
+def test_cached_reads_follow_other_processes(db, product):
+    assert backend.get_inventory() == [(1, 'Steel', 100), (2, 'Copper', 50)]
+    assert backend.count_orders() == 0
+    run_elsewhere(db, f'backend.update_material(1, -10)\nbackend.place_order({product}, 5)')
+    # No clear_cache(): the cache notices the other process's commits
+    assert backend.get_inventory() == [(1, 'Steel', 80), (2, 'Copper', 50)]
+    assert backend.count_orders() == 1
+    assert backend.get_buildable_quantities() == {product: 40}
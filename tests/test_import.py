@@ -0,0 +1,24 @@
+import io
+
+import backend
+
+CSV = 'name,quantity\nÇelik,5\nBakır,3\n'
+
+
+def test_csv_in_another_encoding(db):
+    result = backend.import_materials(io.BytesIO(CSV.encode('cp1254')), 'csv', encoding='cp1254')
+    assert result == {'rows': 2, 'imported': 2, 'errors': 0, 'error_rows': []}
+    assert backend.get_inventory() == [(1, 'Çelik', 5), (2, 'Bakır', 3)]
+
+
+def test_undecodable_rows_are_reported(db):
+    data = 'name,quantity\nSteel,5\n'.encode() + 'Şaft,2\n'.encode('cp1254') + b'Copper,3\n'
+    result = backend.import_materials(io.BytesIO(data), 'csv', batch_size=1)
+    assert result['rows'] == 3 and result['imported'] == 2 and result['errors'] == 1
+    assert result['error_rows'][0][0] == 2 and 'utf-8' in result['error_rows'][0][1]
+    assert backend.get_inventory() == [(1, 'Steel', 5), (2, 'Copper', 3)]
+
+    result = backend.import_boms(io.BytesIO('product,material,quantity\n'.encode() + 'Çerçeve,Steel,2\n'.encode('cp1254')
+                                            + b'Frame,Steel,2\n'), 'csv')
+    assert (result['rows'], result['imported'], result['errors']) == (2, 1, 1)
+    assert backend.count_products() == 1
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+import backend
+
+
+@pytest.fixture
+def instrumented(db):
+    backend.reset_performance_stats()
+    backend.enable_instrumentation(explain_slow=True, slow_ms=0)
+    yield
+    backend.enable_instrumentation(False, explain_slow=False, slow_ms=50)
+    backend.reset_performance_stats()
+
+
+def statement(text):
+    return next(entry for entry in backend.get_performance_stats()['statements'] if text in entry['sql'])
+
+
+def test_statement_time_includes_fetching(instrumented):
+    with backend.transaction() as conn:
+        conn.executemany('INSERT INTO materials (name, quantity) VALUES (?, ?)',
+                         ((f'M{index}', index) for index in range(50000)))
+    backend.reset_performance_stats()
+    with backend.connection() as conn:
+        start = time.perf_counter()
+        conn.execute('SELECT id, name, quantity FROM materials WHERE quantity >= 0').fetchall()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    assert statement('WHERE quantity >= 0')['total_ms'] >= elapsed_ms / 2
+
+    backend.reset_performance_stats()
+    backend.get_inventory()
+    scan = statement('FROM materials ORDER BY id')
+    assert scan['count'] == 1
+    slowest = backend.get_performance_stats()['slowest'][0]
+    assert slowest['sql'] == scan['sql'] and slowest['function'] == 'get_inventory' and slowest['plan']
+
+def test_partly_read_and_write_statements_are_recorded(instrumented):
+    backend.add_material('Steel', 5)
+    backend.add_material('Copper', 5)
+    with backend.connection() as conn:
+        conn.execute('SELECT id FROM materials ORDER BY id').fetchone()
+    assert statement('SELECT id FROM materials ORDER BY id')['count'] == 1
+    assert statement('INSERT INTO materials')['count'] == 2
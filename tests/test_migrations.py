@@ -0,0 +1,74 @@
+import sqlite3
+from datetime import date
+
+import backend
+
+# The schema inventory.db files had before versioning (user_version 0)
+LEGACY_SCHEMA = '''
+    CREATE TABLE materials (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL
+    );
+    CREATE TABLE bom (
+        product_id INTEGER NOT NULL,
+        material_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        FOREIGN KEY(product_id) REFERENCES products(id),
+        FOREIGN KEY(material_id) REFERENCES materials(id),
+        PRIMARY KEY(product_id, material_id)
+    );
+    CREATE TABLE orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        timestamp DATETIME NOT NULL,
+        FOREIGN KEY(product_id) REFERENCES products(id)
+    );
+    CREATE TABLE order_details (
+        order_id INTEGER NOT NULL,
+        material_id INTEGER NOT NULL,
+        quantity_used INTEGER NOT NULL,
+        FOREIGN KEY(order_id) REFERENCES orders(id),
+        FOREIGN KEY(material_id) REFERENCES materials(id),
+        PRIMARY KEY(order_id, material_id)
+    );
+    INSERT INTO materials (name, quantity) VALUES ('Çelik', 90), ('Bakır', 50);
+    INSERT INTO products (name) VALUES ('Çerçeve');
+    INSERT INTO bom VALUES (1, 1, 2);
+    INSERT INTO orders (product_id, quantity, timestamp) VALUES (1, 5, '2024-05-02 10:00:00');
+    INSERT INTO order_details VALUES (1, 1, 10);
+'''
+
+
+def test_legacy_database_upgrades_in_place(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    legacy = sqlite3.connect(path)
+    legacy.executescript(LEGACY_SCHEMA)
+    legacy.close()
+    try:
+        backend.configure(db_path=path)
+        assert backend.schema_version() == len(backend.MIGRATIONS)
+        assert backend.get_inventory() == [(1, 'Çelik', 90), (2, 'Bakır', 50)]
+        assert backend.count_materials() == 2 and backend.count_orders() == 1
+        assert backend.get_orders() == [(1, 'Çerçeve', 5, '2024-05-02 10:00:00', 1, 10)]
+        assert backend.get_consumption(1, periods=1, today=date(2024, 5, 2)) == [('2024-05-02', 10)]
+        assert backend.get_stock_at(1, date.today()) == 90  # opening movement
+        assert backend.search_materials('celik') == [(1, 'Çelik', 90)]
+
+        # The upgraded database works with the current code
+        assert backend.get_buildable_quantities() == {1: 45}
+        backend.update_bom(1, [(2, 5)])
+        assert backend.place_order(1, 2) == (True, 2)
+        assert backend.get_inventory() == [(1, 'Çelik', 90), (2, 'Bakır', 40)]
+        assert backend.get_buildable_quantities() == {1: 8}
+
+        # Running the migrations again changes nothing
+        backend.migrate()
+        assert backend.schema_version() == len(backend.MIGRATIONS)
+    finally:
+        backend.close_connections()
@@ -0,0 +1,101 @@
+import io
+import sqlite3
+import threading
+
+import backend
+
+
+def test_failing_call_only_fails_its_caller(db):
+    backend.add_material('Steel', 10)
+    backend.enable_write_queue(True)
+    results = {}
+
+    def call(name, func, *args):
+        try:
+            results[name] = func(*args)
+        except Exception as e:
+            results[name] = e
+
+    threads = [threading.Thread(target=call, args=('dup', backend.add_material, 'Steel', 1)),
+               threading.Thread(target=call, args=('ok', backend.add_material, 'Copper', 5))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert isinstance(results['dup'], ValueError)
+    assert results['ok'] is None
+    assert sorted(name for _, name, _ in backend.get_inventory()) == ['Copper', 'Steel']
+
+
+def test_locked_database_fails_every_queued_caller(db):
+    # Another connection holds the write lock past busy_timeout, so the
+    # writer's BEGIN IMMEDIATE fails; no caller may be left waiting
+    backend.add_material('Steel', 10)
+    backend.enable_write_queue(True)
+    blocker = sqlite3.connect(db, isolation_level=None)
+    blocker.execute('BEGIN IMMEDIATE')
+    results = {}
+
+    def call(index):
+        try:
+            results[index] = backend.update_material(1, 1)
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=call, args=(index,), daemon=True) for index in range(4)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert not any(thread.is_alive() for thread in threads)
+    finally:
+        blocker.rollback()
+        blocker.close()
+    assert len(results) == 4
+    assert all(isinstance(result, sqlite3.OperationalError) for result in results.values())
+
+    # The queue keeps working once the lock is released
+    assert backend.update_material(1, 5) == {}
+    assert backend.get_inventory() == [(1, 'Steel', 15)]
+
+
+class HookedCSV(io.StringIO):
+    # Calls hook() when line `at` (1 = header) is read
+    def __init__(self, text, at, hook):
+        super().__init__(text)
+        self.at, self.hook, self.lines = at, hook, 0
+
+    def __next__(self):
+        line = super().__next__()
+        self.lines += 1
+        if self.lines == self.at:
+            self.hook()
+        return line
+
+
+def test_import_commits_one_queued_write_per_batch(db):
+    backend.enable_write_queue(True)
+    seen = {}
+
+    def between_batches():
+        # The first batch is committed and other writes are not held up
+        other = threading.Thread(target=backend.add_material, args=('Other', 1), daemon=True)
+        other.start()
+        other.join(5)
+        seen['other_done'] = not other.is_alive()
+        reader = sqlite3.connect(db)
+        seen['committed'] = reader.execute("SELECT COUNT(*) FROM materials WHERE name LIKE 'M%'").fetchone()[0]
+        reader.close()
+
+    text = 'name,quantity\n' + ''.join(f'M{index},1\n' for index in range(6))
+    result = backend.import_materials(HookedCSV(text, 5, between_batches), 'csv', batch_size=3)
+    assert result['imported'] == 6
+    assert seen == {'other_done': True, 'committed': 3}
+    assert backend.count_materials() == 7
+
+    text = 'product,material,quantity\n' + ''.join(f'P{index % 4},M{index},2\n' for index in range(6))
+    result = backend.import_boms(HookedCSV(text, 5, lambda: None), 'csv', batch_size=3)
+    assert result['imported'] == 6
+    assert backend.count_products() == 4
+    assert len(backend.get_bom(1)) == 2